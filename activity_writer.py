@@ -0,0 +1,201 @@
+# activity_writer.py
+"""
+Background writer for users' lastActiveTimestamp.
+
+Logins call record_activity(uid), which only touches an in-process dict; a
+daemon thread coalesces repeated logins per user and flushes them to
+Firestore with a BulkWriter every ACTIVITY_FLUSH_INTERVAL_SECONDS, or sooner
+once ACTIVITY_FLUSH_BATCH_SIZE users are pending. Pending updates are flushed
+on shutdown (atexit, SIGTERM, ASGI lifespan).
+"""
+from google.cloud import firestore as firestore_client
+from firestore_registry import get_firestore_client
+from request_timing import timed
+from metrics import registry as metrics
+from config import Config
+from datetime import datetime, timezone
+import atexit
+import os
+import signal
+import threading
+import time
+import logging
+
+# Configure logging for activity writer
+logger = logging.getLogger(__name__)
+
+# BulkWriter attempts per document before an update is given up on
+MAX_WRITE_ATTEMPTS = 3
+# gRPC status for a document that no longer exists; retrying cannot help
+NOT_FOUND = 5
+
+metrics.describe("activity_flush_duration_seconds", "histogram", "Duration of lastActiveTimestamp batch flushes")
+metrics.describe("activity_updates_total", "counter", "lastActiveTimestamp updates by outcome")
+
+class ActivityWriter:
+    """Coalescing, batched lastActiveTimestamp writer; one background thread per process"""
+
+    def __init__(self, flush_interval, batch_size, max_pending):
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.max_pending = max_pending
+        self._reset()
+
+    def _reset(self):
+        self._pending = {}
+        self._cond = threading.Condition(threading.Lock())
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        self._pid = os.getpid()
+
+    def record(self, uid, timestamp=None):
+        """Queue a lastActiveTimestamp update; returns False if the buffer is full and it was dropped"""
+        if os.getpid() != self._pid:
+            # The flusher thread does not survive a fork
+            self._reset()
+
+        timestamp = timestamp or datetime.now(timezone.utc)
+        with self._cond:
+            if uid in self._pending:
+                metrics.inc("activity_updates_total", (("outcome", "coalesced"),))
+            elif len(self._pending) >= self.max_pending:
+                metrics.inc("activity_updates_total", (("outcome", "dropped"),))
+                return False
+            self._pending[uid] = timestamp
+
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(target=self._run, name="activity-writer", daemon=True)
+                self._thread.start()
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+        return True
+
+    def queue_depth(self):
+        return len(self._pending)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopping and len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                if self._stopping:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Activity flush failed: {e}")
+
+    def _take(self):
+        with self._cond:
+            pending = self._pending
+            self._pending = {}
+        return pending
+
+    def flush(self):
+        """Write every pending update now; returns the number of users written"""
+        with self._flush_lock:
+            pending = self._take()
+            if not pending:
+                return 0
+
+            start = time.perf_counter()
+            counts = {"written": 0, "failed": 0}
+            counts_lock = threading.Lock()
+            db = get_firestore_client()
+            writer = db.bulk_writer()
+
+            def on_result(reference, result, bulk_writer):
+                with counts_lock:
+                    counts["written"] += 1
+
+            def on_error(failure, bulk_writer):
+                if failure.attempts < MAX_WRITE_ATTEMPTS and failure.code != NOT_FOUND:
+                    return True
+                with counts_lock:
+                    counts["failed"] += 1
+                logger.warning(f"lastActiveTimestamp update failed for uid: {failure.operation.reference.id} - {failure.message}")
+                return False
+
+            writer.on_write_result(on_result)
+            writer.on_write_error(on_error)
+
+            users_ref = db.collection("users")
+            for uid, timestamp in pending.items():
+                # update() rather than set(): never recreate a profile deleted since login
+                writer.update(users_ref.document(uid), {"lastActiveTimestamp": timestamp})
+            writer.close()
+
+            duration = time.perf_counter() - start
+            metrics.observe("activity_flush_duration_seconds", duration)
+            metrics.inc("activity_updates_total", (("outcome", "written"),), counts["written"])
+            if counts["failed"]:
+                metrics.inc("activity_updates_total", (("outcome", "failed"),), counts["failed"])
+
+            logger.info(f"Flushed lastActiveTimestamp for {counts['written']} users in {duration * 1000:.1f}ms (failed: {counts['failed']})")
+            return counts["written"]
+
+    def shutdown(self, timeout=10.0):
+        """Stop the flusher thread and write whatever is still pending"""
+        if os.getpid() != self._pid:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Final activity flush failed: {e}")
+
+activity_writer = ActivityWriter(
+    Config.ACTIVITY_FLUSH_INTERVAL_SECONDS,
+    Config.ACTIVITY_FLUSH_BATCH_SIZE,
+    Config.ACTIVITY_MAX_PENDING
+)
+
+def record_activity(uid):
+    """Record a login for uid, buffered or written inline depending on ACTIVITY_WRITER_ENABLED"""
+    if Config.ACTIVITY_WRITER_ENABLED:
+        activity_writer.record(uid)
+        return
+    with timed("firestore_update"):
+        get_firestore_client().collection("users").document(uid).update({
+            "lastActiveTimestamp": firestore_client.SERVER_TIMESTAMP
+        })
+
+def _activity_stats_collector():
+    return [
+        ("activity_queue_depth", "gauge", "Users with a pending lastActiveTimestamp update", [((), activity_writer.queue_depth())]),
+    ]
+
+metrics.register_collector(_activity_stats_collector)
+
+_previous_sigterm = None
+
+def _handle_sigterm(signum, frame):
+    activity_writer.shutdown()
+    previous = _previous_sigterm
+    if callable(previous):
+        previous(signum, frame)
+    elif previous != signal.SIG_IGN:
+        # Restore the default action and re-deliver so the process still exits
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+def install_shutdown_hooks():
+    """Flush pending updates at interpreter exit and on SIGTERM (chained to any existing handler)"""
+    global _previous_sigterm
+    atexit.register(activity_writer.shutdown)
+    if threading.current_thread() is not threading.main_thread():
+        return
+    try:
+        previous = signal.getsignal(signal.SIGTERM)
+        if previous is _handle_sigterm:
+            return
+        _previous_sigterm = previous
+        signal.signal(signal.SIGTERM, _handle_sigterm)
+    except (ValueError, OSError) as e:
+        logger.warning(f"Could not install SIGTERM handler for activity writer: {e}")
@@ -1,20 +1,27 @@
-from flask import Flask, request, jsonify
-from firebase_admin import credentials, initialize_app, storage, firestore
-from google.cloud.firestore_v1 import Increment 
-from auth_simple import authenticate_user, register_user, get_user_profile, update_user_profile, validate_app_id
-from firebase_init import initialize_firebase
-from logging_config import setup_logging, log_environment_info, log_request_context, log_performance_metrics, log_security_event
+import time
+# Measured from here so the startup log covers the whole import of this module
+_import_started = time.perf_counter()
+from flask import Flask, Response, request, jsonify, stream_with_context
+from werkzeug.middleware.proxy_fix import ProxyFix
+from auth_simple import authenticate_user, register_user, get_user_profile, get_user_profiles, update_user_profile, validate_app_id
+from firebase_init import start_firebase
+from tokens import peek_user_id
+from config import Config
+from logging_config import setup_logging, log_environment_info, log_request_context, log_performance_metrics, log_security_event, get_logging_stats
+from metrics import registry as metrics
+from request_timing import start_request_timing, end_request_timing, get_request_timings, server_timing_header
+import tracing
+from activity_writer import install_shutdown_hooks
+from login_throttle import LoginThrottled
+from auth_utils import AuthServiceUnavailable
+from rate_limits import tenant_limiter, RateLimited
+from service_auth import authenticate_service, ServiceAuthError, HEADER as SERVICE_KEY_HEADER
 import os
 import logging
-import time
 import json
-from pathlib import Path
-from dotenv import load_dotenv
 from datetime import datetime, timezone
 from functools import wraps
-# Load environment variables first
-load_dotenv()
-load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / '.env.production')
+# Environment variables are loaded from .env files by config.py
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -28,72 +35,70 @@ logger = logging.getLogger(__name__)
 # Time configuration
 WORK_HOURS_START = 9  # 9 AM
 WORK_HOURS_END = 18   # 6 PM
-TIMEZONE = pytz.timezone("America/Los_Angeles")
 
 # Environment variables
 # Firebase setup
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-CRED_PATH = os.path.join(BASE_DIR, './rrkt-firebase-adminsdk.json')
 PROJECT_ID = os.getenv("FIREBASE_PROJECT_ID")
 FIREBASE_PROJECT_ID = PROJECT_ID
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 FIREBASE_STORAGE_BUCKET = os.getenv("FIREBASE_STORAGE_BUCKET")  
-FIREBASE_PROJECT_ID = os.getenv('FIREBASE_PROJECT_ID') 
-
-def initialize_firebase():
-    """Initialize Firebase with credentials if not already initialized"""
-    try:
-        # Try to get an existing app
-        storage.bucket()
-        return storage, firestore.client()
-    except ValueError:
-        # Initialize new app if none exists
-        cred = credentials.Certificate(CRED_PATH)
-        initialize_app(cred, {
-            'storageBucket': 'readrocket-a9268.firebasestorage.app'
-        })
-        return storage, firestore.client()
-
-# Initialize Firebase
-try:
-    cred = credentials.Certificate(CRED_PATH)
-    initialize_app(cred, {
-        'storageBucket': FIREBASE_STORAGE_BUCKET,
-        'projectId': PROJECT_ID 
-    })
-    storage_client = storage.Client()
-    firestore_client = firestore.Client()
-except Exception as e:
-    logger.error(f"Firebase initialization error: {e}")
-
- 
-
 
 # Set up comprehensive logging
 logger = setup_logging("user-service")
 log_environment_info()
 
 app = Flask(__name__)
+if Config.TRUSTED_PROXY_HOPS > 0:
+    # request.remote_addr becomes the client address appended by the proxy, not the proxy's own
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=Config.TRUSTED_PROXY_HOPS)
+tracing.configure_tracing()
+# Flush buffered lastActiveTimestamp writes when Cloud Run sends SIGTERM
+install_shutdown_hooks()
+
+def _service_stats_collector():
+    """Expose profile cache and logging pipeline counters alongside request metrics"""
+    from profile_cache import profile_cache
+    cache = profile_cache.stats()
+    logging_stats = get_logging_stats()
+    return [
+        ("profile_cache_lookups_total", "counter", "Profile cache lookups by result",
+            [((("result", "hit"),), cache["hits"]), ((("result", "negative_hit"),), cache["negative_hits"]), ((("result", "miss"),), cache["misses"])]),
+        ("profile_cache_evictions_total", "counter", "Profile cache LRU evictions", [((), cache["evictions"])]),
+        ("profile_cache_entries", "gauge", "Profile cache size", [((), cache["size"])]),
+        ("profile_cache_stale_sets_total", "counter", "Profile reads not cached because the user was written meanwhile", [((), cache["stale_sets"])]),
+        ("log_records_dropped_total", "counter", "Log records dropped by a full queue", [((), logging_stats.get("dropped", 0))]),
+        ("log_records_suppressed_total", "counter", "Log records removed by sampling",
+            [((("logger", name),), count) for name, count in logging_stats.get("suppressed", {}).items()]),
+    ]
+
+metrics.register_collector(_service_stats_collector)
 
 # Middleware for request/response logging
 @app.before_request
 def log_request_info():
     # Store request start time for performance monitoring
     request.start_time = time.time()
+    request.perf_start = time.perf_counter()
+    start_request_timing()
+    request.trace_span = tracing.start_request_span(
+        f"{request.method} {request.url_rule.rule if request.url_rule else request.path}",
+        request.headers.get("traceparent"),
+        {"http.method": request.method, "http.target": request.path, "http.route": request.endpoint}
+    )
+    
+    # Endpoint name rather than path keeps metric label cardinality bounded
+    request.metrics_labels = (("endpoint", request.endpoint or "unmatched"), ("method", request.method))
+    metrics.inc("http_requests_in_flight", request.metrics_labels)
     
     # Log request context
     app_id = request.headers.get("X-App-ID") or request.args.get("app_id")
     auth_header = request.headers.get("Authorization")
     user_id = None
     
-    # Try to extract user_id from token for context (simplified extraction)
+    # Extract user_id from token for context (verification result is cached for the handler)
     if auth_header and auth_header.startswith("Bearer "):
-        token = auth_header.split(" ")[1]
-        if "user_" in token:
-            try:
-                user_id = token.split("_")[1]
-            except:
-                pass
+        user_id = peek_user_id(auth_header.split(" ")[1])
     
     # Log request with context
     log_request_context(request, user_id, app_id)
@@ -111,11 +116,43 @@ def log_request_info():
         except Exception as e:
             logger.warning(f"Could not parse request payload: {e}")
 
+def _tenant_app_id():
+    """app_id the request is billed to: header, query, path or JSON body; "unknown" if not allowed"""
+    app_id = request.headers.get("X-App-ID") or request.args.get("app_id") or (request.view_args or {}).get("app_id")
+    if not app_id and request.is_json:
+        payload = request.get_json(silent=True)
+        if isinstance(payload, dict):
+            app_id = payload.get("app_id")
+    # Bounded label set: anything outside the allow-list shares one bucket
+    return app_id if Config.is_allowed_app_id(app_id) else "unknown"
+
+@app.before_request
+def enforce_tenant_limits():
+    request.tenant_slot = None
+    if not tenant_limiter.enabled or request.endpoint in Config.RATE_LIMIT_EXEMPT_ENDPOINTS:
+        return None
+    
+    app_id = _tenant_app_id()
+    try:
+        request.tenant_slot = tenant_limiter.acquire(app_id, request.endpoint or "unmatched")
+    except RateLimited as e:
+        logger.warning(f"Tenant {e.limit} limit hit for app_id: {app_id}, endpoint: {request.endpoint} - retry after {e.retry_after:.2f}s")
+        response = jsonify({"error": str(e), "limit": e.limit})
+        response.headers["Retry-After"] = e.retry_after_header()
+        return response, 429
+    return None
+
 @app.after_request
 def log_response_info(response):
     # Calculate request duration
     duration_ms = (time.time() - getattr(request, 'start_time', time.time())) * 1000
     
+    # Feed the in-process metrics registry (/metrics)
+    labels = getattr(request, 'metrics_labels', None)
+    if labels is not None:
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - request.perf_start, labels)
+        metrics.inc("http_requests_total", labels + (("status", response.status_code),))
+    
     # Log performance metrics
     operation_name = f"{request.method} {request.endpoint or request.path}"
     success = response.status_code < 400
@@ -126,6 +163,18 @@ def log_response_info(response):
         'path': request.path
     }
     
+    # Outbound dependency spans (Firestore, Firebase Auth, identitytoolkit)
+    timings = get_request_timings()
+    if timings:
+        response.headers['Server-Timing'] = server_timing_header(timings)
+        additional_data['dependencies'] = {name: {'duration_ms': span_ms, 'calls': count} for name, (span_ms, count) in timings.items()}
+    
+    span = getattr(request, 'trace_span', None)
+    if span is not None:
+        span.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.set_status(tracing.STATUS_ERROR)
+    
     log_performance_metrics(operation_name, duration_ms, success, additional_data)
     
     # Log response payload for errors or debug mode
@@ -139,6 +188,19 @@ def log_response_info(response):
     
     return response
 
+@app.teardown_request
+def release_in_flight(exc):
+    labels = getattr(request, 'metrics_labels', None)
+    if labels is not None:
+        metrics.dec("http_requests_in_flight", labels)
+    tenant_limiter.release(getattr(request, 'tenant_slot', None))
+    end_request_timing()
+    span = getattr(request, 'trace_span', None)
+    if span is not None:
+        if exc is not None:
+            span.record_exception(exc)
+        span.end()
+
 def log_operation(operation_name):
     """Decorator to log function operations with timing"""
     def decorator(func):
@@ -150,22 +212,36 @@ def log_operation(operation_name):
             logger.info(f"Starting operation: {operation_name} [ID: {operation_id}]")
             
             try:
-                result = func(*args, **kwargs)
+                with tracing.start_span(operation_name):
+                    result = func(*args, **kwargs)
                 duration = time.time() - start_time
+                metrics.observe("operation_duration_seconds", duration, (("operation", operation_name), ("outcome", "success")))
                 logger.info(f"Completed operation: {operation_name} [ID: {operation_id}] in {duration:.3f}s")
                 return result
             except Exception as e:
                 duration = time.time() - start_time
+                metrics.observe("operation_duration_seconds", duration, (("operation", operation_name), ("outcome", "error")))
                 logger.error(f"Failed operation: {operation_name} [ID: {operation_id}] after {duration:.3f}s - Error: {str(e)}")
                 raise
                 
         return wrapper
     return decorator
 
-# Initialize Firebase Admin SDK
+def require_service_auth(func):
+    """Decorator for service-to-service and admin routes: requires a valid X-Service-Key"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            request.service_caller = authenticate_service(request.headers.get(SERVICE_KEY_HEADER))
+        except ServiceAuthError as e:
+            log_security_event("service_auth_failed", None, None, {"endpoint": request.endpoint, "reason": str(e), "remote_addr": request.remote_addr}, "WARNING")
+            return jsonify({"error": str(e)}), 401
+        return func(*args, **kwargs)
+    return wrapper
+
+# Firebase Admin SDK is initialized once, on first use (or per FIREBASE_INIT_MODE)
 try:
-    storage, firestore_client = initialize_firebase()
-    logger.info("Firebase initialized successfully")
+    start_firebase()
 except Exception as e:
     logger.error(f"Failed to initialize Firebase: {e}")
     # Continue without Firebase for now, will fail on first Firebase operation
@@ -176,6 +252,11 @@ def health_check():
     logger.info("Health check requested")
     return jsonify({"status": "healthy", "service": "userservice"}), 200
 
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus text-format export of the in-process metrics registry"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/debug/info", methods=["GET"])
 def system_info():
     """Debug endpoint to get system information"""
@@ -242,7 +323,7 @@ def login():
             return jsonify({"error": "app_id is required"}), 400
         
         validate_app_id(app_id)
-        user = authenticate_user(email, password, app_id)
+        user = authenticate_user(email, password, app_id, client_ip=request.remote_addr)
         
         # Log successful login
         log_security_event(
@@ -259,9 +340,29 @@ def login():
         logger.info(f"Login successful for user: {user['uid']}, app_id: {app_id}")
         return jsonify({
             "token": user["idToken"], 
+            "expires_in": user["expiresIn"],
             "user_id": user["uid"],
             "app_id": user["app_id"]
         }), 200
+    except LoginThrottled as e:
+        log_security_event(
+            "login_throttled",
+            email,
+            app_id,
+            {
+                "scope": e.scope,
+                "retry_after": e.retry_after_header(),
+                "ip": request.remote_addr
+            },
+            "WARNING"
+        )
+        response = jsonify({"error": str(e)})
+        response.headers["Retry-After"] = e.retry_after_header()
+        return response, 429
+    except AuthServiceUnavailable as e:
+        # identitytoolkit is down; not the caller's fault, and not counted against them
+        logger.error(f"Login unavailable for email: {email}, app_id: {app_id} - Error: {str(e)}")
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         # Log failed login
         log_security_event(
@@ -339,9 +440,10 @@ def profile(user_id):
         logger.error(f"Profile retrieval failed for user_id: {user_id}, app_id: {app_id if 'app_id' in locals() else 'unknown'} - Error: {str(e)}")
         return jsonify({"error": str(e)}), 401
 
-@app.route("/user/profile/<user_id>", methods=["PUT"])
+@app.route("/user/profile/<user_id>", methods=["PUT", "PATCH"])
 @log_operation("update_user_profile")
 def update_profile(user_id):
+    """PUT replaces preferences; PATCH merges top-level keys (null deletes a key)"""
     try:
         auth_header = request.headers.get("Authorization")
         app_id = request.headers.get("X-App-ID") or request.args.get("app_id")
@@ -360,7 +462,7 @@ def update_profile(user_id):
         
         token = auth_header.split(" ")[1]
         validate_app_id(app_id)
-        update_user_profile(user_id, token, preferences, app_id)
+        update_user_profile(user_id, token, preferences, app_id, merge=request.method == "PATCH")
         
         logger.info(f"Profile updated successfully for user_id: {user_id}, app_id: {app_id}")
         return jsonify({"message": "Profile updated successfully"}), 200
@@ -368,28 +470,111 @@ def update_profile(user_id):
         logger.error(f"Profile update failed for user_id: {user_id}, app_id: {app_id if 'app_id' in locals() else 'unknown'} - Error: {str(e)}")
         return jsonify({"error": str(e)}), 400
 
+@app.route("/user/profiles:batchGet", methods=["POST"])
+@require_service_auth
+@log_operation("batch_get_user_profiles")
+def batch_get_profiles():
+    """Internal: fetch many profiles of one app in a single Firestore round-trip (service key required)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        user_ids = data.get("user_ids")
+        app_id = data.get("app_id") or request.headers.get("X-App-ID")
+        
+        logger.info(f"Batch profile request for {len(user_ids) if isinstance(user_ids, list) else 0} users, app_id: {app_id}")
+        
+        if not app_id:
+            logger.warning("Batch profile request failed: app_id is required")
+            return jsonify({"error": "app_id is required"}), 400
+        
+        if not isinstance(user_ids, list) or not user_ids:
+            logger.warning("Batch profile request failed: user_ids must be a non-empty list")
+            return jsonify({"error": "user_ids must be a non-empty list"}), 400
+        
+        validate_app_id(app_id)
+        result = get_user_profiles(user_ids, app_id)
+        
+        return jsonify({
+            "app_id": app_id,
+            "found": result["found"],
+            "missing": result["missing"]
+        }), 200
+    except Exception as e:
+        logger.error(f"Batch profile retrieval failed for app_id: {app_id if 'app_id' in locals() else 'unknown'} - Error: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+
 @app.route("/admin/users/<app_id>", methods=["GET"])
+@require_service_auth
 @log_operation("get_app_users")
 def get_app_users(app_id):
-    """Admin endpoint to get all users for a specific app"""
+    """Admin endpoint to page through (or stream) all users for a specific app (service key required)"""
     try:
-        logger.info(f"Admin request to get users for app_id: {app_id}")
+        page_size = min(int(request.args.get("page_size", Config.ADMIN_USERS_PAGE_SIZE)), Config.ADMIN_USERS_MAX_PAGE_SIZE)
+        page_token = request.args.get("page_token")
+        fields = request.args.get("fields")
+        fields = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+        stream = request.args.get("format") == "ndjson"
+        
+        logger.info(f"Admin request to get users for app_id: {app_id}, page_size: {page_size}, stream: {stream}")
+        
+        if page_size < 1:
+            return jsonify({"error": "page_size must be positive"}), 400
         
-        # You might want to add admin authentication here
         validate_app_id(app_id)
-        from auth_simple import get_users_by_app
-        users = get_users_by_app(app_id)
+        from auth_simple import get_users_page, iter_users_by_app
+        
+        if stream:
+            # One JSON document per line, written as Firestore yields them
+            users = iter_users_by_app(app_id, fields=fields, batch_size=page_size, page_token=page_token)
+            lines = (app.json.dumps(user) + "\n" for user in users)
+            return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+        
+        users, next_page_token = get_users_page(app_id, page_size, page_token, fields)
         
         logger.info(f"Retrieved {len(users)} users for app_id: {app_id}")
         return jsonify({
             "app_id": app_id,
             "users": users,
-            "count": len(users)
+            "count": len(users),
+            "next_page_token": next_page_token
         }), 200
     except Exception as e:
         logger.error(f"Failed to get users for app_id: {app_id} - Error: {str(e)}")
         return jsonify({"error": str(e)}), 400
 
+@app.route("/admin/users/<app_id>/import", methods=["POST"])
+@require_service_auth
+@log_operation("import_app_users")
+def import_app_users(app_id):
+    """Admin endpoint to bulk import users for a specific app (service key required; uids are assigned here)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        users = data.get("users")
+        
+        logger.info(f"Admin request to import {len(users) if isinstance(users, list) else 0} users for app_id: {app_id}")
+        
+        if not isinstance(users, list) or not users:
+            return jsonify({"error": "users must be a non-empty list"}), 400
+        
+        if len(users) > Config.BULK_IMPORT_MAX_RECORDS_PER_REQUEST:
+            return jsonify({"error": f"Too many users: {len(users)} (max {Config.BULK_IMPORT_MAX_RECORDS_PER_REQUEST}); use bulk_import.py for larger imports"}), 400
+        
+        validate_app_id(app_id)
+        from bulk_import import import_users
+        stats = import_users(users, app_id)
+        
+        logger.info(f"Imported {stats['imported']} users for app_id: {app_id}, failed: {stats['failed']}")
+        return jsonify(stats), 200
+    except Exception as e:
+        logger.error(f"Failed to import users for app_id: {app_id} - Error: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/admin/cache/stats", methods=["GET"])
+@require_service_auth
+def cache_stats():
+    """Admin endpoint exposing profile cache counters for sizing (service key required)"""
+    from profile_cache import profile_cache
+    return jsonify({"profile_cache": profile_cache.stats()}), 200
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -406,6 +591,11 @@ def handle_exception(e):
     logger.error(f"Unhandled exception: {str(e)}", exc_info=True)
     return jsonify({"error": "An unexpected error occurred"}), 500
 
+STARTUP_SECONDS = time.perf_counter() - _import_started
+metrics.describe("process_startup_seconds", "gauge", "Time taken to import and configure the application module")
+metrics.inc("process_startup_seconds", amount=STARTUP_SECONDS)
+logger.info(f"Application module ready in {STARTUP_SECONDS * 1000:.1f}ms")
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8080))
     logger.info(f"Starting Flask application on port {port}")
@@ -0,0 +1,512 @@
+# asgi_app.py
+"""
+ASGI entry point serving the same routes as app.py on an async stack.
+
+Run with: uvicorn asgi_app:app --host 0.0.0.0 --port 8080
+"""
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from functools import wraps
+from starlette.applications import Starlette
+from starlette.datastructures import QueryParams
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Match, Route
+from werkzeug.http import http_date
+from auth_async import authenticate_user, register_user, get_user_profile, update_user_profile, get_users_page, iter_users_by_app
+from auth_simple import validate_app_id, get_user_profiles
+from auth_utils import close_async_http_client, AuthServiceUnavailable
+from firebase_init import start_firebase
+from firestore_registry import close_async_firestore_clients
+from logging_config import setup_logging, log_environment_info, log_request_context, log_performance_metrics, log_security_event
+from tokens import peek_user_id
+from metrics import registry as metrics
+from request_timing import start_request_timing, end_request_timing, get_request_timings, server_timing_header
+import tracing
+from activity_writer import activity_writer
+from login_throttle import LoginThrottled
+from rate_limits import tenant_limiter, RateLimited, InMemoryRateLimitBackend
+from service_auth import authenticate_service, ServiceAuthError, HEADER as SERVICE_KEY_HEADER
+import asyncio
+from config import Config
+from collections import namedtuple
+import json
+import os
+import time
+
+logger = setup_logging("user-service")
+log_environment_info()
+tracing.configure_tracing()
+
+try:
+    start_firebase()
+except Exception as e:
+    logger.error(f"Failed to initialize Firebase: {e}")
+    # Continue without Firebase for now, will fail on first Firebase operation
+
+def _json_default(value):
+    # Match Flask's jsonify rendering of Firestore timestamps
+    if isinstance(value, (datetime, date)):
+        return http_date(value)
+    return str(value)
+
+class ServiceJSONResponse(JSONResponse):
+    def render(self, content):
+        return json.dumps(content, default=_json_default, separators=(",", ":")).encode("utf-8")
+
+# Minimal view of a Starlette request in the shape log_request_context expects
+_RequestInfo = namedtuple("_RequestInfo", ["method", "path", "remote_addr", "user_agent"])
+
+def _client_addr(scope):
+    """
+    Client address as app.py's ProxyFix(x_for=TRUSTED_PROXY_HOPS) computes it: the
+    X-Forwarded-For entry appended by the outermost trusted proxy, else the peer address
+    """
+    client = scope.get("client")
+    peer = client[0] if client else None
+    hops = Config.TRUSTED_PROXY_HOPS
+    if hops > 0:
+        forwarded = ",".join(v.decode("latin-1") for k, v in scope.get("headers", []) if k.lower() == b"x-forwarded-for")
+        values = forwarded.split(",") if forwarded else []
+        if len(values) >= hops:
+            return values[-hops].strip()
+    return peer
+
+def _remote_addr(request):
+    return _client_addr(request.scope)
+
+def _app_id_from(request):
+    return request.headers.get("X-App-ID") or request.query_params.get("app_id")
+
+async def _json_body(request):
+    try:
+        return await request.json()
+    except Exception:
+        return None
+
+class RequestLoggingMiddleware:
+    """ASGI counterpart of the before_request/after_request hooks in app.py"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.time()
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        auth_header = headers.get("authorization")
+        user_id = None
+        if auth_header and auth_header.startswith("Bearer "):
+            user_id = peek_user_id(auth_header.split(" ")[1])
+
+        info = _RequestInfo(scope["method"], scope["path"], _client_addr(scope), headers.get("user-agent", ""))
+        log_request_context(info, user_id, headers.get("x-app-id"))
+
+        status = {"code": 500, "length": None}
+        perf_start = time.perf_counter()
+        # The route is only known after routing, so in-flight requests are counted per method
+        in_flight_labels = (("method", scope["method"]),)
+        metrics.inc("http_requests_in_flight", in_flight_labels)
+        timing_token = start_request_timing()
+        span = tracing.start_request_span(
+            f"{scope['method']} {scope['path']}",
+            headers.get("traceparent"),
+            {"http.method": scope["method"], "http.target": scope["path"]}
+        )
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                for key, value in message.get("headers", []):
+                    if key.lower() == b"content-length":
+                        status["length"] = int(value)
+                timings = get_request_timings()
+                if timings:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", server_timing_header(timings).encode("latin-1"))
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.dec("http_requests_in_flight", in_flight_labels)
+            timings = get_request_timings()
+            end_request_timing(timing_token)
+            route = scope.get("route")
+            if route is not None:
+                span.update_name(f"{scope['method']} {route.path}")
+            span.set_attribute("http.status_code", status["code"])
+            if status["code"] >= 500:
+                span.set_status(tracing.STATUS_ERROR)
+            span.end()
+            labels = (("endpoint", getattr(route, "name", None) or "unmatched"), ("method", scope["method"]))
+            metrics.observe("http_request_duration_seconds", time.perf_counter() - perf_start, labels)
+            metrics.inc("http_requests_total", labels + (("status", status["code"]),))
+
+            duration_ms = (time.time() - start_time) * 1000
+            log_performance_metrics(
+                f"{scope['method']} {scope['path']}",
+                duration_ms,
+                status["code"] < 400,
+                {
+                    'status_code': status["code"],
+                    'content_length': status["length"],
+                    'path': scope["path"],
+                    'dependencies': {name: {'duration_ms': span_ms, 'calls': count} for name, (span_ms, count) in timings.items()}
+                }
+            )
+
+def _match_route(scope):
+    """The route a request will be dispatched to and its path params (Flask's request.endpoint / view_args)"""
+    for route in routes:
+        match, child_scope = route.matches(scope)
+        if match == Match.FULL:
+            return route, child_scope.get("path_params", {})
+    return None, {}
+
+async def _buffer_body(receive):
+    """Read the whole request body, returning it with a receive() that replays it to the app"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    body = b"".join(chunks)
+    replayed = False
+
+    async def replay():
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return body, replay
+
+async def _tenant_app_id(scope, headers, path_params, receive):
+    """app_id the request is billed to, as app.py's _tenant_app_id resolves it; also returns the receive() to use"""
+    query = QueryParams(scope.get("query_string", b""))
+    app_id = headers.get("x-app-id") or query.get("app_id") or path_params.get("app_id")
+    if not app_id and headers.get("content-type", "").split(";")[0].strip() == "application/json":
+        body, receive = await _buffer_body(receive)
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = None
+        if isinstance(payload, dict):
+            app_id = payload.get("app_id")
+    # Bounded label set: anything outside the allow-list shares one bucket
+    return (app_id if Config.is_allowed_app_id(app_id) else "unknown"), receive
+
+class TenantLimitMiddleware:
+    """ASGI counterpart of app.py's enforce_tenant_limits before_request hook"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tenant_limiter.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        route, path_params = _match_route(scope)
+        endpoint = route.name if route is not None else "unmatched"
+        if endpoint in Config.RATE_LIMIT_EXEMPT_ENDPOINTS:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        app_id, receive = await _tenant_app_id(scope, headers, path_params, receive)
+        try:
+            if isinstance(tenant_limiter.backend, InMemoryRateLimitBackend):
+                slot = tenant_limiter.acquire(app_id, endpoint)
+            else:
+                # A shared backend (e.g. Redis) is a blocking network call
+                slot = await asyncio.to_thread(tenant_limiter.acquire, app_id, endpoint)
+        except RateLimited as e:
+            logger.warning(f"Tenant {e.limit} limit hit for app_id: {app_id}, endpoint: {endpoint} - retry after {e.retry_after:.2f}s")
+            scope["route"] = route  # Label the 429 with its endpoint on /metrics, as the router would
+            response = ServiceJSONResponse({"error": str(e), "limit": e.limit}, status_code=429, headers={"Retry-After": e.retry_after_header()})
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            tenant_limiter.release(slot)
+
+def require_service_auth(handler):
+    """Decorator for service-to-service and admin routes: requires a valid X-Service-Key"""
+    @wraps(handler)
+    async def wrapper(request):
+        try:
+            request.state.service_caller = authenticate_service(request.headers.get(SERVICE_KEY_HEADER))
+        except ServiceAuthError as e:
+            log_security_event("service_auth_failed", None, None, {"endpoint": handler.__name__, "reason": str(e), "remote_addr": _remote_addr(request)}, "WARNING")
+            return ServiceJSONResponse({"error": str(e)}, status_code=401)
+        return await handler(request)
+    return wrapper
+
+async def health_check(request):
+    return ServiceJSONResponse({"status": "healthy", "service": "userservice"}, status_code=200)
+
+async def metrics_endpoint(request):
+    """Prometheus text-format export of the in-process metrics registry"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+async def login(request):
+    data = await _json_body(request) or {}
+    email = data.get("email")
+    password = data.get("password")
+    app_id = data.get("app_id")
+
+    try:
+        log_security_event(
+            "login_attempt",
+            email,
+            app_id,
+            {
+                "ip": _remote_addr(request),
+                "user_agent": request.headers.get("user-agent", "")[:100]
+            },
+            "INFO"
+        )
+
+        if not app_id:
+            log_security_event("login_failed", email, app_id, {"reason": "missing_app_id"}, "WARNING")
+            return ServiceJSONResponse({"error": "app_id is required"}, status_code=400)
+
+        validate_app_id(app_id)
+        user = await authenticate_user(email, password, app_id, client_ip=_remote_addr(request))
+
+        log_security_event("login_success", user['uid'], app_id, {"ip": _remote_addr(request), "email": email}, "INFO")
+        return ServiceJSONResponse({
+            "token": user["idToken"],
+            "expires_in": user["expiresIn"],
+            "user_id": user["uid"],
+            "app_id": user["app_id"]
+        }, status_code=200)
+    except LoginThrottled as e:
+        log_security_event("login_throttled", email, app_id, {"scope": e.scope, "retry_after": e.retry_after_header(), "ip": _remote_addr(request)}, "WARNING")
+        return ServiceJSONResponse({"error": str(e)}, status_code=429, headers={"Retry-After": e.retry_after_header()})
+    except AuthServiceUnavailable as e:
+        logger.error(f"Login unavailable for email: {email}, app_id: {app_id} - Error: {str(e)}")
+        return ServiceJSONResponse({"error": str(e)}, status_code=503)
+    except Exception as e:
+        log_security_event("login_failed", email, app_id, {"reason": str(e), "ip": _remote_addr(request)}, "WARNING")
+        logger.error(f"Login failed for email: {email}, app_id: {app_id} - Error: {str(e)}")
+        return ServiceJSONResponse({"error": str(e)}, status_code=400)
+
+async def register(request):
+    data = await _json_body(request) or {}
+    email = data.get("email")
+    app_id = data.get("app_id")
+
+    try:
+        if not app_id:
+            return ServiceJSONResponse({"error": "app_id is required"}, status_code=400)
+
+        validate_app_id(app_id)
+        user = await register_user(
+            email,
+            data.get("password"),
+            app_id,
+            data.get("firstName"),
+            data.get("lastName"),
+            data.get("userName"),
+            data.get("avatar")
+        )
+
+        return ServiceJSONResponse({
+            "user_id": user["uid"],
+            "app_id": user["app_id"],
+            "message": "User registered successfully with complete profile"
+        }, status_code=201)
+    except Exception as e:
+        logger.error(f"Registration failed for email: {email}, app_id: {app_id} - Error: {str(e)}")
+        return ServiceJSONResponse({"error": str(e)}, status_code=400)
+
+async def profile(request):
+    user_id = request.path_params["user_id"]
+    auth_header = request.headers.get("Authorization")
+    app_id = _app_id_from(request)
+
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return ServiceJSONResponse({"error": "Missing or invalid token"}, status_code=401)
+
+    if not app_id:
+        return ServiceJSONResponse({"error": "app_id is required"}, status_code=400)
+
+    token = auth_header.split(" ")[1]
+
+    try:
+        validate_app_id(app_id)
+        user_profile = await get_user_profile(user_id, token, app_id)
+        return ServiceJSONResponse(user_profile, status_code=200)
+    except Exception as e:
+        logger.error(f"Profile retrieval failed for user_id: {user_id}, app_id: {app_id} - Error: {str(e)}")
+        return ServiceJSONResponse({"error": str(e)}, status_code=401)
+
+async def update_profile(request):
+    user_id = request.path_params["user_id"]
+    auth_header = request.headers.get("Authorization")
+    app_id = _app_id_from(request)
+
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return ServiceJSONResponse({"error": "Missing or invalid token"}, status_code=401)
+
+    if not app_id:
+        return ServiceJSONResponse({"error": "app_id is required"}, status_code=400)
+
+    token = auth_header.split(" ")[1]
+
+    try:
+        data = await _json_body(request)
+        preferences = data.get("preferences", {}) if data else {}
+        validate_app_id(app_id)
+        await update_user_profile(user_id, token, preferences, app_id, merge=request.method == "PATCH")
+        return ServiceJSONResponse({"message": "Profile updated successfully"}, status_code=200)
+    except Exception as e:
+        logger.error(f"Profile update failed for user_id: {user_id}, app_id: {app_id} - Error: {str(e)}")
+        return ServiceJSONResponse({"error": str(e)}, status_code=400)
+
+@require_service_auth
+async def batch_get_profiles(request):
+    """Internal: fetch many profiles of one app in a single Firestore round-trip (service key required)"""
+    data = await _json_body(request) or {}
+    user_ids = data.get("user_ids")
+    app_id = data.get("app_id") or request.headers.get("X-App-ID")
+
+    try:
+        if not app_id:
+            return ServiceJSONResponse({"error": "app_id is required"}, status_code=400)
+
+        if not isinstance(user_ids, list) or not user_ids:
+            return ServiceJSONResponse({"error": "user_ids must be a non-empty list"}, status_code=400)
+
+        validate_app_id(app_id)
+        result = await asyncio.to_thread(get_user_profiles, user_ids, app_id)
+        return ServiceJSONResponse({
+            "app_id": app_id,
+            "found": result["found"],
+            "missing": result["missing"]
+        }, status_code=200)
+    except Exception as e:
+        logger.error(f"Batch profile retrieval failed for app_id: {app_id} - Error: {str(e)}")
+        return ServiceJSONResponse({"error": str(e)}, status_code=400)
+
+@require_service_auth
+async def get_app_users(request):
+    """Admin endpoint to page through (or stream) all users for a specific app (service key required)"""
+    app_id = request.path_params["app_id"]
+    try:
+        page_size = min(int(request.query_params.get("page_size", Config.ADMIN_USERS_PAGE_SIZE)), Config.ADMIN_USERS_MAX_PAGE_SIZE)
+        page_token = request.query_params.get("page_token")
+        fields = request.query_params.get("fields")
+        fields = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+
+        if page_size < 1:
+            return ServiceJSONResponse({"error": "page_size must be positive"}, status_code=400)
+
+        validate_app_id(app_id)
+
+        if request.query_params.get("format") == "ndjson":
+            users = iter_users_by_app(app_id, fields=fields, batch_size=page_size, page_token=page_token)
+
+            async def lines():
+                async for user in users:
+                    yield json.dumps(user, default=_json_default, separators=(",", ":")) + "\n"
+
+            return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+        users, next_page_token = await get_users_page(app_id, page_size, page_token, fields)
+        return ServiceJSONResponse({
+            "app_id": app_id,
+            "users": users,
+            "count": len(users),
+            "next_page_token": next_page_token
+        }, status_code=200)
+    except Exception as e:
+        logger.error(f"Failed to get users for app_id: {app_id} - Error: {str(e)}")
+        return ServiceJSONResponse({"error": str(e)}, status_code=400)
+
+@require_service_auth
+async def import_app_users(request):
+    """Admin endpoint to bulk import users for a specific app (service key required; uids are assigned here)"""
+    app_id = request.path_params["app_id"]
+    data = await _json_body(request) or {}
+    users = data.get("users")
+
+    try:
+        if not isinstance(users, list) or not users:
+            return ServiceJSONResponse({"error": "users must be a non-empty list"}, status_code=400)
+
+        if len(users) > Config.BULK_IMPORT_MAX_RECORDS_PER_REQUEST:
+            return ServiceJSONResponse({"error": f"Too many users: {len(users)} (max {Config.BULK_IMPORT_MAX_RECORDS_PER_REQUEST}); use bulk_import.py for larger imports"}, status_code=400)
+
+        validate_app_id(app_id)
+        from bulk_import import import_users
+        stats = await asyncio.to_thread(import_users, users, app_id)
+
+        logger.info(f"Imported {stats['imported']} users for app_id: {app_id}, failed: {stats['failed']}")
+        return ServiceJSONResponse(stats, status_code=200)
+    except Exception as e:
+        logger.error(f"Failed to import users for app_id: {app_id} - Error: {str(e)}")
+        return ServiceJSONResponse({"error": str(e)}, status_code=400)
+
+@require_service_auth
+async def cache_stats(request):
+    """Admin endpoint exposing profile cache counters for sizing (service key required)"""
+    from profile_cache import profile_cache
+    return ServiceJSONResponse({"profile_cache": profile_cache.stats()}, status_code=200)
+
+async def not_found(request, exc):
+    logger.warning(f"404 error: {request.url} not found")
+    return ServiceJSONResponse({"error": "Endpoint not found"}, status_code=404)
+
+async def internal_error(request, exc):
+    logger.error(f"Unhandled exception: {str(exc)}", exc_info=exc)
+    return ServiceJSONResponse({"error": "An unexpected error occurred"}, status_code=500)
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # Release pooled connections on shutdown (SIGTERM from Cloud Run)
+    await asyncio.to_thread(activity_writer.shutdown)
+    await close_async_http_client()
+    close_async_firestore_clients()
+
+routes = [
+    Route("/health", health_check, methods=["GET"]),
+    Route("/metrics", metrics_endpoint, methods=["GET"]),
+    Route("/user/login", login, methods=["POST"]),
+    Route("/user/register", register, methods=["POST"]),
+    Route("/user/profile/{user_id}", profile, methods=["GET"]),
+    Route("/user/profile/{user_id}", update_profile, methods=["PUT", "PATCH"]),
+    Route("/user/profiles:batchGet", batch_get_profiles, methods=["POST"]),
+    Route("/admin/users/{app_id}", get_app_users, methods=["GET"]),
+    Route("/admin/users/{app_id}/import", import_app_users, methods=["POST"]),
+    Route("/admin/cache/stats", cache_stats, methods=["GET"]),
+]
+
+app = Starlette(
+    routes=routes,
+    exception_handlers={404: not_found, Exception: internal_error},
+    lifespan=lifespan
+)
+app.add_middleware(TenantLimitMiddleware)
+# Added last so it wraps the tenant limits: their 429s are logged and counted too
+app.add_middleware(RequestLoggingMiddleware)
+
+if __name__ == "__main__":
+    import uvicorn
+    port = int(os.getenv("PORT", 8080))
+    logger.info(f"Starting ASGI application on port {port}")
+    # X-Forwarded-For is resolved by _client_addr (TRUSTED_PROXY_HOPS), not by uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=port, proxy_headers=False)
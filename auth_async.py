@@ -0,0 +1,292 @@
+# auth_async.py
+from firebase_admin import auth
+from google.cloud import firestore as firestore_client
+from auth_simple import validate_app_id, build_user_profile, encode_page_token, decode_page_token, build_users_query, user_from_doc, preference_updates, profile_flight_keys, PROFILE_UPDATE_ATTEMPTS
+from google.api_core.exceptions import FailedPrecondition
+from auth_utils import verify_firebase_password_async, InvalidCredentials, AuthServiceUnavailable
+from login_throttle import login_throttle, LoginThrottled
+from firestore_registry import get_async_firestore_client
+from profile_cache import profile_cache, MISSING
+from singleflight import AsyncSingleFlight
+from tokens import issue_token, authorize_token
+from request_timing import timed
+from activity_writer import activity_writer
+from firebase_init import get_firebase_app
+from config import Config
+import asyncio
+import copy
+import logging
+
+# Configure logging for async auth module
+logger = logging.getLogger(__name__)
+
+# Async counterparts of the auth_simple functions, used by asgi_app.py.
+# Firestore and identitytoolkit calls are awaited directly; the Firebase Admin
+# auth API has no async client, so those calls run on the default thread pool.
+
+async def verify_password_throttled(email, password, client_ip=None):
+    """Async variant of auth_simple.verify_password_throttled"""
+    cached_reason = login_throttle.check(email, password, client_ip)
+    if cached_reason is not None:
+        logger.info(f"Login rejected from negative cache for email: {email} ({cached_reason})")
+        login_throttle.record_failure(email, password, client_ip, cached_reason, cached=True)
+        raise InvalidCredentials(f"Authentication failed: Invalid credentials: {cached_reason}", cached_reason)
+
+    try:
+        auth_result = await verify_firebase_password_async(email, password)
+    except InvalidCredentials as e:
+        login_throttle.record_failure(email, password, client_ip, e.reason)
+        raise
+
+    login_throttle.record_success(email, client_ip)
+    return auth_result
+
+async def authenticate_user(email, password, app_id, client_ip=None):
+    """Async variant of auth_simple.authenticate_user"""
+    logger.info(f"Starting authentication for email: {email}, app_id: {app_id}")
+
+    try:
+        validate_app_id(app_id)
+
+        auth_result = await verify_password_throttled(email, password, client_ip)
+        user_uid = auth_result["uid"]
+
+        if not auth_result.get("verified", True):
+            logger.warning(f"Password verification skipped for {email} (API key not available)")
+
+        db = get_async_firestore_client()
+        user_ref = db.collection("users").document(user_uid)
+        with timed("firestore_get"):
+            user_doc = await user_ref.get()
+
+        if not user_doc.exists:
+            logger.error(f"User profile not found for uid: {user_uid}")
+            raise Exception("User profile not found")
+
+        stored_app_id = user_doc.to_dict().get("app_id")
+        if stored_app_id != app_id:
+            logger.error(f"User {user_uid} not authorized for app {app_id} (belongs to {stored_app_id})")
+            raise Exception("User not authorized for this application")
+
+        if Config.ACTIVITY_WRITER_ENABLED:
+            activity_writer.record(user_uid)
+        else:
+            with timed("firestore_update"):
+                await user_ref.update({
+                    "lastActiveTimestamp": firestore_client.SERVER_TIMESTAMP
+                })
+
+        token, expires_in = issue_token(user_uid, app_id)
+
+        logger.info(f"Authentication successful for user: {user_uid}, app_id: {app_id}")
+        return {"uid": user_uid, "idToken": token, "expiresIn": expires_in, "app_id": app_id}
+
+    except LoginThrottled as e:
+        logger.warning(f"Authentication throttled for email: {email}, app_id: {app_id} - {e.scope} locked for {e.retry_after:.0f}s")
+        raise
+    except AuthServiceUnavailable as e:
+        logger.error(f"Authentication unavailable for email: {email}, app_id: {app_id} - Error: {str(e)}")
+        raise
+    except Exception as e:
+        logger.error(f"Authentication failed for email: {email}, app_id: {app_id} - Error: {str(e)}")
+        raise Exception(f"Authentication failed: {str(e)}")
+
+async def register_user(email, password, app_id, firstName=None, lastName=None, userName=None, avatar=None):
+    """Async variant of auth_simple.register_user"""
+    logger.info(f"Starting user registration for email: {email}, app_id: {app_id}")
+
+    try:
+        validate_app_id(app_id)
+
+        await asyncio.to_thread(get_firebase_app)
+        with timed("auth_create_user"):
+            user = await asyncio.to_thread(auth.create_user, email=email, password=password)
+        logger.info(f"Firebase user created with uid: {user.uid}")
+
+        user_data = build_user_profile(user.uid, email, app_id, firstName, lastName, userName, avatar)
+
+        db = get_async_firestore_client()
+        with timed("firestore_set"):
+            await db.collection("users").document(user.uid).set(user_data)
+        profile_cache.invalidate(app_id, user.uid)
+        login_throttle.forget_email(email)
+
+        logger.info(f"User registration completed successfully for uid: {user.uid}, app_id: {app_id}")
+        return {"uid": user.uid, "app_id": app_id}
+
+    except Exception as e:
+        logger.error(f"User registration failed for email: {email}, app_id: {app_id} - Error: {str(e)}")
+        raise Exception(f"Registration failed: {str(e)}")
+
+# Async counterpart of auth_simple.profile_flights, for the event loop's coroutines
+profile_flights = AsyncSingleFlight(
+    "profile_async",
+    timeout=Config.PROFILE_SINGLEFLIGHT_TIMEOUT_SECONDS,
+    enabled=Config.PROFILE_SINGLEFLIGHT_ENABLED
+)
+
+async def _load_user_profile(user_id, app_id, verified):
+    """Async variant of auth_simple._load_user_profile"""
+    generation = profile_cache.generation()
+
+    if not verified:
+        # Legacy tokens carry no proof of identity, so confirm the user exists remotely
+        await asyncio.to_thread(get_firebase_app)
+        try:
+            with timed("auth_get_user"):
+                await asyncio.to_thread(auth.get_user, user_id)
+        except auth.UserNotFoundError:
+            profile_cache.set_if_current(generation, app_id, user_id, MISSING)
+            raise
+
+    db = get_async_firestore_client()
+    with timed("firestore_get"):
+        user_doc = await db.collection("users").document(user_id).get()
+
+    if not user_doc.exists:
+        logger.error(f"User profile not found in Firestore: {user_id}")
+        profile_cache.set_if_current(generation, app_id, user_id, MISSING)
+        raise Exception("Profile not found")
+
+    user_data = user_doc.to_dict()
+    stored_app_id = user_data.get("app_id")
+
+    if stored_app_id != app_id:
+        logger.error(f"User {user_id} not authorized for app {app_id} (belongs to {stored_app_id})")
+        raise Exception("User not authorized for this application")
+
+    profile_cache.set_if_current(generation, app_id, user_id, user_data)
+    return user_data
+
+async def get_user_profile(user_id, token, app_id):
+    """Async variant of auth_simple.get_user_profile"""
+    logger.info(f"Getting user profile for user_id: {user_id}, app_id: {app_id}")
+
+    try:
+        validate_app_id(app_id)
+        verified = authorize_token(token, user_id, app_id)
+
+        cached = profile_cache.get(app_id, user_id) if verified else None
+        if cached is MISSING:
+            raise Exception("Profile not found")
+        if cached is not None:
+            return cached
+
+        user_data = await profile_flights.do(
+            (app_id, user_id, bool(verified)),
+            lambda: _load_user_profile(user_id, app_id, verified)
+        )
+
+        logger.info(f"Profile retrieved successfully for user_id: {user_id}, app_id: {app_id}")
+        return copy.deepcopy(user_data)
+
+    except Exception as e:
+        logger.error(f"Failed to get profile for user_id: {user_id}, app_id: {app_id} - Error: {str(e)}")
+        raise Exception(f"Failed to get profile: {str(e)}")
+
+async def update_user_profile(user_id, token, preferences, app_id, merge=False):
+    """Async variant of auth_simple.update_user_profile"""
+    logger.info(f"Updating user profile for user_id: {user_id}, app_id: {app_id}, preferences: {preferences}, merge: {merge}")
+
+    try:
+        validate_app_id(app_id)
+        # A legacy token can be built by anyone who knows the uid, so it never authorizes a write
+        if not authorize_token(token, user_id, app_id):
+            raise Exception("Legacy tokens cannot update profiles; log in again")
+        updates = preference_updates(preferences, merge)
+
+        if merge and not updates:
+            return
+
+        db = get_async_firestore_client()
+        user_ref = db.collection("users").document(user_id)
+
+        for attempt in range(1, PROFILE_UPDATE_ATTEMPTS + 1):
+            with timed("firestore_get"):
+                user_doc = await user_ref.get(field_paths=["app_id"])
+            if not user_doc.exists:
+                logger.error(f"User profile not found in Firestore: {user_id}")
+                raise Exception("Profile not found")
+
+            stored_app_id = user_doc.to_dict().get("app_id")
+            if stored_app_id != app_id:
+                logger.error(f"User {user_id} not authorized for app {app_id} (belongs to {stored_app_id})")
+                raise Exception("User not authorized for this application")
+
+            try:
+                with timed("firestore_update"):
+                    await user_ref.update(updates, option=db.write_option(last_update_time=user_doc.update_time))
+                break
+            except FailedPrecondition:
+                logger.warning(f"Profile for user_id: {user_id} changed during update (attempt {attempt}), retrying")
+        else:
+            raise Exception("Profile is being modified concurrently, try again")
+
+        # Detach in-flight reads first, so a read missing the cache from here on starts a new one;
+        # a detached read's own result is then refused by the cache's generation check
+        profile_flights.forget(*profile_flight_keys(app_id, user_id))
+        profile_cache.invalidate(app_id, user_id)
+
+        logger.info(f"Profile updated successfully for user_id: {user_id}, app_id: {app_id}")
+
+    except Exception as e:
+        logger.error(f"Failed to update profile for user_id: {user_id}, app_id: {app_id} - Error: {str(e)}")
+        raise Exception(f"Failed to update profile: {str(e)}")
+
+async def get_users_page(app_id, page_size=100, page_token=None, fields=None):
+    """Async variant of auth_simple.get_users_page"""
+    logger.info(f"Getting users page for app_id: {app_id}, page_size: {page_size}, fields: {fields}")
+
+    try:
+        validate_app_id(app_id)
+
+        after = decode_page_token(page_token) if page_token else None
+        query = build_users_query(app_id, fields, after, db=get_async_firestore_client()).limit(page_size + 1)
+
+        users = []
+        has_more = False
+        with timed("firestore_query"):
+            docs = [doc async for doc in query.stream()]
+
+        for doc in docs:
+            if len(users) == page_size:
+                has_more = True
+                break
+            users.append(user_from_doc(doc))
+
+        next_page_token = encode_page_token(users[-1]["uid"]) if has_more else None
+
+        logger.info(f"Retrieved {len(users)} users for app_id: {app_id} (more: {has_more})")
+        return users, next_page_token
+
+    except Exception as e:
+        logger.error(f"Failed to get users for app_id: {app_id} - Error: {str(e)}")
+        raise Exception(f"Failed to get users for app: {str(e)}")
+
+def iter_users_by_app(app_id, fields=None, batch_size=500, page_token=None):
+    """Async variant of auth_simple.iter_users_by_app (returns an async generator)"""
+    validate_app_id(app_id)
+    after = decode_page_token(page_token) if page_token else None
+
+    async def generate(after):
+        count = 0
+        while True:
+            batch_count = 0
+            query = build_users_query(app_id, fields, after, db=get_async_firestore_client()).limit(batch_size)
+            async for doc in query.stream():
+                batch_count += 1
+                after = doc.id
+                yield user_from_doc(doc)
+
+            count += batch_count
+            if batch_count < batch_size:
+                break
+
+        logger.info(f"Streamed {count} users for app_id: {app_id}")
+
+    return generate(after)
+
+async def get_users_by_app(app_id, limit=100):
+    """Async variant of auth_simple.get_users_by_app"""
+    users, _ = await get_users_page(app_id, page_size=limit)
+    return users
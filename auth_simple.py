@@ -1,7 +1,21 @@
-from firebase_admin import auth, firestore
+from firebase_admin import auth
 from google.cloud import firestore as firestore_client
+from google.cloud.firestore_v1.field_path import FieldPath
+from google.api_core.exceptions import FailedPrecondition
 from config import Config
-from auth_utils import verify_firebase_password
+from auth_utils import verify_firebase_password, InvalidCredentials, AuthServiceUnavailable
+from login_throttle import login_throttle, LoginThrottled
+from firestore_registry import get_firestore_client
+from profile_cache import profile_cache, MISSING
+from singleflight import SingleFlight
+from tokens import issue_token, authorize_token
+from request_timing import timed
+from activity_writer import record_activity
+from firebase_init import get_firebase_app
+from datetime import datetime
+import base64
+import copy
+import json
 import os
 import logging
 # Configure logging
@@ -20,21 +34,38 @@ logger = logging.getLogger(__name__)
 
 def validate_app_id(app_id):
     """Validate that app_id is in allowed list"""
-    ALLOWED_APP_IDS = Config.get_allowed_app_ids()
+    # Fast path: a single frozenset lookup, so repeated calls within a request cost nothing
+    if Config.is_allowed_app_id(app_id):
+        return True
     
-    logger.info(f"Validating app_id: {app_id} against allowed: {ALLOWED_APP_IDS}")
+    ALLOWED_APP_IDS = Config.get_allowed_app_ids()
+    logger.error(f"Invalid app_id: {app_id}. Allowed: {', '.join(ALLOWED_APP_IDS)}")
+    raise Exception(f"Invalid app_id: {app_id}. Allowed: {', '.join(ALLOWED_APP_IDS)}")
+
+def verify_password_throttled(email, password, client_ip=None):
+    """
+    verify_firebase_password behind the login throttle: locked-out emails/IPs raise
+    LoginThrottled and recently rejected attempts fail locally, without a remote call.
+    """
+    cached_reason = login_throttle.check(email, password, client_ip)
+    if cached_reason is not None:
+        logger.info(f"Login rejected from negative cache for email: {email} ({cached_reason})")
+        login_throttle.record_failure(email, password, client_ip, cached_reason, cached=True)
+        raise InvalidCredentials(f"Authentication failed: Invalid credentials: {cached_reason}", cached_reason)
     
-    if app_id not in ALLOWED_APP_IDS:
-        logger.error(f"Invalid app_id: {app_id}. Allowed: {', '.join(ALLOWED_APP_IDS)}")
-        raise Exception(f"Invalid app_id: {app_id}. Allowed: {', '.join(ALLOWED_APP_IDS)}")
+    try:
+        auth_result = verify_firebase_password(email, password)
+    except InvalidCredentials as e:
+        login_throttle.record_failure(email, password, client_ip, e.reason)
+        raise
     
-    logger.info(f"App_id validation successful: {app_id}")
-    return True
+    login_throttle.record_success(email, client_ip)
+    return auth_result
 
-def authenticate_user(email, password, app_id):
+def authenticate_user(email, password, app_id, client_ip=None):
     """
     Enhanced authentication with proper password validation.
-    Returns a simple token instead of Firebase custom token to avoid IAM issues.
+    Returns a service-signed JWT instead of a Firebase custom token to avoid IAM issues.
     """
     logger.info(f"Starting authentication for email: {email}, app_id: {app_id}")
     
@@ -43,7 +74,7 @@ def authenticate_user(email, password, app_id):
         
         # First verify email and password using Firebase Auth REST API
         logger.info(f"Verifying password for email: {email}")
-        auth_result = verify_firebase_password(email, password)
+        auth_result = verify_password_throttled(email, password, client_ip)
         user_uid = auth_result["uid"]
         
         if not auth_result.get("verified", True):
@@ -52,11 +83,11 @@ def authenticate_user(email, password, app_id):
         logger.info(f"Password verification successful for user: {user_uid}")
         
         # Verify user belongs to the requesting app
-        logger.info(f"Initializing Firestore client for app verification")
-        db = firestore_client.Client(project="readrocket-a9268")
+        db = get_firestore_client()
         
         logger.info(f"Fetching user document for uid: {user_uid}")
-        user_doc = db.collection("users").document(user_uid).get()
+        with timed("firestore_get"):
+            user_doc = db.collection("users").document(user_uid).get()
         
         if not user_doc.exists:
             logger.error(f"User profile not found for uid: {user_uid}")
@@ -70,22 +101,53 @@ def authenticate_user(email, password, app_id):
             logger.error(f"User {user_uid} not authorized for app {app_id} (belongs to {stored_app_id})")
             raise Exception("User not authorized for this application")
         
-        # Update last active timestamp
-        logger.info(f"Updating last active timestamp for user: {user_uid}")
-        db.collection("users").document(user_uid).update({
-            "lastActiveTimestamp": firestore_client.SERVER_TIMESTAMP
-        })
+        # Update last active timestamp (buffered, written off the request path)
+        record_activity(user_uid)
         
-        # Return a simple token (in production, you'd want proper JWT tokens)
-        simple_token = f"user_{user_uid}_{app_id}_token"
+        # Issue a signed token that profile endpoints verify locally
+        token, expires_in = issue_token(user_uid, app_id)
         
         logger.info(f"Authentication successful for user: {user_uid}, app_id: {app_id}")
-        return {"uid": user_uid, "idToken": simple_token, "app_id": app_id}
-        
+        return {"uid": user_uid, "idToken": token, "expiresIn": expires_in, "app_id": app_id}
+        
+    except LoginThrottled as e:
+        logger.warning(f"Authentication throttled for email: {email}, app_id: {app_id} - {e.scope} locked for {e.retry_after:.0f}s")
+        raise
+    except AuthServiceUnavailable as e:
+        logger.error(f"Authentication unavailable for email: {email}, app_id: {app_id} - Error: {str(e)}")
+        raise
     except Exception as e:
         logger.error(f"Authentication failed for email: {email}, app_id: {app_id} - Error: {str(e)}")
         raise Exception(f"Authentication failed: {str(e)}")
 
+DEFAULT_AVATAR_URL = "https://firebasestorage.googleapis.com/v0/b/readrocket-a9268.firebasestorage.app/o/icons%2FAnimation%20-%201743735839589.gif?alt=media&token=910f04a5-4154-403a-bbe5-a96263f9fb50"
+
+def build_user_profile(uid, email, app_id, firstName=None, lastName=None, userName=None, avatar=None, current_time=None):
+    """Build the Firestore profile document for a new user, filling in defaults"""
+    if current_time is None:
+        current_time = datetime.utcnow()
+    
+    # Extract defaults from email if not provided
+    email_prefix = email.split('@')[0]
+    
+    # Ensure all required fields are present with defaults
+    return {
+        "userId": uid,
+        "email": email,
+        "app_id": app_id,
+        "userName": userName if userName is not None else email_prefix,
+        "firstName": firstName if firstName is not None else email_prefix.capitalize(),
+        "lastName": lastName if lastName is not None else "User",
+        "provider": "email",
+        "isAdmin": False,
+        "credits": 3,  # Default credits
+        "avatar": avatar if avatar is not None else DEFAULT_AVATAR_URL,
+        "createdAt": current_time,
+        "lastActiveTimestamp": current_time,
+        "subscription_status": "free",
+        "preferences": {"modification_mode": "suggestion"}
+    }
+
 def register_user(email, password, app_id, firstName=None, lastName=None, userName=None, avatar=None):
     logger.info(f"Starting user registration for email: {email}, app_id: {app_id}")
     
@@ -93,39 +155,22 @@ def register_user(email, password, app_id, firstName=None, lastName=None, userNa
         validate_app_id(app_id)
         
         logger.info(f"Creating Firebase user for email: {email}")
-        user = auth.create_user(email=email, password=password)
+        get_firebase_app()
+        with timed("auth_create_user"):
+            user = auth.create_user(email=email, password=password)
         logger.info(f"Firebase user created with uid: {user.uid}")
         
-        from datetime import datetime
-        current_time = datetime.utcnow()
-        
-        # Extract defaults from email if not provided
-        email_prefix = email.split('@')[0]
-        
-        # Ensure all required fields are present with defaults
-        user_data = {
-            "userId": user.uid,
-            "email": email,
-            "app_id": app_id,
-            "userName": userName if userName is not None else email_prefix,
-            "firstName": firstName if firstName is not None else email_prefix.capitalize(),
-            "lastName": lastName if lastName is not None else "User",
-            "provider": "email",
-            "isAdmin": False,
-            "credits": 3,  # Default credits
-            "avatar": avatar if avatar is not None else "https://firebasestorage.googleapis.com/v0/b/readrocket-a9268.firebasestorage.app/o/icons%2FAnimation%20-%201743735839589.gif?alt=media&token=910f04a5-4154-403a-bbe5-a96263f9fb50",
-            "createdAt": current_time,
-            "lastActiveTimestamp": current_time,
-            "subscription_status": "free",
-            "preferences": {"modification_mode": "suggestion"}
-        }
+        user_data = build_user_profile(user.uid, email, app_id, firstName, lastName, userName, avatar)
         
         logger.info(f"Creating user profile in Firestore for uid: {user.uid}")
         logger.debug(f"User profile data: {user_data}")
         
         # Initialize complete user profile in Firestore
-        db = firestore_client.Client(project="readrocket-a9268")
-        db.collection("users").document(user.uid).set(user_data)
+        db = get_firestore_client()
+        with timed("firestore_set"):
+            db.collection("users").document(user.uid).set(user_data)
+        profile_cache.invalidate(app_id, user.uid)
+        login_throttle.forget_email(email)
         
         logger.info(f"User registration completed successfully for uid: {user.uid}, app_id: {app_id}")
         return {"uid": user.uid, "app_id": app_id}
@@ -134,79 +179,221 @@ def register_user(email, password, app_id, firstName=None, lastName=None, userNa
         logger.error(f"User registration failed for email: {email}, app_id: {app_id} - Error: {str(e)}")
         raise Exception(f"Registration failed: {str(e)}")
 
+# Concurrent cache misses for one profile share a single lookup (see singleflight.py)
+profile_flights = SingleFlight(
+    "profile",
+    timeout=Config.PROFILE_SINGLEFLIGHT_TIMEOUT_SECONDS,
+    enabled=Config.PROFILE_SINGLEFLIGHT_ENABLED
+)
+
+def _load_user_profile(user_id, app_id, verified):
+    """Backend half of get_user_profile: Auth check for legacy tokens, Firestore read, tenancy check"""
+    # Taken before any backend read, so a write landing meanwhile keeps this result out of the cache
+    generation = profile_cache.generation()
+    
+    if not verified:
+        # Legacy tokens carry no proof of identity, so confirm the user exists remotely
+        logger.info(f"Verifying user exists in Firebase Auth: {user_id}")
+        get_firebase_app()
+        try:
+            with timed("auth_get_user"):
+                user = auth.get_user(user_id)  # This verifies the user exists
+        except auth.UserNotFoundError:
+            profile_cache.set_if_current(generation, app_id, user_id, MISSING)
+            raise
+        logger.info(f"User verified in Firebase Auth: {user.uid}")
+    
+    logger.info(f"Fetching user profile from Firestore: {user_id}")
+    db = get_firestore_client()
+    with timed("firestore_get"):
+        user_doc = db.collection("users").document(user_id).get()
+    
+    if not user_doc.exists:
+        logger.error(f"User profile not found in Firestore: {user_id}")
+        profile_cache.set_if_current(generation, app_id, user_id, MISSING)
+        raise Exception("Profile not found")
+    
+    user_data = user_doc.to_dict()
+    stored_app_id = user_data.get("app_id")
+    logger.info(f"Profile found - stored app_id: {stored_app_id}, requested app_id: {app_id}")
+    
+    if stored_app_id != app_id:
+        logger.error(f"User {user_id} not authorized for app {app_id} (belongs to {stored_app_id})")
+        raise Exception("User not authorized for this application")
+    
+    profile_cache.set_if_current(generation, app_id, user_id, user_data)
+    return user_data
+
+def profile_flight_keys(app_id, user_id):
+    """Single-flight keys of a user's profile reads (legacy-token reads also check Firebase Auth)"""
+    return (app_id, user_id, True), (app_id, user_id, False)
+
 def get_user_profile(user_id, token, app_id):
     """
-    Simplified profile retrieval for testing with multi-tenancy.
+    Profile retrieval with multi-tenancy.
+    Signed tokens are verified locally; legacy tokens fall back to a Firebase Auth lookup.
+    Concurrent cache misses for the same profile share one backend lookup.
     """
     logger.info(f"Getting user profile for user_id: {user_id}, app_id: {app_id}")
     
     try:
         validate_app_id(app_id)
+        verified = authorize_token(token, user_id, app_id)
         
-        # For testing, we'll skip token verification and just check if user exists
-        logger.info(f"Verifying user exists in Firebase Auth: {user_id}")
-        user = auth.get_user(user_id)  # This verifies the user exists
-        logger.info(f"User verified in Firebase Auth: {user.uid}")
-        
-        logger.info(f"Fetching user profile from Firestore: {user_id}")
-        db = firestore_client.Client(project="readrocket-a9268")
-        user_doc = db.collection("users").document(user_id).get()
-        
-        if not user_doc.exists:
-            logger.error(f"User profile not found in Firestore: {user_id}")
+        # Legacy tokens are never served from the cache, ahead of their Firebase Auth check
+        cached = profile_cache.get(app_id, user_id) if verified else None
+        if cached is MISSING:
+            logger.info(f"Profile cache negative hit for user_id: {user_id}, app_id: {app_id}")
             raise Exception("Profile not found")
+        if cached is not None:
+            logger.info(f"Profile cache hit for user_id: {user_id}, app_id: {app_id}")
+            return cached
         
-        user_data = user_doc.to_dict()
-        stored_app_id = user_data.get("app_id")
-        logger.info(f"Profile found - stored app_id: {stored_app_id}, requested app_id: {app_id}")
-        
-        if stored_app_id != app_id:
-            logger.error(f"User {user_id} not authorized for app {app_id} (belongs to {stored_app_id})")
-            raise Exception("User not authorized for this application")
+        # Every caller has authorized its own token above; only the lookup is shared
+        user_data = profile_flights.do(
+            (app_id, user_id, bool(verified)),
+            lambda: _load_user_profile(user_id, app_id, verified)
+        )
         
         logger.info(f"Profile retrieved successfully for user_id: {user_id}, app_id: {app_id}")
-        return user_data
+        return copy.deepcopy(user_data)  # Waiters on one lookup must not share nested dicts
         
     except Exception as e:
         logger.error(f"Failed to get profile for user_id: {user_id}, app_id: {app_id} - Error: {str(e)}")
         raise Exception(f"Failed to get profile: {str(e)}")
 
-def update_user_profile(user_id, token, preferences, app_id):
+def get_user_profiles(user_ids, app_id):
     """
-    Simplified profile update for testing with multi-tenancy.
+    Batch profile retrieval for service-to-service callers.
+    Returns {"found": {uid: profile}, "missing": {uid: reason}}; one get_all round-trip per chunk.
     """
-    logger.info(f"Updating user profile for user_id: {user_id}, app_id: {app_id}, preferences: {preferences}")
+    logger.info(f"Batch getting {len(user_ids)} user profiles for app_id: {app_id}")
     
     try:
         validate_app_id(app_id)
         
-        # For testing, we'll skip token verification and just check if user exists
-        logger.info(f"Verifying user exists in Firebase Auth: {user_id}")
-        user = auth.get_user(user_id)  # This verifies the user exists
-        logger.info(f"User verified in Firebase Auth: {user.uid}")
-        
-        db = firestore_client.Client(project="readrocket-a9268")
-        
-        # First verify user belongs to the requesting app
-        logger.info(f"Fetching user profile for authorization check: {user_id}")
-        user_doc = db.collection("users").document(user_id).get()
-        if not user_doc.exists:
-            logger.error(f"User profile not found in Firestore: {user_id}")
-            raise Exception("Profile not found")
-        
-        user_data = user_doc.to_dict()
-        stored_app_id = user_data.get("app_id")
-        logger.info(f"Authorization check - stored app_id: {stored_app_id}, requested app_id: {app_id}")
-        
-        if stored_app_id != app_id:
-            logger.error(f"User {user_id} not authorized for app {app_id} (belongs to {stored_app_id})")
-            raise Exception("User not authorized for this application")
+        if len(user_ids) > Config.PROFILE_BATCH_MAX_IDS:
+            raise Exception(f"Too many user_ids: {len(user_ids)} (max {Config.PROFILE_BATCH_MAX_IDS})")
+        
+        found = {}
+        missing = {}
+        to_fetch = []
+        for user_id in dict.fromkeys(user_ids):
+            if not isinstance(user_id, str) or not user_id or "/" in user_id:
+                missing[str(user_id)] = "invalid_id"
+                continue
+            cached = profile_cache.get(app_id, user_id)
+            if cached is MISSING:
+                missing[user_id] = "not_found"
+            elif cached is not None:
+                found[user_id] = cached
+            else:
+                to_fetch.append(user_id)
+        
+        logger.info(f"Batch profile cache served {len(found) + len(missing)}, fetching {len(to_fetch)} from Firestore")
+        
+        generation = profile_cache.generation()
+        db = get_firestore_client()
+        users_ref = db.collection("users")
+        chunk_size = Config.PROFILE_BATCH_CHUNK_SIZE
+        for start in range(0, len(to_fetch), chunk_size):
+            refs = [users_ref.document(user_id) for user_id in to_fetch[start:start + chunk_size]]
+            with timed("firestore_get_all"):
+                snapshots = list(db.get_all(refs))
+            for snapshot in snapshots:
+                user_id = snapshot.id
+                if not snapshot.exists:
+                    profile_cache.set_if_current(generation, app_id, user_id, MISSING)
+                    missing[user_id] = "not_found"
+                    continue
+                
+                user_data = snapshot.to_dict()
+                if user_data.get("app_id") != app_id:
+                    # Same tenancy rule as get_user_profile, applied per document
+                    missing[user_id] = "not_authorized"
+                    continue
+                
+                profile_cache.set_if_current(generation, app_id, user_id, user_data)
+                found[user_id] = user_data
+        
+        logger.info(f"Batch profile retrieval for app_id: {app_id} - found: {len(found)}, missing: {len(missing)}")
+        return {"found": found, "missing": missing}
         
-        # Update preferences
-        logger.info(f"Updating preferences in Firestore for user_id: {user_id}")
-        db.collection("users").document(user_id).update({
-            "preferences": preferences
-        })
+    except Exception as e:
+        logger.error(f"Failed to batch get profiles for app_id: {app_id} - Error: {str(e)}")
+        raise Exception(f"Failed to get profiles: {str(e)}")
+
+# Attempts at the read-check-write cycle when another writer changes the profile in between
+PROFILE_UPDATE_ATTEMPTS = 3
+
+def preference_updates(preferences, merge=False):
+    """
+    Firestore field updates for a preferences change.
+    merge=False replaces the whole map; merge=True writes one dot-path per top-level
+    key (preferences.<key>) and deletes keys whose value is None.
+    """
+    if not isinstance(preferences, dict):
+        raise Exception("preferences must be an object")
+    if not merge:
+        return {"preferences": preferences}
+    
+    updates = {}
+    for key, value in preferences.items():
+        if not isinstance(key, str) or not key:
+            raise Exception(f"Invalid preference key: {key!r}")
+        # FieldPath quotes keys containing dots or other special characters
+        field = FieldPath("preferences", key).to_api_repr()
+        updates[field] = firestore_client.DELETE_FIELD if value is None else value
+    return updates
+
+def update_user_profile(user_id, token, preferences, app_id, merge=False):
+    """
+    Profile update with multi-tenancy.
+    The app_id check and the write are atomic: the write is conditional on the
+    document's update time at the read, and the cycle is retried if it moved.
+    """
+    logger.info(f"Updating user profile for user_id: {user_id}, app_id: {app_id}, preferences: {preferences}, merge: {merge}")
+    
+    try:
+        validate_app_id(app_id)
+        # A legacy token can be built by anyone who knows the uid, so it never authorizes a write
+        if not authorize_token(token, user_id, app_id):
+            raise Exception("Legacy tokens cannot update profiles; log in again")
+        updates = preference_updates(preferences, merge)
+        
+        if merge and not updates:
+            logger.info(f"No preference changes for user_id: {user_id}")
+            return
+        
+        db = get_firestore_client()
+        user_ref = db.collection("users").document(user_id)
+        
+        for attempt in range(1, PROFILE_UPDATE_ATTEMPTS + 1):
+            # Only app_id is needed for the authorization check
+            with timed("firestore_get"):
+                user_doc = user_ref.get(field_paths=["app_id"])
+            if not user_doc.exists:
+                logger.error(f"User profile not found in Firestore: {user_id}")
+                raise Exception("Profile not found")
+            
+            stored_app_id = user_doc.to_dict().get("app_id")
+            if stored_app_id != app_id:
+                logger.error(f"User {user_id} not authorized for app {app_id} (belongs to {stored_app_id})")
+                raise Exception("User not authorized for this application")
+            
+            try:
+                with timed("firestore_update"):
+                    user_ref.update(updates, option=db.write_option(last_update_time=user_doc.update_time))
+                break
+            except FailedPrecondition:
+                logger.warning(f"Profile for user_id: {user_id} changed during update (attempt {attempt}), retrying")
+        else:
+            raise Exception("Profile is being modified concurrently, try again")
+        
+        # Detach in-flight reads first, so a read missing the cache from here on starts a new one;
+        # a detached read's own result is then refused by the cache's generation check
+        profile_flights.forget(*profile_flight_keys(app_id, user_id))
+        profile_cache.invalidate(app_id, user_id)
         
         logger.info(f"Profile updated successfully for user_id: {user_id}, app_id: {app_id}")
         
@@ -214,34 +401,99 @@ def update_user_profile(user_id, token, preferences, app_id):
         logger.error(f"Failed to update profile for user_id: {user_id}, app_id: {app_id} - Error: {str(e)}")
         raise Exception(f"Failed to update profile: {str(e)}")
 
-def get_users_by_app(app_id, limit=100):
-    """Get all users for a specific app"""
-    logger.info(f"Getting users for app_id: {app_id}, limit: {limit}")
+def encode_page_token(last_doc_id):
+    """Opaque cursor for the next page of users"""
+    payload = json.dumps({"after": last_doc_id}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+def decode_page_token(page_token):
+    """Recover the last document id from a page token"""
+    try:
+        padded = page_token + "=" * (-len(page_token) % 4)
+        last_doc_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))["after"]
+    except Exception:
+        raise Exception("Invalid page_token")
+    if not isinstance(last_doc_id, str) or not last_doc_id:
+        raise Exception("Invalid page_token")
+    return last_doc_id
+
+def build_users_query(app_id, fields=None, after=None, db=None):
+    """Users of an app ordered by document id, optionally projected to `fields`"""
+    db = db or get_firestore_client()
+    document_id = FieldPath.document_id()
+    query = db.collection("users").where("app_id", "==", app_id).order_by(document_id)
+    if fields is not None:
+        # uid is the document id, so it is never part of the projection. An empty
+        # projection returns every field, so select only the name when nothing else is left
+        query = query.select([field for field in fields if field != "uid"] or [document_id])
+    if after:
+        query = query.start_after({document_id: after})
+    return query
+
+def user_from_doc(doc):
+    user_data = doc.to_dict() or {}
+    user_data["uid"] = doc.id
+    return user_data
+
+def get_users_page(app_id, page_size=100, page_token=None, fields=None):
+    """Get one page of users for an app; returns (users, next_page_token)"""
+    logger.info(f"Getting users page for app_id: {app_id}, page_size: {page_size}, fields: {fields}")
     
     try:
         validate_app_id(app_id)
         
-        logger.info(f"Querying Firestore for users with app_id: {app_id}")
-        db = firestore_client.Client(project="readrocket-a9268")
-        users_ref = db.collection("users")
-        query = users_ref.where("app_id", "==", app_id).limit(limit)
-        docs = query.stream()
+        after = decode_page_token(page_token) if page_token else None
+        # Fetch one extra document to learn whether another page exists
+        with timed("firestore_query"):
+            docs = list(build_users_query(app_id, fields, after).limit(page_size + 1).stream())
         
         users = []
-        count = 0
+        has_more = False
         for doc in docs:
-            user_data = doc.to_dict()
-            user_data["uid"] = doc.id
-            users.append(user_data)
-            count += 1
+            if len(users) == page_size:
+                has_more = True
+                break
+            users.append(user_from_doc(doc))
+        
+        next_page_token = encode_page_token(users[-1]["uid"]) if has_more else None
         
-        logger.info(f"Retrieved {count} users for app_id: {app_id}")
-        return users
+        logger.info(f"Retrieved {len(users)} users for app_id: {app_id} (more: {has_more})")
+        return users, next_page_token
         
     except Exception as e:
         logger.error(f"Failed to get users for app_id: {app_id} - Error: {str(e)}")
         raise Exception(f"Failed to get users for app: {str(e)}")
 
+def iter_users_by_app(app_id, fields=None, batch_size=500, page_token=None):
+    """Yield every user of an app as Firestore streams them, one batch query at a time.
+
+    Arguments are validated eagerly so errors surface before a streamed response starts.
+    """
+    validate_app_id(app_id)
+    after = decode_page_token(page_token) if page_token else None
+    
+    def generate(after):
+        count = 0
+        while True:
+            batch_count = 0
+            for doc in build_users_query(app_id, fields, after).limit(batch_size).stream():
+                batch_count += 1
+                after = doc.id
+                yield user_from_doc(doc)
+            
+            count += batch_count
+            if batch_count < batch_size:
+                break
+        
+        logger.info(f"Streamed {count} users for app_id: {app_id}")
+    
+    return generate(after)
+
+def get_users_by_app(app_id, limit=100):
+    """Get the first `limit` users for a specific app"""
+    users, _ = get_users_page(app_id, page_size=limit)
+    return users
+
 def verify_custom_token(token, expected_uid):
     """
     Helper function to verify custom tokens for testing.
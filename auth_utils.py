@@ -1,19 +1,114 @@
 # auth_utils.py
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import Config
+from request_timing import timed
+from tracing import current_traceparent
 import json
 import logging
 import os
+import asyncio
+import random
+import threading
 
 logger = logging.getLogger(__name__)
 
+SIGN_IN_URL = "https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword"
+RETRY_STATUSES = frozenset((500, 502, 503, 504))
+
+class InvalidCredentials(Exception):
+    """identitytoolkit rejected the email/password; `reason` is its error code (e.g. INVALID_PASSWORD)"""
+    
+    def __init__(self, message, reason):
+        super().__init__(message)
+        self.reason = reason
+
+class AuthServiceUnavailable(Exception):
+    """identitytoolkit could not be reached or answered 5xx after the retries; says nothing about the credentials"""
+
+def _sign_in_payload(email, password):
+    return {
+        "email": email,
+        "password": password,
+        "returnSecureToken": True
+    }
+
+def _trace_headers():
+    # Propagate the active trace to identitytoolkit (W3C Trace Context)
+    traceparent = current_traceparent()
+    return {"traceparent": traceparent} if traceparent else None
+
+def _parse_sign_in_response(email, status_code, data):
+    """Turn an identitytoolkit response into our user info dict, raising on failure"""
+    if status_code == 200:
+        logger.info(f"Password verification successful for user: {data.get('localId')}")
+        return {
+            "uid": data.get("localId"),
+            "email": data.get("email"),
+            "id_token": data.get("idToken"),
+            "verified": True
+        }
+    
+    error_message = data.get("error", {}).get("message", "Unknown error") if isinstance(data, dict) else "Unknown error"
+    if status_code >= 500:
+        logger.error(f"identitytoolkit returned {status_code} for {email}: {error_message}")
+        raise AuthServiceUnavailable(f"Authentication service unavailable: {error_message}")
+    logger.error(f"Password verification failed for {email}: {error_message}")
+    raise InvalidCredentials(f"Invalid credentials: {error_message}", error_message)
+
+def _response_json(response):
+    # A 5xx from a proxy in front of identitytoolkit may not be JSON
+    try:
+        return response.json()
+    except ValueError:
+        return {}
+
+# Shared keep-alive session for identitytoolkit calls, one per process
+_session = None
+_session_lock = threading.Lock()
+_session_pid = None
+
+def _build_session():
+    retry = Retry(
+        total=Config.IDENTITY_HTTP_MAX_RETRIES,
+        connect=Config.IDENTITY_HTTP_MAX_RETRIES,
+        read=Config.IDENTITY_HTTP_MAX_RETRIES,
+        status=Config.IDENTITY_HTTP_MAX_RETRIES,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["POST"]),  # signInWithPassword has no side effects
+        backoff_factor=Config.IDENTITY_HTTP_BACKOFF_SECONDS,
+        backoff_jitter=Config.IDENTITY_HTTP_BACKOFF_JITTER_SECONDS,
+        raise_on_status=False  # Hand the final 5xx body to _parse_sign_in_response
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=Config.IDENTITY_HTTP_POOL_SIZE,
+        max_retries=retry,
+        pool_block=False
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    return session
+
+def get_http_session():
+    """Return the process-wide pooled session, rebuilding it after a fork"""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                logger.info(f"Creating pooled identitytoolkit HTTP session (pool size {Config.IDENTITY_HTTP_POOL_SIZE}, pid {pid})")
+                with timed("identity_session_init"):
+                    _session = _build_session()
+                _session_pid = pid
+    return _session
+
 def verify_firebase_password(email, password):
     """
     Verify user credentials using Firebase Auth REST API
     Returns user info if valid, raises exception if invalid
     """
-    # Get Firebase project config
-    project_id = "readrocket-a9268"
-    
     # Firebase Auth REST API endpoint
     api_key = os.getenv("FIREBASE_API_KEY")
     
@@ -22,36 +117,114 @@ def verify_firebase_password(email, password):
         logger.warning("FIREBASE_API_KEY not set, attempting alternative authentication")
         return verify_user_exists_only(email)
     
-    url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={api_key}"
-    
-    payload = {
-        "email": email,
-        "password": password,
-        "returnSecureToken": True
-    }
+    url = f"{SIGN_IN_URL}?key={api_key}"
     
     try:
         logger.info(f"Attempting password verification for email: {email}")
-        response = requests.post(url, json=payload, timeout=10)
-        
-        if response.status_code == 200:
-            user_data = response.json()
-            logger.info(f"Password verification successful for user: {user_data.get('localId')}")
-            return {
-                "uid": user_data.get("localId"),
-                "email": user_data.get("email"),
-                "id_token": user_data.get("idToken"),
-                "verified": True
-            }
-        else:
-            error_data = response.json()
-            error_message = error_data.get("error", {}).get("message", "Unknown error")
-            logger.error(f"Password verification failed for {email}: {error_message}")
-            raise Exception(f"Invalid credentials: {error_message}")
-            
+        session = get_http_session()
+        with timed("identitytoolkit"):
+            response = session.post(
+                url,
+                json=_sign_in_payload(email, password),
+                headers=_trace_headers(),
+                timeout=(Config.IDENTITY_HTTP_CONNECT_TIMEOUT, Config.IDENTITY_HTTP_READ_TIMEOUT)
+            )
+        return _parse_sign_in_response(email, response.status_code, _response_json(response))
+    
     except requests.RequestException as e:
         logger.error(f"Network error during password verification: {e}")
-        raise Exception(f"Authentication service unavailable: {str(e)}")
+        raise AuthServiceUnavailable(f"Authentication service unavailable: {str(e)}")
+    except AuthServiceUnavailable:
+        raise
+    except InvalidCredentials as e:
+        raise InvalidCredentials(f"Authentication failed: {str(e)}", e.reason)
+    except Exception as e:
+        logger.error(f"Password verification error for {email}: {e}")
+        raise Exception(f"Authentication failed: {str(e)}")
+
+# Shared async HTTP client for the ASGI service, created on first use
+_async_client = None
+_async_client_lock = threading.Lock()
+
+def get_async_http_client():
+    """Return the process-wide httpx.AsyncClient used for identitytoolkit calls"""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        import httpx
+        with _async_client_lock:
+            if _async_client is None or _async_client.is_closed:
+                _async_client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(Config.IDENTITY_HTTP_READ_TIMEOUT, connect=Config.IDENTITY_HTTP_CONNECT_TIMEOUT),
+                    limits=httpx.Limits(
+                        max_connections=Config.IDENTITY_HTTP_POOL_SIZE,
+                        max_keepalive_connections=Config.IDENTITY_HTTP_POOL_SIZE
+                    )
+                    # Retries (5xx and connection errors) are done by _post_with_retries
+                )
+    return _async_client
+
+async def close_async_http_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+def _retry_backoff(retry):
+    """Seconds to sleep before the given retry (1-based), on the same schedule as urllib3's Retry"""
+    if retry <= 1:
+        return 0.0
+    return Config.IDENTITY_HTTP_BACKOFF_SECONDS * (2 ** (retry - 1)) + random.random() * Config.IDENTITY_HTTP_BACKOFF_JITTER_SECONDS
+
+async def _post_with_retries(client, url, **kwargs):
+    """
+    POST with the sync session's retry policy: up to IDENTITY_HTTP_MAX_RETRIES
+    retries on RETRY_STATUSES and transport errors, with backoff. The last
+    response or error is returned/raised as is.
+    """
+    import httpx
+    
+    for retry in range(Config.IDENTITY_HTTP_MAX_RETRIES + 1):
+        if retry:
+            await asyncio.sleep(_retry_backoff(retry))
+        try:
+            response = await client.post(url, **kwargs)
+        except httpx.TransportError as e:
+            if retry == Config.IDENTITY_HTTP_MAX_RETRIES:
+                raise
+            logger.warning(f"identitytoolkit request failed, retrying ({retry + 1}/{Config.IDENTITY_HTTP_MAX_RETRIES}): {e}")
+            continue
+        if response.status_code not in RETRY_STATUSES or retry == Config.IDENTITY_HTTP_MAX_RETRIES:
+            return response
+        logger.warning(f"identitytoolkit returned {response.status_code}, retrying ({retry + 1}/{Config.IDENTITY_HTTP_MAX_RETRIES})")
+
+async def verify_firebase_password_async(email, password):
+    """
+    Async variant of verify_firebase_password for the ASGI service
+    """
+    import httpx
+    
+    api_key = os.getenv("FIREBASE_API_KEY")
+    
+    if not api_key:
+        logger.warning("FIREBASE_API_KEY not set, attempting alternative authentication")
+        return await asyncio.to_thread(verify_user_exists_only, email)
+    
+    url = f"{SIGN_IN_URL}?key={api_key}"
+    
+    try:
+        logger.info(f"Attempting password verification for email: {email}")
+        client = get_async_http_client()
+        with timed("identitytoolkit"):
+            response = await _post_with_retries(client, url, json=_sign_in_payload(email, password), headers=_trace_headers())
+        return _parse_sign_in_response(email, response.status_code, _response_json(response))
+    
+    except httpx.HTTPError as e:
+        logger.error(f"Network error during password verification: {e}")
+        raise AuthServiceUnavailable(f"Authentication service unavailable: {str(e)}")
+    except AuthServiceUnavailable:
+        raise
+    except InvalidCredentials as e:
+        raise InvalidCredentials(f"Authentication failed: {str(e)}", e.reason)
     except Exception as e:
         logger.error(f"Password verification error for {email}: {e}")
         raise Exception(f"Authentication failed: {str(e)}")
@@ -62,11 +235,14 @@ def verify_user_exists_only(email):
     Only verifies user exists, doesn't validate password
     """
     from firebase_admin import auth
+    from firebase_init import get_firebase_app
     
     logger.warning(f"Using fallback authentication (no password validation) for: {email}")
     
     try:
-        user = auth.get_user_by_email(email)
+        get_firebase_app()
+        with timed("auth_get_user_by_email"):
+            user = auth.get_user_by_email(email)
         return {
             "uid": user.uid,
             "email": user.email,
@@ -0,0 +1,278 @@
+# benchmark.py
+"""
+Offline throughput/latency benchmark for the Flask service.
+
+Firebase Auth, Firestore and identitytoolkit are replaced by the in-memory
+fakes in fake_backend.py (with injected latency), so runs are reproducible
+and need no credentials or network. Each scenario is driven two ways:
+    - test_client: serially through Flask's test client, the app's own overhead
+    - wsgi:        over HTTP against a threaded WSGI server, with --concurrency clients
+
+and reported as throughput, p50/p95/p99 latency and, for test_client, memory
+allocated per request (tracemalloc peak above the pre-request baseline, and
+the bytes still held after it).
+
+Scenarios: login, register, profile_get, profile_put, admin_users
+
+Usage:
+    python benchmark.py                                   # all scenarios, compare with benchmark_baseline.json
+    python benchmark.py --scenarios login,profile_get --mode wsgi --concurrency 16
+    python benchmark.py --latency-ms identitytoolkit=120 --latency-scale 0.5
+    python benchmark.py --save-baseline benchmark_baseline.json
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+SCENARIOS = ("login", "register", "profile_get", "profile_put", "admin_users")
+MODES = ("test_client", "wsgi")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+SERVICE_KEY = "benchmark-service-key"
+
+# Metrics compared against the baseline, and which direction is a regression
+COMPARED = (("rps", "lower"), ("p95_ms", "higher"), ("alloc_peak_kib", "higher"))
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(fraction * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def summarize(latencies, errors, elapsed):
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 1) if elapsed > 0 else 0.0,
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 2)
+    }
+
+class Workload:
+    """Seeded users, their tokens, and the request each scenario sends for a given index"""
+
+    def __init__(self, backend, app_id, user_count):
+        from tokens import issue_token
+        self.app_id = app_id
+        self.users = backend.seed_users(app_id, user_count)
+        self.tokens = {uid: issue_token(uid, app_id)[0] for uid, _, _ in self.users}
+        self._registrations = itertools.count()
+
+    def request(self, scenario, index):
+        """(method, path, headers, json body) for request number `index` of a scenario"""
+        uid, email, password = self.users[index % len(self.users)]
+        headers = {"Authorization": f"Bearer {self.tokens[uid]}", "X-App-ID": self.app_id}
+        if scenario == "login":
+            return "POST", "/user/login", {}, {"email": email, "password": password, "app_id": self.app_id}
+        if scenario == "register":
+            # Every registration needs an unused email, across passes too
+            number = next(self._registrations)
+            return "POST", "/user/register", {}, {"email": f"bench{number}@{self.app_id}.example.com", "password": "Password123!", "app_id": self.app_id}
+        if scenario == "profile_get":
+            return "GET", f"/user/profile/{uid}", headers, None
+        if scenario == "profile_put":
+            mode = "suggestion" if index % 2 else "rewrite"
+            return "PUT", f"/user/profile/{uid}", headers, {"preferences": {"modification_mode": mode, "theme": "dark"}}
+        if scenario == "admin_users":
+            return "GET", f"/admin/users/{self.app_id}?page_size=50", {"X-Service-Key": SERVICE_KEY}, None
+        raise ValueError(f"Unknown scenario: {scenario}")
+
+def run_test_client(app, workload, scenario, requests, warmup, alloc_requests):
+    from profile_cache import profile_cache
+    client = app.test_client()
+
+    def send(index):
+        method, path, headers, body = workload.request(scenario, index)
+        return client.open(path, method=method, headers=headers, json=body).status_code
+
+    profile_cache.clear()
+    for index in range(warmup):
+        send(index)
+
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for index in range(requests):
+        request_started = time.perf_counter()
+        status = send(index)
+        latencies.append(time.perf_counter() - request_started)
+        if status >= 400:
+            errors += 1
+    result = summarize(latencies, errors, time.perf_counter() - started)
+
+    if alloc_requests > 0:
+        # Separate pass: tracing allocations slows every request down
+        peaks = []
+        retained = []
+        tracemalloc.start()
+        try:
+            for index in range(alloc_requests):
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                send(index)
+                current, peak = tracemalloc.get_traced_memory()
+                peaks.append(peak - before)
+                retained.append(current - before)
+        finally:
+            tracemalloc.stop()
+        result["alloc_peak_kib"] = round(statistics.median(peaks) / 1024, 1)
+        result["alloc_retained_bytes"] = round(statistics.fmean(retained))
+    return result
+
+def run_wsgi(app, workload, scenario, requests, warmup, concurrency):
+    import requests as http
+    from fake_backend import make_wsgi_server
+    from profile_cache import profile_cache
+
+    server = make_wsgi_server(app)
+    thread = threading.Thread(target=server.serve_forever, name="benchmark-wsgi", daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    local = threading.local()
+
+    def send(index):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = http.Session()
+        method, path, headers, body = workload.request(scenario, index)
+        request_started = time.perf_counter()
+        response = session.request(method, base_url + path, headers=headers, json=body)
+        return time.perf_counter() - request_started, response.status_code
+
+    try:
+        profile_cache.clear()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="benchmark-client") as pool:
+            list(pool.map(send, range(warmup)))
+            started = time.perf_counter()
+            outcomes = list(pool.map(send, range(requests)))
+            elapsed = time.perf_counter() - started
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return summarize([latency for latency, _ in outcomes], sum(1 for _, status in outcomes if status >= 400), elapsed)
+
+def compare(report, baseline, tolerance):
+    """Print changes against a baseline report; returns the list of regressions"""
+    if baseline.get("config") != report["config"]:
+        print("\nWarning: baseline was recorded with a different configuration; differences may not be regressions")
+
+    regressions = []
+    print(f"\nComparison with baseline (tolerance {tolerance:.0%}):")
+    for mode, scenarios in report["results"].items():
+        for scenario, current in scenarios.items():
+            previous = baseline.get("results", {}).get(mode, {}).get(scenario)
+            if not previous:
+                continue
+            for metric, worse in COMPARED:
+                if metric not in current or not previous.get(metric):
+                    continue
+                change = (current[metric] - previous[metric]) / previous[metric]
+                regressed = change < -tolerance if worse == "lower" else change > tolerance
+                marker = "REGRESSION" if regressed else ""
+                print(f"  {mode:<12} {scenario:<12} {metric:<15} {previous[metric]:>10} -> {current[metric]:>10} ({change:+.1%}) {marker}")
+                if regressed:
+                    regressions.append(f"{mode}/{scenario}/{metric}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the service against in-memory Firebase fakes")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--mode", choices=MODES + ("both",), default="both")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario and mode")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent HTTP clients in wsgi mode")
+    parser.add_argument("--users", type=int, default=100, help="Seeded users the requests rotate through")
+    parser.add_argument("--app-id", help="Tenant to benchmark (default: first allowed app_id)")
+    parser.add_argument("--latency-ms", action="append", metavar="OPERATION=MS",
+                        help="Override an injected latency: firestore_read, firestore_write, firestore_query, auth, identitytoolkit")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiply every injected latency (0 disables them)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Add up to this fraction of each latency at random")
+    parser.add_argument("--alloc-requests", type=int, default=50, help="Requests traced with tracemalloc per scenario (0 to skip)")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline report to compare against, if it exists")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Relative change that counts as a regression")
+    args = parser.parse_args(argv)
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+    modes = MODES if args.mode == "both" else (args.mode,)
+
+    # Quiet, lazy startup; the fakes are installed before any request
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("FIREBASE_INIT_MODE", "lazy")
+    # admin_users needs a service key; the benchmark process only talks to the fakes
+    os.environ["SERVICE_API_KEYS"] = f"benchmark:{SERVICE_KEY}"
+    from fake_backend import FakeBackend, DEFAULT_LATENCY, parse_latency
+    from config import Config
+    from app import app
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    latency = dict(DEFAULT_LATENCY)
+    latency.update(parse_latency(args.latency_ms))
+    backend = FakeBackend(latency, jitter=args.jitter, scale=args.latency_scale, seed=0)
+    app_id = args.app_id or Config.get_allowed_app_ids()[0]
+
+    report = {
+        "config": {
+            "latency_ms": {name: round(value * args.latency_scale * 1000, 3) for name, value in sorted(latency.items())},
+            "jitter": args.jitter,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "users": args.users
+        },
+        "python": sys.version.split()[0],
+        "cpus": len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count(),
+        "results": {mode: {} for mode in modes}
+    }
+
+    with backend.installed():
+        workload = Workload(backend, app_id, args.users)
+        for scenario in scenarios:
+            for mode in modes:
+                if mode == "test_client":
+                    result = run_test_client(app, workload, scenario, args.requests, args.warmup, args.alloc_requests)
+                else:
+                    result = run_wsgi(app, workload, scenario, args.requests, args.warmup, args.concurrency)
+                report["results"][mode][scenario] = result
+
+    print(f"{'mode':<12} {'scenario':<12} {'req':>5} {'err':>4} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'alloc KiB':>10} {'retained B':>11}")
+    for mode in modes:
+        for scenario, result in report["results"][mode].items():
+            print(f"{mode:<12} {scenario:<12} {result['requests']:>5} {result['errors']:>4} {result['rps']:>8} "
+                  f"{result['p50_ms']:>8} {result['p95_ms']:>8} {result['p99_ms']:>8} "
+                  f"{result.get('alloc_peak_kib', '-'):>10} {result.get('alloc_retained_bytes', '-'):>11}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline written to {args.save_baseline}")
+        return 0
+
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
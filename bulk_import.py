@@ -0,0 +1,308 @@
+# bulk_import.py
+"""
+Bulk user import: Firebase Auth accounts via auth.import_users and profile
+documents via a Firestore BulkWriter, with per-record errors and checkpoints.
+
+CLI usage:
+    python bulk_import.py --app-id readrocket-web --input users.jsonl --checkpoint import.ckpt
+
+Each input line is a JSON object with "email" and optionally "password", "uid",
+"firstName", "lastName", "userName" and "avatar". Only the CLI accepts "uid";
+the HTTP endpoint rejects records that carry one.
+
+auth.import_users skips Firebase's uniqueness checks and overwrites an account
+with the same uid, so every batch is first looked up with auth.get_users and
+records matching an existing uid or email are reported as already_exists.
+Profile documents are created, never overwritten.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from firebase_admin import auth
+from auth_simple import validate_app_id, build_user_profile
+from firestore_registry import get_firestore_client
+from firebase_init import get_firebase_app
+from profile_cache import profile_cache
+from config import Config
+from datetime import datetime
+import argparse
+import hashlib
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+import logging
+
+# Configure logging for bulk import
+logger = logging.getLogger(__name__)
+
+# Firebase Auth accepts at most 1000 users per import_users call, and 100 identifiers per get_users call
+MAX_AUTH_BATCH_SIZE = 1000
+MAX_LOOKUP_BATCH_SIZE = 100
+SALT_BYTES = 16
+# gRPC status code of a create() whose document already exists; retrying cannot help
+ALREADY_EXISTS = 6
+
+def _new_uid():
+    # Same length and alphabet family as Firebase-generated uids
+    return secrets.token_hex(14)
+
+def _hash_password(password, salt):
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, Config.BULK_IMPORT_HASH_ROUNDS)
+
+def _load_checkpoint(checkpoint_path):
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path) as f:
+        return json.load(f)
+
+def _save_checkpoint(checkpoint_path, state):
+    # Write-then-rename so an interrupted run never leaves a truncated checkpoint
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, checkpoint_path)
+
+def _valid_email(email):
+    # The same shape check firebase_admin applies, so an identifier never raises ValueError
+    if not isinstance(email, str):
+        return False
+    parts = email.split("@")
+    return len(parts) == 2 and bool(parts[0]) and bool(parts[1])
+
+def _existing_accounts(prepared):
+    """uids and lowercased emails among `prepared` that already belong to Firebase Auth accounts"""
+    identifiers = []
+    for index, record, uid in prepared:
+        identifiers.append(auth.EmailIdentifier(record["email"]))
+        if record.get("uid"):
+            # Generated uids are random and never looked up
+            identifiers.append(auth.UidIdentifier(uid))
+
+    uids = set()
+    emails = set()
+    for start in range(0, len(identifiers), MAX_LOOKUP_BATCH_SIZE):
+        result = auth.get_users(identifiers[start:start + MAX_LOOKUP_BATCH_SIZE])
+        for user in result.users:
+            uids.add(user.uid)
+            if user.email:
+                emails.add(user.email.lower())
+    return uids, emails
+
+def _prepare_batch(records, offset, allow_uids=False):
+    """Validate records and build ImportUserRecords; returns (prepared, import_records, errors)"""
+    candidates = []
+    errors = []
+    seen_uids = set()
+    seen_emails = set()
+    for position, record in enumerate(records):
+        index = offset + position
+        email = record.get("email") if isinstance(record, dict) else None
+        if not _valid_email(email):
+            errors.append({"index": index, "email": email, "reason": "invalid_email"})
+            continue
+        uid = record.get("uid")
+        if uid is not None and not allow_uids:
+            errors.append({"index": index, "email": email, "reason": "uid_not_allowed"})
+            continue
+        if uid is not None and not (isinstance(uid, str) and 0 < len(uid) <= 128):
+            errors.append({"index": index, "email": email, "reason": "invalid_uid"})
+            continue
+        if email.lower() in seen_emails or uid in seen_uids:
+            errors.append({"index": index, "email": email, "uid": uid, "reason": "duplicate_in_batch"})
+            continue
+        seen_emails.add(email.lower())
+        if uid:
+            seen_uids.add(uid)
+        candidates.append((index, record, uid or _new_uid()))
+
+    existing_uids, existing_emails = _existing_accounts(candidates) if candidates else (set(), set())
+    prepared = []
+    for index, record, uid in candidates:
+        if uid in existing_uids or record["email"].lower() in existing_emails:
+            errors.append({"index": index, "email": record["email"], "uid": uid, "reason": "already_exists"})
+            continue
+        prepared.append((index, record, uid))
+
+    # PBKDF2 releases the GIL, so hash the batch's passwords in parallel
+    def hash_record(item):
+        record = item[1]
+        password = record.get("password")
+        if not password:
+            return None, None
+        salt = os.urandom(SALT_BYTES)
+        return _hash_password(password, salt), salt
+
+    with ThreadPoolExecutor(max_workers=Config.BULK_IMPORT_HASH_WORKERS) as executor:
+        hashes = list(executor.map(hash_record, prepared))
+
+    import_records = []
+    for (index, record, uid), (password_hash, salt) in zip(prepared, hashes):
+        import_records.append(auth.ImportUserRecord(
+            uid=uid,
+            email=record["email"],
+            display_name=record.get("userName"),
+            password_hash=password_hash,
+            password_salt=salt
+        ))
+    return prepared, import_records, errors
+
+def _write_profiles(db, imported, app_id, stats_lock, errors):
+    """Write profile documents for imported users; returns the number written"""
+    written = []
+    current_time = datetime.utcnow()
+    writer = db.bulk_writer()
+
+    def on_result(reference, result, bulk_writer):
+        with stats_lock:
+            written.append(reference.id)
+
+    def on_error(failure, bulk_writer):
+        if failure.code != ALREADY_EXISTS and failure.attempts < Config.BULK_IMPORT_WRITE_ATTEMPTS:
+            return True
+        reference = failure.operation.reference
+        with stats_lock:
+            errors.append({
+                "index": imported[reference.id][0],
+                "email": imported[reference.id][1].get("email"),
+                "uid": reference.id,
+                "reason": f"profile_write_failed: {failure.message}"
+            })
+        return False
+
+    writer.on_write_result(on_result)
+    writer.on_write_error(on_error)
+
+    users_ref = db.collection("users")
+    for uid, (index, record) in imported.items():
+        user_data = build_user_profile(
+            uid,
+            record["email"],
+            app_id,
+            record.get("firstName"),
+            record.get("lastName"),
+            record.get("userName"),
+            record.get("avatar"),
+            current_time=current_time
+        )
+        # create() fails instead of overwriting another user's profile (and its app_id)
+        writer.create(users_ref.document(uid), user_data)
+
+    writer.close()
+
+    for uid in written:
+        profile_cache.invalidate(app_id, uid)
+    return len(written)
+
+def import_users(records, app_id, batch_size=MAX_AUTH_BATCH_SIZE, checkpoint_path=None, allow_uids=False):
+    """
+    Import user records for one app. Returns throughput stats and per-record errors.
+    With checkpoint_path set, progress is saved after every batch and a rerun with
+    the same input resumes after the last completed batch. Caller-chosen uids are
+    only honoured with allow_uids (the CLI); otherwise such records are rejected.
+    """
+    validate_app_id(app_id)
+    batch_size = max(1, min(batch_size, MAX_AUTH_BATCH_SIZE))
+
+    stats = {
+        "app_id": app_id,
+        "total": len(records),
+        "imported": 0,
+        "failed": 0,
+        "next_index": 0,
+        "errors": []
+    }
+
+    checkpoint = _load_checkpoint(checkpoint_path)
+    if checkpoint:
+        if checkpoint.get("app_id") != app_id:
+            raise Exception(f"Checkpoint belongs to app_id: {checkpoint.get('app_id')}")
+        stats.update(checkpoint)
+        stats["total"] = len(records)
+        logger.info(f"Resuming import for app_id: {app_id} at record {stats['next_index']}")
+
+    get_firebase_app()
+    hash_alg = auth.UserImportHash.pbkdf2_sha256(rounds=Config.BULK_IMPORT_HASH_ROUNDS)
+    db = get_firestore_client()
+    stats_lock = threading.Lock()
+    start_time = time.time()
+    start_index = stats["next_index"]
+
+    for offset in range(start_index, len(records), batch_size):
+        batch = records[offset:offset + batch_size]
+        prepared, import_records, batch_errors = _prepare_batch(batch, offset, allow_uids)
+
+        imported = {}
+        if import_records:
+            result = auth.import_users(import_records, hash_alg=hash_alg)
+            failed_positions = {}
+            for error in result.errors:
+                failed_positions[error.index] = error.reason
+            for position, (index, record, uid) in enumerate(prepared):
+                if position in failed_positions:
+                    batch_errors.append({"index": index, "email": record["email"], "uid": uid, "reason": failed_positions[position]})
+                else:
+                    imported[uid] = (index, record)
+
+        profile_errors = []
+        written = _write_profiles(db, imported, app_id, stats_lock, profile_errors) if imported else 0
+        batch_errors.extend(profile_errors)
+
+        stats["imported"] += written
+        stats["failed"] += len(batch_errors)
+        stats["errors"].extend(batch_errors)
+        stats["next_index"] = offset + len(batch)
+
+        if checkpoint_path:
+            _save_checkpoint(checkpoint_path, stats)
+
+        logger.info(f"Imported batch at {offset} for app_id: {app_id} - written: {written}, failed: {len(batch_errors)}")
+
+    duration = time.time() - start_time
+    processed = stats["next_index"] - start_index
+    stats["duration_seconds"] = round(duration, 3)
+    stats["records_per_second"] = round(processed / duration, 1) if duration > 0 else None
+
+    logger.info(f"Bulk import finished for app_id: {app_id} - imported: {stats['imported']}, failed: {stats['failed']}, {stats['records_per_second']} records/s")
+    return stats
+
+def _read_records(path):
+    records = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # Keep positions stable so checkpoints stay valid; reported as invalid_email
+                logger.error(f"Unparseable JSON on line {line_number}")
+                records.append(None)
+    return records
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import users into Firebase Auth and Firestore")
+    parser.add_argument("--app-id", required=True)
+    parser.add_argument("--input", required=True, help="JSON Lines file with one user per line")
+    parser.add_argument("--checkpoint", help="Checkpoint file used to resume an interrupted import")
+    parser.add_argument("--batch-size", type=int, default=MAX_AUTH_BATCH_SIZE)
+    parser.add_argument("--errors", help="Write per-record errors to this JSON Lines file")
+    args = parser.parse_args(argv)
+
+    from logging_config import setup_logging
+    setup_logging("bulk-import")
+
+    stats = import_users(_read_records(args.input), args.app_id, args.batch_size, args.checkpoint, allow_uids=True)
+
+    if args.errors:
+        with open(args.errors, "w") as f:
+            for error in stats["errors"]:
+                f.write(json.dumps(error) + "\n")
+
+    summary = {k: v for k, v in stats.items() if k != "errors"}
+    print(json.dumps(summary, indent=2))
+    return 0 if stats["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,22 +1,138 @@
+from dotenv import load_dotenv
+from pathlib import Path
 import os
 import logging
 
 # Configure logging for config module
 logger = logging.getLogger(__name__)
 
+# Load .env files once, before any setting below is read
+load_dotenv()
+load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / '.env.production')
+
 class Config:
     FIREBASE_CREDENTIALS_PATH = os.getenv("FIREBASE_CREDENTIALS_PATH", "/path/to/firebase-credentials.json")
     PORT = os.getenv("PORT", "8080")
     
+    # When to initialize the Firebase app (see firebase_init.py): lazy, background or eager
+    FIREBASE_INIT_MODE = os.getenv("FIREBASE_INIT_MODE", "lazy")
+    
+    # Service account secret and its on-instance cache (see credentials_provider.py)
+    FIREBASE_SECRET_NAME = os.getenv("FIREBASE_SECRET_NAME", "rrkt-firebase-adminsdk")
+    FIREBASE_SECRET_VERSION = os.getenv("FIREBASE_SECRET_VERSION", "latest")
+    CREDENTIALS_CACHE_ENABLED = os.getenv("CREDENTIALS_CACHE_ENABLED", "true").lower() == "true"
+    CREDENTIALS_CACHE_DIR = os.getenv("CREDENTIALS_CACHE_DIR", "")
+    CREDENTIALS_CACHE_TTL_SECONDS = float(os.getenv("CREDENTIALS_CACHE_TTL_SECONDS", "3600"))
+    
+    # Firestore project used by the pooled client registry
+    FIRESTORE_PROJECT_ID = os.getenv("FIRESTORE_PROJECT_ID", os.getenv("FIREBASE_PROJECT_ID", "readrocket-a9268"))
+    
+    # In-process user profile cache (see profile_cache.py); set max entries to 0 to disable
+    PROFILE_CACHE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "60"))
+    PROFILE_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_NEGATIVE_TTL_SECONDS", "10"))
+    PROFILE_CACHE_MAX_ENTRIES = int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "10000"))
+    
+    # Signed session tokens (see tokens.py); keys are "kid:secret" pairs, comma-separated
+    TOKEN_SIGNING_KEYS = os.getenv("TOKEN_SIGNING_KEYS", "")
+    TOKEN_ACTIVE_KID = os.getenv("TOKEN_ACTIVE_KID", "")
+    TOKEN_TTL_SECONDS = int(os.getenv("TOKEN_TTL_SECONDS", "3600"))
+    TOKEN_ISSUER = os.getenv("TOKEN_ISSUER", "user-service")
+    TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+    # Old user_<uid>_<app_id>_token strings are forgeable: opt in only for a migration window ending at an ISO date/time (UTC)
+    ACCEPT_LEGACY_TOKENS = os.getenv("ACCEPT_LEGACY_TOKENS", "false").lower() == "true"
+    LEGACY_TOKENS_ACCEPT_UNTIL = os.getenv("LEGACY_TOKENS_ACCEPT_UNTIL", "")
+    
+    # Pooled HTTP client for identitytoolkit password verification (see auth_utils.py)
+    IDENTITY_HTTP_POOL_SIZE = int(os.getenv("IDENTITY_HTTP_POOL_SIZE", "20"))
+    IDENTITY_HTTP_CONNECT_TIMEOUT = float(os.getenv("IDENTITY_HTTP_CONNECT_TIMEOUT", "3.05"))
+    IDENTITY_HTTP_READ_TIMEOUT = float(os.getenv("IDENTITY_HTTP_READ_TIMEOUT", "10"))
+    IDENTITY_HTTP_MAX_RETRIES = int(os.getenv("IDENTITY_HTTP_MAX_RETRIES", "2"))
+    IDENTITY_HTTP_BACKOFF_SECONDS = float(os.getenv("IDENTITY_HTTP_BACKOFF_SECONDS", "0.1"))
+    IDENTITY_HTTP_BACKOFF_JITTER_SECONDS = float(os.getenv("IDENTITY_HTTP_BACKOFF_JITTER_SECONDS", "0.1"))
+    
+    # POST /user/profiles:batchGet limits
+    PROFILE_BATCH_MAX_IDS = int(os.getenv("PROFILE_BATCH_MAX_IDS", "500"))
+    PROFILE_BATCH_CHUNK_SIZE = int(os.getenv("PROFILE_BATCH_CHUNK_SIZE", "100"))
+    
+    # Bulk user import (see bulk_import.py)
+    BULK_IMPORT_HASH_ROUNDS = int(os.getenv("BULK_IMPORT_HASH_ROUNDS", "10000"))
+    BULK_IMPORT_HASH_WORKERS = int(os.getenv("BULK_IMPORT_HASH_WORKERS", "4"))
+    BULK_IMPORT_WRITE_ATTEMPTS = int(os.getenv("BULK_IMPORT_WRITE_ATTEMPTS", "5"))
+    BULK_IMPORT_MAX_RECORDS_PER_REQUEST = int(os.getenv("BULK_IMPORT_MAX_RECORDS_PER_REQUEST", "10000"))
+    
+    # Paging for GET /admin/users/<app_id>
+    ADMIN_USERS_PAGE_SIZE = int(os.getenv("ADMIN_USERS_PAGE_SIZE", "100"))
+    ADMIN_USERS_MAX_PAGE_SIZE = int(os.getenv("ADMIN_USERS_MAX_PAGE_SIZE", "1000"))
+    
+    # Buffered lastActiveTimestamp writes (see activity_writer.py); false writes inline on login
+    ACTIVITY_WRITER_ENABLED = os.getenv("ACTIVITY_WRITER_ENABLED", "true").lower() == "true"
+    ACTIVITY_FLUSH_INTERVAL_SECONDS = float(os.getenv("ACTIVITY_FLUSH_INTERVAL_SECONDS", "5"))
+    ACTIVITY_FLUSH_BATCH_SIZE = int(os.getenv("ACTIVITY_FLUSH_BATCH_SIZE", "500"))
+    ACTIVITY_MAX_PENDING = int(os.getenv("ACTIVITY_MAX_PENDING", "100000"))
+    
+    # Request tracing (see tracing.py); exporter is memory, file, log or "module:factory"
+    TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+    TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "1.0"))
+    TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "file")
+    TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "logs/traces.jsonl")
+    
+    # Login throttling per email and client IP, per worker (see login_throttle.py)
+    LOGIN_THROTTLE_ENABLED = os.getenv("LOGIN_THROTTLE_ENABLED", "true").lower() == "true"
+    LOGIN_THROTTLE_WINDOW_SECONDS = float(os.getenv("LOGIN_THROTTLE_WINDOW_SECONDS", "300"))
+    LOGIN_THROTTLE_MAX_EMAIL_FAILURES = int(os.getenv("LOGIN_THROTTLE_MAX_EMAIL_FAILURES", "5"))
+    LOGIN_THROTTLE_MAX_IP_FAILURES = int(os.getenv("LOGIN_THROTTLE_MAX_IP_FAILURES", "50"))
+    LOGIN_THROTTLE_LOCKOUT_SECONDS = float(os.getenv("LOGIN_THROTTLE_LOCKOUT_SECONDS", "30"))
+    LOGIN_THROTTLE_MAX_LOCKOUT_SECONDS = float(os.getenv("LOGIN_THROTTLE_MAX_LOCKOUT_SECONDS", "900"))
+    LOGIN_NEGATIVE_CACHE_TTL_SECONDS = float(os.getenv("LOGIN_NEGATIVE_CACHE_TTL_SECONDS", "30"))
+    LOGIN_THROTTLE_MAX_KEYS = int(os.getenv("LOGIN_THROTTLE_MAX_KEYS", "100000"))
+    # X-Forwarded-For hops added by trusted proxies; Cloud Run's front end adds one
+    TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+    
+    # Per-tenant limits (see rate_limits.py): "app_id[/endpoint]=rate[:burst],..." and "app_id[/endpoint]=max_in_flight,..."
+    RATE_LIMITS = os.getenv("RATE_LIMITS", "")
+    CONCURRENCY_LIMITS = os.getenv("CONCURRENCY_LIMITS", "")
+    RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+    CONCURRENCY_LIMIT_RETRY_AFTER_SECONDS = float(os.getenv("CONCURRENCY_LIMIT_RETRY_AFTER_SECONDS", "1"))
+    RATE_LIMIT_EXEMPT_ENDPOINTS = frozenset(os.getenv("RATE_LIMIT_EXEMPT_ENDPOINTS", "health_check,metrics_endpoint").split(","))
+    
+    # Service keys for internal routes such as batchGet and user import (see service_auth.py): "name:key,..."
+    SERVICE_API_KEYS = os.getenv("SERVICE_API_KEYS", "")
+    
+    # Coalescing of concurrent identical profile reads, per worker (see singleflight.py)
+    PROFILE_SINGLEFLIGHT_ENABLED = os.getenv("PROFILE_SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+    PROFILE_SINGLEFLIGHT_TIMEOUT_SECONDS = float(os.getenv("PROFILE_SINGLEFLIGHT_TIMEOUT_SECONDS", "5"))
+    
     # Allowed app IDs - can be overridden by environment variable
     ALLOWED_APP_IDS = os.getenv(
         "ALLOWED_APP_IDS", 
         "readrocket-web,readrocket-mobile,readrocket-admin,aijobpro-web"
     ).split(",")
     
+    # Compiled once from ALLOWED_APP_IDS (see reload_allowed_app_ids)
+    _allowed_app_ids_list = ()
+    _allowed_app_ids_set = frozenset()
+    
+    @classmethod
+    def reload_allowed_app_ids(cls, raw=None):
+        """Recompile the allow-list, from `raw` or the ALLOWED_APP_IDS environment variable"""
+        if raw is None:
+            raw = os.getenv("ALLOWED_APP_IDS", ",".join(cls.ALLOWED_APP_IDS))
+        cls.ALLOWED_APP_IDS = raw.split(",") if isinstance(raw, str) else list(raw)
+        app_ids = tuple(dict.fromkeys(app_id.strip() for app_id in cls.ALLOWED_APP_IDS if app_id.strip()))
+        cls._allowed_app_ids_list = app_ids
+        cls._allowed_app_ids_set = frozenset(app_ids)
+        logger.info(f"Loaded allowed app IDs: {list(app_ids)}")
+        return app_ids
+    
     @classmethod
     def get_allowed_app_ids(cls):
         """Get list of allowed app IDs, stripped of whitespace"""
-        app_ids = [app_id.strip() for app_id in cls.ALLOWED_APP_IDS if app_id.strip()]
-        logger.info(f"Loaded allowed app IDs: {app_ids}")
-        return app_ids
\ No newline at end of file
+        return list(cls._allowed_app_ids_list)
+    
+    @classmethod
+    def is_allowed_app_id(cls, app_id):
+        """O(1) membership check against the compiled allow-list"""
+        return isinstance(app_id, str) and app_id in cls._allowed_app_ids_set
+
+Config.reload_allowed_app_ids()
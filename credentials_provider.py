@@ -0,0 +1,191 @@
+# credentials_provider.py
+"""
+Service account resolution for the Firebase Admin app.
+
+Sources are tried in order until one succeeds:
+    secret_manager -> local_file -> credentials_path -> credentials_json -> adc
+
+The Secret Manager payload is cached in a 0600 file on tmpfs (/dev/shm), so a
+restarted worker on the same instance skips the network call. A cached
+payload is reused as-is for a pinned FIREBASE_SECRET_VERSION. For "latest" it
+is reused for CREDENTIALS_CACHE_TTL_SECONDS, after which a metadata-only
+version check decides whether to fetch it again.
+"""
+from config import Config
+import json
+import os
+import stat
+import tempfile
+import time
+import logging
+
+# Configure logging for credential provider
+logger = logging.getLogger(__name__)
+
+# Timings of the most recent resolve_credentials() call, [{"step", "outcome", "ms"}, ...]
+last_resolution = []
+
+class CredentialSourceUnavailable(Exception):
+    """The source does not apply in this environment; try the next one"""
+
+def _cache_dir():
+    if Config.CREDENTIALS_CACHE_DIR:
+        return Config.CREDENTIALS_CACHE_DIR
+    # /dev/shm is memory-backed, so the key never touches a persistent disk
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "user-service")
+
+def _cache_path(secret_name):
+    return os.path.join(_cache_dir(), f"{secret_name}.json")
+
+def _read_cache(path):
+    """Return the cache entry if the file exists, belongs to us and is private"""
+    try:
+        info = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if info.st_uid != os.getuid() or info.st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+        logger.warning(f"Ignoring credential cache with unsafe owner or permissions: {path}")
+        return None
+    try:
+        with open(path) as f:
+            entry = json.load(f)
+        json.loads(entry["payload"])
+        return entry
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Ignoring unreadable credential cache {path}: {e}")
+        return None
+
+def _write_cache(path, entry):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    # Created 0600 from the start and renamed into place, so no reader sees a partial or open file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def _secret_manager_payload():
+    project_id = os.getenv("GOOGLE_CLOUD_PROJECT")
+    if not project_id:
+        raise CredentialSourceUnavailable("GOOGLE_CLOUD_PROJECT not set")
+
+    secret = Config.FIREBASE_SECRET_NAME
+    version = Config.FIREBASE_SECRET_VERSION
+    version_name = f"projects/{project_id}/secrets/{secret}/versions/{version}"
+    cache_path = _cache_path(secret) if Config.CREDENTIALS_CACHE_ENABLED else None
+
+    entry = _read_cache(cache_path) if cache_path else None
+    if entry is not None and entry.get("requested") == version_name:
+        age = time.time() - entry.get("fetched_at", 0)
+        if version != "latest" or age < Config.CREDENTIALS_CACHE_TTL_SECONDS:
+            logger.info(f"Using cached service account ({entry['version']}, {age:.0f}s old)")
+            return entry["payload"], "cache"
+
+    from google.cloud import secretmanager
+    client = secretmanager.SecretManagerServiceClient()
+
+    if entry is not None and entry.get("requested") == version_name:
+        # Metadata-only call: is the cached version still what "latest" points at?
+        try:
+            current = client.get_secret_version(request={"name": version_name}).name
+        except Exception as e:
+            logger.warning(f"Secret version check failed, using cached service account: {e}")
+            return entry["payload"], "cache_stale"
+        if current == entry["version"]:
+            entry["fetched_at"] = time.time()
+            _write_cache(cache_path, entry)
+            logger.info(f"Cached service account is current ({current})")
+            return entry["payload"], "cache_revalidated"
+        logger.info(f"Secret version changed ({entry['version']} -> {current}), refetching")
+
+    response = client.access_secret_version(request={"name": version_name})
+    payload = response.payload.data.decode("UTF-8")
+    json.loads(payload)
+
+    if cache_path:
+        try:
+            _write_cache(cache_path, {
+                "requested": version_name,
+                "version": response.name,
+                "fetched_at": time.time(),
+                "payload": payload
+            })
+        except OSError as e:
+            logger.warning(f"Could not cache service account in {cache_path}: {e}")
+
+    logger.info(f"Loaded service account from Secret Manager ({response.name})")
+    return payload, "fetched"
+
+def _from_secret_manager():
+    from firebase_admin import credentials
+    payload, outcome = _secret_manager_payload()
+    return credentials.Certificate(json.loads(payload)), outcome
+
+def _from_local_file():
+    from firebase_admin import credentials
+    # Service account file next to the code, for local development
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rrkt-firebase-adminsdk.json")
+    if not os.path.exists(path):
+        raise CredentialSourceUnavailable(f"{path} not found")
+    return credentials.Certificate(path), "loaded"
+
+def _from_credentials_path():
+    from firebase_admin import credentials
+    path = os.getenv("FIREBASE_CREDENTIALS_PATH")
+    if not path:
+        raise CredentialSourceUnavailable("FIREBASE_CREDENTIALS_PATH not set")
+    return credentials.Certificate(path), "loaded"
+
+def _from_credentials_json():
+    from firebase_admin import credentials
+    raw = os.getenv("GOOGLE_APPLICATION_CREDENTIALS_JSON")
+    if not raw:
+        raise CredentialSourceUnavailable("GOOGLE_APPLICATION_CREDENTIALS_JSON not set")
+    return credentials.Certificate(json.loads(raw)), "loaded"
+
+def _from_adc():
+    from firebase_admin import credentials
+    return credentials.ApplicationDefault(), "loaded"
+
+CREDENTIAL_SOURCES = [
+    ("secret_manager", _from_secret_manager),
+    ("local_file", _from_local_file),
+    ("credentials_path", _from_credentials_path),
+    ("credentials_json", _from_credentials_json),
+    ("adc", _from_adc),
+]
+
+def resolve_credentials():
+    """Return the first credential the chain can produce, recording how long each step took"""
+    global last_resolution
+    steps = []
+    try:
+        for name, source in CREDENTIAL_SOURCES:
+            start = time.perf_counter()
+            try:
+                cred, outcome = source()
+            except CredentialSourceUnavailable as e:
+                steps.append({"step": name, "outcome": "skipped", "ms": round((time.perf_counter() - start) * 1000, 2)})
+                logger.debug(f"Credential source {name} skipped: {e}")
+                continue
+            except Exception as e:
+                steps.append({"step": name, "outcome": "failed", "ms": round((time.perf_counter() - start) * 1000, 2)})
+                logger.warning(f"Credential source {name} failed: {e}")
+                continue
+
+            steps.append({"step": name, "outcome": outcome, "ms": round((time.perf_counter() - start) * 1000, 2)})
+            logger.info(f"Using credentials from {name} ({outcome})")
+            return cred
+        raise Exception("No credential source available")
+    finally:
+        last_resolution = steps
+        logger.info(f"Credential resolution steps: {steps}")
@@ -12,6 +12,8 @@ PROJECT_ID="readrocket-a9268"
 SERVICE_NAME="rkt-user-service"
 REGION="us-central1"
 IMAGE_NAME="gcr.io/$PROJECT_ID/$SERVICE_NAME"
+# Requests per instance; gunicorn.conf.py sizes its threads from the same value
+CONCURRENCY="${CONCURRENCY:-80}"
 
 # Optional: Check if essential environment variables are set
 REQUIRED_VARS=( 
@@ -19,6 +21,7 @@ REQUIRED_VARS=(
   GOOGLE_API_KEY
   FIREBASE_STORAGE_BUCKET 
   FIREBASE_API_KEY
+  TOKEN_SIGNING_KEYS
 )
 
 echo "Checking required environment variables..."
@@ -29,6 +32,18 @@ for var in "${REQUIRED_VARS[@]}"; do
   fi
 done
 
+# Cloud Run gets its environment from .env.yaml; tokens.py refuses to start there without signing keys
+if ! grep -q '^TOKEN_SIGNING_KEYS:' .env.yaml; then
+  echo "Error: TOKEN_SIGNING_KEYS is not set in .env.yaml"
+  exit 1
+fi
+
+# Cloud Run does not expose --concurrency to the container, so add it to the deployed environment
+ENV_FILE="$(mktemp)"
+trap 'rm -f "$ENV_FILE"' EXIT
+grep -v '^CONCURRENCY:' .env.yaml > "$ENV_FILE"
+echo "CONCURRENCY: \"$CONCURRENCY\"" >> "$ENV_FILE"
+
 # Build and push the Docker image
 echo "Building and pushing Docker image..."
 docker buildx build --platform linux/amd64 --load -t "$IMAGE_NAME" .
@@ -44,11 +59,11 @@ gcloud run deploy "$SERVICE_NAME" \
   --memory 1Gi \
   --cpu 1 \
   --timeout 900 \
-  --concurrency 80 \
+  --concurrency "$CONCURRENCY" \
   --max-instances 10 \
   --port 8080 \
   --project "$PROJECT_ID" \
-  --env-vars-file .env.yaml
+  --env-vars-file "$ENV_FILE"
 
 echo "✅ Deployment complete!"
 echo "🔗 Service URL: $(gcloud run services describe "$SERVICE_NAME" --region "$REGION" --project "$PROJECT_ID" --format 'value(status.url)')"
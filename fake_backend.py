@@ -0,0 +1,564 @@
+# fake_backend.py
+"""
+In-memory stand-ins for the service's remote dependencies, for benchmarks and
+local load tests that must not touch Firebase.
+
+    backend = FakeBackend(latency={"identitytoolkit": 0.02})
+    with backend.installed():
+        ...  # app.py now talks to the fakes
+
+FakeBackend bundles:
+    - FakeFirestore: the subset of google.cloud.firestore.Client the service uses
+      (documents, get_all, == queries ordered by id, conditional updates, BulkWriter)
+    - FakeAuth: create_user / get_user / get_user_by_email of firebase_admin.auth
+    - FakeIdentitySession: the identitytoolkit signInWithPassword endpoint
+
+Every call sleeps for the latency configured for its operation (seconds,
+plus up to `jitter` x that value), so threads overlap the way they do on real
+network I/O. Operations: firestore_read, firestore_write, firestore_query,
+auth, identitytoolkit.
+
+Run as a script to serve app.py on top of the fakes, as a local stand-in for
+the deployed service (state lives in memory and is lost on exit):
+    python fake_backend.py --port 8081 --latency-scale 0.5
+"""
+from google.cloud import firestore as firestore_client
+from google.cloud.firestore_v1.field_path import FieldPath
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+from firebase_admin import auth as firebase_auth
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+import argparse
+import copy
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+import logging
+
+# Configure logging for fake backend
+logger = logging.getLogger(__name__)
+
+DEFAULT_LATENCY = {
+    "firestore_read": 0.004,
+    "firestore_write": 0.008,
+    "firestore_query": 0.010,
+    "auth": 0.030,
+    "identitytoolkit": 0.050,
+}
+
+def parse_latency(values):
+    """Parse ["operation=milliseconds", ...] into {operation: seconds}"""
+    latency = {}
+    for value in values or []:
+        operation, sep, ms = value.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"Expected operation=milliseconds, got: {value}")
+        latency[operation.strip()] = float(ms) / 1000
+    return latency
+
+class Latency:
+    """Injected per-operation delay; `scale` multiplies every value (0 disables them)"""
+
+    def __init__(self, values=None, jitter=0.0, scale=1.0, seed=None):
+        self.values = dict(DEFAULT_LATENCY)
+        self.values.update(values or {})
+        self.jitter = jitter
+        self.scale = scale
+        self._random = random.Random(seed)
+
+    def wait(self, operation):
+        delay = self.values.get(operation, 0.0) * self.scale
+        if delay <= 0:
+            return
+        if self.jitter:
+            delay += delay * self.jitter * self._random.random()
+        time.sleep(delay)
+
+_versions = itertools.count(1)
+_epoch = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+def _next_update_time():
+    # Strictly increasing, so a conditional write can tell any two versions apart
+    return _epoch + timedelta(microseconds=next(_versions))
+
+def _resolve_value(value):
+    if value is firestore_client.SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    if isinstance(value, dict):
+        return {key: _resolve_value(item) for key, item in value.items()}
+    return value
+
+class FakeSnapshot:
+    def __init__(self, reference, data, update_time):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.update_time = update_time
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+class FakeWriteOption:
+    def __init__(self, last_update_time):
+        self.last_update_time = last_update_time
+
+class FakeDocumentReference:
+    def __init__(self, store, collection, document_id):
+        self._store = store
+        self._collection = collection
+        self.id = document_id
+        self.path = f"{collection}/{document_id}"
+
+    def get(self, field_paths=None, transaction=None):
+        self._store.latency.wait("firestore_read")
+        return self._store.snapshot(self, field_paths)
+
+    def set(self, document_data, merge=False):
+        self._store.latency.wait("firestore_write")
+        self._store.write(self, document_data, merge=merge)
+
+    def update(self, field_updates, option=None):
+        self._store.latency.wait("firestore_write")
+        self._store.update(self, field_updates, option)
+
+    def delete(self):
+        self._store.latency.wait("firestore_write")
+        self._store.delete(self)
+
+class FakeQuery:
+    def __init__(self, store, collection, filters=(), fields=None, after=None, limit_count=None):
+        self._store = store
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._fields = fields
+        self._after = after
+        self._limit = limit_count
+
+    def _copy(self, **changes):
+        values = {
+            "filters": self._filters,
+            "fields": self._fields,
+            "after": self._after,
+            "limit_count": self._limit
+        }
+        values.update(changes)
+        return FakeQuery(self._store, self._collection, **values)
+
+    def where(self, field_path, op_string, value):
+        if op_string != "==":
+            raise NotImplementedError(f"FakeQuery only supports == filters, not {op_string}")
+        return self._copy(filters=self._filters + ((field_path, value),))
+
+    def order_by(self, field_path, direction=None):
+        # Results are always ordered by document id, the only ordering the service uses
+        return self
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def start_after(self, document_fields):
+        if isinstance(document_fields, dict):
+            after = next(iter(document_fields.values()))
+        else:
+            after = document_fields.id
+        return self._copy(after=after)
+
+    def limit(self, count):
+        return self._copy(limit_count=count)
+
+    def stream(self, transaction=None):
+        self._store.latency.wait("firestore_query")
+        return iter(self._store.query(self._collection, self._filters, self._fields, self._after, self._limit))
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, store, collection):
+        super().__init__(store, collection)
+        self.id = collection
+
+    def document(self, document_id=None):
+        return FakeDocumentReference(self._store, self._collection, document_id or uuid.uuid4().hex[:20])
+
+class FakeBulkWriter:
+    """Buffers writes and applies them on flush/close, reporting each through the callbacks"""
+
+    def __init__(self, store):
+        self._store = store
+        self._operations = []
+        self._on_result = None
+        self._on_error = None
+
+    def on_write_result(self, callback):
+        self._on_result = callback
+
+    def on_write_error(self, callback):
+        self._on_error = callback
+
+    def set(self, reference, document_data, merge=False):
+        self._operations.append(("set", reference, document_data, merge))
+
+    def create(self, reference, document_data):
+        self._operations.append(("create", reference, document_data, None))
+
+    def update(self, reference, field_updates):
+        self._operations.append(("update", reference, field_updates, None))
+
+    def flush(self):
+        operations, self._operations = self._operations, []
+        if not operations:
+            return
+        # One batched round-trip for the whole flush
+        self._store.latency.wait("firestore_write")
+        for kind, reference, data, merge in operations:
+            try:
+                if kind == "set":
+                    self._store.write(reference, data, merge=merge)
+                elif kind == "create":
+                    self._store.create(reference, data)
+                else:
+                    self._store.update(reference, data)
+            except (NotFound, AlreadyExists) as e:
+                if self._on_error is not None:
+                    self._on_error(FakeBulkWriteFailure(reference, e), self)
+                continue
+            if self._on_result is not None:
+                self._on_result(reference, None, self)
+
+    def close(self):
+        self.flush()
+
+class FakeBulkWriteFailure:
+    def __init__(self, reference, error):
+        self.code = 6 if isinstance(error, AlreadyExists) else 5  # gRPC ALREADY_EXISTS / NOT_FOUND
+        self.operation = type("Operation", (), {"reference": reference})()
+        self.message = str(error)
+        self.attempts = 1
+
+class FakeFirestore:
+    """Thread-safe in-memory document store exposing the Client methods the service calls"""
+
+    def __init__(self, latency=None):
+        self.latency = latency or Latency()
+        self._collections = {}
+        self._lock = threading.Lock()
+        self.operations = {"read": 0, "write": 0, "query": 0}
+
+    def collection(self, name):
+        return FakeCollectionReference(self, name)
+
+    def write_option(self, last_update_time=None, exists=None):
+        return FakeWriteOption(last_update_time)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        self.latency.wait("firestore_read")
+        for reference in references:
+            yield self.snapshot(reference, field_paths)
+
+    def bulk_writer(self):
+        return FakeBulkWriter(self)
+
+    def close(self):
+        pass
+
+    # Store operations, shared by the reference/query/writer classes above
+
+    def snapshot(self, reference, field_paths=None):
+        with self._lock:
+            self.operations["read"] += 1
+            entry = self._collections.get(reference._collection, {}).get(reference.id)
+            if entry is None:
+                return FakeSnapshot(reference, None, None)
+            data, update_time = entry
+            if field_paths is not None:
+                data = {field: data[field] for field in field_paths if field in data}
+            return FakeSnapshot(reference, copy.deepcopy(data), update_time)
+
+    def write(self, reference, document_data, merge=False):
+        data = _resolve_value(copy.deepcopy(document_data))
+        with self._lock:
+            self.operations["write"] += 1
+            documents = self._collections.setdefault(reference._collection, {})
+            if merge and reference.id in documents:
+                current = documents[reference.id][0]
+                current.update(data)
+                data = current
+            documents[reference.id] = (data, _next_update_time())
+
+    def create(self, reference, document_data):
+        data = _resolve_value(copy.deepcopy(document_data))
+        with self._lock:
+            documents = self._collections.setdefault(reference._collection, {})
+            if reference.id in documents:
+                raise AlreadyExists(f"Document already exists: {reference.path}")
+            self.operations["write"] += 1
+            documents[reference.id] = (data, _next_update_time())
+
+    def update(self, reference, field_updates, option=None):
+        with self._lock:
+            self.operations["write"] += 1
+            documents = self._collections.get(reference._collection, {})
+            entry = documents.get(reference.id)
+            if entry is None:
+                raise NotFound(f"No document to update: {reference.path}")
+            data, update_time = entry
+            if option is not None and option.last_update_time is not None and option.last_update_time != update_time:
+                raise FailedPrecondition(f"Document {reference.path} was modified since {option.last_update_time}")
+
+            data = copy.deepcopy(data)
+            for field, value in field_updates.items():
+                parts = FieldPath.from_api_repr(field).parts
+                parent = data
+                for part in parts[:-1]:
+                    child = parent.get(part)
+                    if not isinstance(child, dict):
+                        child = parent[part] = {}
+                    parent = child
+                if value is firestore_client.DELETE_FIELD:
+                    parent.pop(parts[-1], None)
+                else:
+                    parent[parts[-1]] = _resolve_value(copy.deepcopy(value))
+            documents[reference.id] = (data, _next_update_time())
+
+    def delete(self, reference):
+        with self._lock:
+            self.operations["write"] += 1
+            self._collections.get(reference._collection, {}).pop(reference.id, None)
+
+    def query(self, collection, filters, fields, after, limit):
+        with self._lock:
+            self.operations["query"] += 1
+            documents = self._collections.get(collection, {})
+            results = []
+            for document_id in sorted(documents):
+                if after is not None and document_id <= after:
+                    continue
+                data, update_time = documents[document_id]
+                if any(data.get(field) != value for field, value in filters):
+                    continue
+                if fields:
+                    # Like Firestore: an empty projection returns every field, and "__name__" alone returns none
+                    data = {field: data[field] for field in fields if field in data}
+                results.append(FakeSnapshot(FakeDocumentReference(self, collection, document_id), copy.deepcopy(data), update_time))
+                if limit is not None and len(results) >= limit:
+                    break
+            return results
+
+    def document_count(self, collection):
+        with self._lock:
+            return len(self._collections.get(collection, {}))
+
+class FakeUserRecord:
+    def __init__(self, uid, email, password):
+        self.uid = uid
+        self.email = email
+        self.password = password
+        self.disabled = False
+
+class FakeAuth:
+    """Drop-in for the firebase_admin.auth module functions the service calls"""
+
+    # Real exception types, so `except auth.UserNotFoundError` keeps working
+    UserNotFoundError = firebase_auth.UserNotFoundError
+    EmailAlreadyExistsError = firebase_auth.EmailAlreadyExistsError
+
+    def __init__(self, latency=None):
+        self.latency = latency or Latency()
+        self._users = {}
+        self._by_email = {}
+        self._lock = threading.Lock()
+
+    def add_user(self, email, password, uid=None):
+        """Create a user without injected latency (for seeding)"""
+        email = email.lower()
+        with self._lock:
+            if email in self._by_email:
+                raise self.EmailAlreadyExistsError(f"The user with the provided email already exists ({email})", None, None)
+            user = FakeUserRecord(uid or uuid.uuid4().hex[:28], email, password)
+            self._users[user.uid] = user
+            self._by_email[email] = user
+            return user
+
+    def create_user(self, email=None, password=None, **kwargs):
+        self.latency.wait("auth")
+        return self.add_user(email, password)
+
+    def get_user(self, uid, app=None):
+        self.latency.wait("auth")
+        user = self._users.get(uid)
+        if user is None:
+            raise self.UserNotFoundError(f"No user record found for the provided user ID: {uid}")
+        return user
+
+    def get_user_by_email(self, email, app=None):
+        self.latency.wait("auth")
+        user = self._by_email.get((email or "").lower())
+        if user is None:
+            raise self.UserNotFoundError(f"No user record found for the provided email: {email}")
+        return user
+
+    def check_password(self, email, password):
+        """identitytoolkit error code for a sign-in attempt, or None if it succeeds"""
+        user = self._by_email.get((email or "").lower())
+        if user is None:
+            return None, "EMAIL_NOT_FOUND"
+        if user.disabled:
+            return None, "USER_DISABLED"
+        if user.password != password:
+            return None, "INVALID_PASSWORD"
+        return user, None
+
+class FakeResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self._data = data
+
+    def json(self):
+        return self._data
+
+class FakeIdentitySession:
+    """Stands in for the pooled requests.Session used for signInWithPassword"""
+
+    def __init__(self, auth, latency=None):
+        self.auth = auth
+        self.latency = latency or Latency()
+        self.calls = 0
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        self.latency.wait("identitytoolkit")
+        self.calls += 1
+        payload = json or {}
+        user, error = self.auth.check_password(payload.get("email"), payload.get("password"))
+        if error is not None:
+            return FakeResponse(400, {"error": {"code": 400, "message": error}})
+        return FakeResponse(200, {
+            "localId": user.uid,
+            "email": user.email,
+            "idToken": f"fake-id-token-{user.uid}",
+            "registered": True
+        })
+
+    def close(self):
+        pass
+
+class FakeBackend:
+    """The three fakes sharing one latency model, plus wiring into the service modules"""
+
+    def __init__(self, latency=None, jitter=0.0, scale=1.0, seed=None):
+        self.latency = latency if isinstance(latency, Latency) else Latency(latency, jitter, scale, seed)
+        self.firestore = FakeFirestore(self.latency)
+        self.auth = FakeAuth(self.latency)
+        self.identity = FakeIdentitySession(self.auth, self.latency)
+
+    def seed_users(self, app_id, count, password="Password123!", email_format="user{index}@{app_id}.example.com"):
+        """Create `count` users with profiles in `app_id`; returns [(uid, email, password)]"""
+        from auth_simple import build_user_profile
+        users = []
+        profiles = self.firestore.collection("users")
+        for index in range(count):
+            email = email_format.format(index=index, app_id=app_id)
+            user = self.auth.add_user(email, password)
+            self.firestore.write(profiles.document(user.uid), build_user_profile(user.uid, email, app_id))
+            users.append((user.uid, email, password))
+        return users
+
+    def install(self):
+        """Point the service at the fakes; returns a function that undoes it"""
+        import auth_simple
+        import auth_utils
+        import firebase_init
+        import firestore_registry
+        from config import Config
+
+        project = Config.FIRESTORE_PROJECT_ID
+        saved = {
+            "auth": auth_simple.auth,
+            "client": firestore_registry._clients.get(project),
+            "app": firebase_init._app,
+            "session": (auth_utils._session, auth_utils._session_pid),
+            "api_key": os.environ.get("FIREBASE_API_KEY")
+        }
+
+        auth_simple.auth = self.auth
+        firestore_registry._clients[project] = self.firestore
+        # Any non-None app makes get_firebase_app() a no-op
+        firebase_init._app = self
+        auth_utils._session, auth_utils._session_pid = self.identity, os.getpid()
+        # Without an API key login falls back to a user lookup that skips the password check
+        os.environ["FIREBASE_API_KEY"] = saved["api_key"] or "fake-api-key"
+        logger.info(f"Fake backend installed for project: {project}")
+
+        def uninstall():
+            # Buffered lastActiveTimestamp writes belong to the fake store
+            from activity_writer import activity_writer
+            activity_writer.flush()
+            auth_simple.auth = saved["auth"]
+            if saved["client"] is None:
+                firestore_registry._clients.pop(project, None)
+            else:
+                firestore_registry._clients[project] = saved["client"]
+            firebase_init._app = saved["app"]
+            auth_utils._session, auth_utils._session_pid = saved["session"]
+            if saved["api_key"] is None:
+                os.environ.pop("FIREBASE_API_KEY", None)
+            logger.info("Fake backend uninstalled")
+
+        return uninstall
+
+    @contextmanager
+    def installed(self):
+        uninstall = self.install()
+        try:
+            yield self
+        finally:
+            uninstall()
+
+def make_wsgi_server(app, host="127.0.0.1", port=0):
+    """Threaded werkzeug server with HTTP/1.1 keep-alive; port 0 picks a free port"""
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class KeepAliveHandler(WSGIRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+    return make_server(host, port, app, threaded=True, request_handler=KeepAliveHandler)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the Flask app backed by in-memory Firebase fakes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", action="append", metavar="OPERATION=MS", help="Override an injected latency")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiply every injected latency (0 disables them)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("FIREBASE_INIT_MODE", "lazy")
+    from app import app
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    backend = FakeBackend(parse_latency(args.latency_ms), jitter=args.jitter, scale=args.latency_scale)
+    with backend.installed():
+        server = make_wsgi_server(app, args.host, args.port)
+        print(f"Stand-in service listening on http://{args.host}:{server.server_port}", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
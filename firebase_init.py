@@ -1,82 +1,99 @@
 # firebase_init.py
-from firebase_admin import credentials, initialize_app, storage, firestore
+from config import Config
+from credentials_provider import resolve_credentials
 import logging
 import os
-from pathlib import Path
+import threading
+import time
 
 # Configure logging for Firebase module
 logger = logging.getLogger(__name__)
 
-def initialize_firebase():
-    """Initialize Firebase with credentials if not already initialized"""
-    logger.info("Starting Firebase initialization")
+DEFAULT_STORAGE_BUCKET = "readrocket-a9268.firebasestorage.app"
+
+# The default firebase_admin App, created on first use (see get_firebase_app)
+_app = None
+_init_lock = threading.Lock()
+
+def _reset_after_fork():
+    """Forget an app inherited from a preloaded parent; the child initializes its own"""
+    global _app, _init_lock
+    inherited = _app
+    _app = None
+    _init_lock = threading.Lock()
+    if inherited is not None:
+        import firebase_admin
+        try:
+            firebase_admin.delete_app(inherited)
+        except ValueError:
+            pass
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def get_firebase_app():
+    """
+    Return the default Firebase app, initializing it on first call.
+    Thread-safe: concurrent first callers wait for a single initialization.
+    """
+    global _app
+    if _app is not None:
+        return _app
     
-    try:
-        # Try to get an existing app
-        logger.info("Checking for existing Firebase app")
-        storage.bucket()
-        logger.info("Firebase app already initialized - reusing existing connection")
-        return storage, firestore.client()
-        
-    except ValueError:
-        logger.info("No existing Firebase app found - initializing new app")
-        
-        # Initialize new app if none exists
-        # Get absolute path to service account file for local development
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        service_account_path = os.path.join(current_dir, "rrkt-firebase-adminsdk.json")
+    with _init_lock:
+        if _app is not None:
+            return _app
         
-        logger.info(f"Checking environment: GOOGLE_CLOUD_PROJECT={os.getenv('GOOGLE_CLOUD_PROJECT')}")
+        import firebase_admin
+        try:
+            # Reuse an app initialized elsewhere in the process
+            _app = firebase_admin.get_app()
+            logger.info("Firebase app already initialized - reusing existing app")
+            return _app
+        except ValueError:
+            pass
         
-        # Determine credential source based on environment
-        if os.getenv('GOOGLE_CLOUD_PROJECT'):
-            # Running in Google Cloud - use service account from Secret Manager
-            logger.info("Running in Google Cloud - retrieving service account from Secret Manager")
-            try:
-                from google.cloud import secretmanager
-                client = secretmanager.SecretManagerServiceClient()
-                project_id = os.getenv('GOOGLE_CLOUD_PROJECT')
-                secret_name = f"projects/{project_id}/secrets/rrkt-firebase-adminsdk/versions/latest"
-                response = client.access_secret_version(request={"name": secret_name})
-                secret_payload = response.payload.data.decode("UTF-8")
-                
-                import json
-                cred_dict = json.loads(secret_payload)
-                cred = credentials.Certificate(cred_dict)
-                logger.info("Successfully loaded service account from Secret Manager")
-            except Exception as secret_error:
-                logger.warning(f"Failed to load from Secret Manager: {secret_error}")
-                logger.info("Falling back to default application credentials")
-                cred = credentials.ApplicationDefault()
-        elif os.path.exists(service_account_path):
-            # Local development - use service account file
-            logger.info(f"Local development - using service account file: {service_account_path}")
-            cred = credentials.Certificate(service_account_path)
-        elif os.getenv('FIREBASE_CREDENTIALS_PATH'):
-            # Use path from environment variable
-            cred_path = os.getenv("FIREBASE_CREDENTIALS_PATH")
-            logger.info(f"Using service account from environment path: {cred_path}")
-            cred = credentials.Certificate(cred_path)
-        elif os.getenv('GOOGLE_APPLICATION_CREDENTIALS_JSON'):
-            # For services like Heroku where we pass JSON as env var
-            logger.info("Using service account from environment JSON")
-            import json
-            cred_dict = json.loads(os.getenv('GOOGLE_APPLICATION_CREDENTIALS_JSON'))
-            cred = credentials.Certificate(cred_dict)
-        else:
-            # Fallback to default credentials
-            logger.info("Using default application credentials as fallback")
-            cred = credentials.ApplicationDefault()
+        logger.info("Starting Firebase initialization")
+        start = time.perf_counter()
+        try:
+            cred = resolve_credentials()
+            bucket = os.getenv("FIREBASE_STORAGE_BUCKET") or DEFAULT_STORAGE_BUCKET
+            logger.info(f"Initializing Firebase app with storage bucket: {bucket}")
+            _app = firebase_admin.initialize_app(cred, {
+                'storageBucket': bucket
+            })
+        except Exception as e:
+            logger.error(f"Failed to initialize Firebase: {e}", exc_info=True)
+            raise
         
-        # Initialize Firebase app
-        logger.info("Initializing Firebase app with storage bucket: readrocket-a9268.firebasestorage.app")
-        initialize_app(cred, {
-            'storageBucket': 'readrocket-a9268.firebasestorage.app'
-        })
-        
-        logger.info("Firebase initialized successfully")
-        return storage, firestore.client()
-        
-    except Exception as e:
-        logger.error(f"Failed to initialize Firebase: {e}", exc_info=True)
-        raise
\ No newline at end of file
+        logger.info(f"Firebase initialized successfully in {(time.perf_counter() - start) * 1000:.1f}ms")
+        return _app
+
+def initialize_firebase():
+    """Initialize Firebase if needed and return (storage module, Firestore client)"""
+    get_firebase_app()
+    from firebase_admin import storage, firestore
+    return storage, firestore.client()
+
+def initialize_firebase_in_background():
+    """Start initialization on a daemon thread so it overlaps with serving; callers still block in get_firebase_app until it is done"""
+    def run():
+        try:
+            get_firebase_app()
+        except Exception:
+            # Already logged; the next get_firebase_app call retries
+            pass
+    
+    thread = threading.Thread(target=run, name="firebase-init", daemon=True)
+    thread.start()
+    return thread
+
+def start_firebase(mode=None):
+    """Apply FIREBASE_INIT_MODE at startup: lazy (first use), background, or eager"""
+    mode = (mode or Config.FIREBASE_INIT_MODE).lower()
+    if mode == "eager":
+        get_firebase_app()
+    elif mode == "background":
+        initialize_firebase_in_background()
+    else:
+        logger.info("Firebase initialization deferred until first use")
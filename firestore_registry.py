@@ -0,0 +1,97 @@
+# firestore_registry.py
+from google.cloud import firestore as firestore_client
+from config import Config
+from request_timing import timed
+import asyncio
+import os
+import threading
+import logging
+
+# Configure logging for Firestore client registry
+logger = logging.getLogger(__name__)
+
+# One long-lived client (and its gRPC channel pool) per project, per worker process
+_clients = {}
+_async_clients = {}
+_clients_lock = threading.Lock()
+_owner_pid = os.getpid()
+
+def _reset_after_fork():
+    """Drop clients inherited from the parent process.
+
+    gRPC channels are not fork-safe, so a worker forked from a preloaded
+    gunicorn master must build its own client on first use.
+    """
+    global _clients, _async_clients, _clients_lock, _owner_pid
+    _clients = {}
+    _async_clients = {}
+    _clients_lock = threading.Lock()
+    _owner_pid = os.getpid()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def get_firestore_client(project=None):
+    """Return the shared Firestore client for a project, creating it on first use"""
+    project = project or Config.FIRESTORE_PROJECT_ID
+
+    # Fallback for platforms without register_at_fork
+    if os.getpid() != _owner_pid:
+        _reset_after_fork()
+
+    client = _clients.get(project)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(project)
+        if client is None:
+            logger.info(f"Creating pooled Firestore client for project: {project} (pid {os.getpid()})")
+            with timed("firestore_client_init"):
+                client = firestore_client.Client(project=project)
+            _clients[project] = client
+    return client
+
+def get_async_firestore_client(project=None):
+    """Return the shared AsyncClient for a project on the running event loop"""
+    project = project or Config.FIRESTORE_PROJECT_ID
+
+    if os.getpid() != _owner_pid:
+        _reset_after_fork()
+
+    # Async gRPC channels are bound to the loop they were created on
+    loop = asyncio.get_running_loop()
+    entry = _async_clients.get(project)
+    if entry is not None and entry[0] is loop:
+        return entry[1]
+
+    logger.info(f"Creating pooled async Firestore client for project: {project} (pid {os.getpid()})")
+    with timed("firestore_client_init"):
+        client = firestore_client.AsyncClient(project=project)
+    _async_clients[project] = (loop, client)
+    return client
+
+def close_async_firestore_clients():
+    """Close every async client owned by this process (used on ASGI shutdown)"""
+    clients = list(_async_clients.items())
+    _async_clients.clear()
+
+    for project, (_, client) in clients:
+        try:
+            client.close()
+            logger.info(f"Closed async Firestore client for project: {project}")
+        except Exception as e:
+            logger.warning(f"Failed to close async Firestore client for project {project}: {e}")
+
+def close_firestore_clients():
+    """Close every client owned by this process (used on worker shutdown)"""
+    with _clients_lock:
+        clients = list(_clients.items())
+        _clients.clear()
+
+    for project, client in clients:
+        try:
+            client.close()
+            logger.info(f"Closed Firestore client for project: {project}")
+        except Exception as e:
+            logger.warning(f"Failed to close Firestore client for project {project}: {e}")
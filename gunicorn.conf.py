@@ -0,0 +1,88 @@
+# gunicorn.conf.py
+"""
+Production gunicorn settings for Cloud Run.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+Every setting can be overridden with the GUNICORN_* environment variables below.
+"""
+import math
+import os
+
+def cpu_quota():
+    """CPUs available to this container: the cgroup CPU quota if set, else the affinity mask"""
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(int(quota) / int(period), 0.1)
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0:
+            return max(quota / period, 0.1)
+    except (OSError, ValueError):
+        pass
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+
+# gthread (default) or gevent; gevent must be installed separately (pip install gevent)
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+
+# One process per CPU; requests in a worker overlap on threads/greenlets while they wait on Firebase
+workers = int(os.getenv("GUNICORN_WORKERS", "0")) or max(1, math.ceil(cpu_quota() * float(os.getenv("GUNICORN_WORKERS_PER_CPU", "1"))))
+# Requests Cloud Run sends one instance at a time (deploy.sh passes the same CONCURRENCY to
+# --concurrency); by default the workers get enough threads between them to run all of them
+concurrency = int(os.getenv("CONCURRENCY", "80"))
+threads = int(os.getenv("GUNICORN_THREADS", "0")) or max(1, math.ceil(concurrency / workers))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "100"))
+
+# Import the app once in the master and fork workers from it (shared pages, faster worker start).
+# gevent has to monkey-patch before the app is imported, so preload defaults off for it.
+preload_app = os.getenv("GUNICORN_PRELOAD", "false" if worker_class == "gevent" else "true").lower() == "true"
+
+# Cloud Run enforces the request timeout itself; 0 disables gunicorn's worker timeout so
+# long requests are not killed twice. Cloud Run sends SIGTERM and waits 10s before SIGKILL,
+# so workers get 8s to finish in-flight requests and flush buffered writes.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "0"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "8"))
+# Longer than the Google front end's 600s idle timeout, so it never reuses a closed connection
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "620"))
+
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+# Application logging is configured by logging_config; gunicorn's access log would duplicate it
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+def when_ready(server):
+    server.log.info(f"Serving with {workers} {worker_class} worker(s), threads={threads}, concurrency={concurrency}, preload={preload_app}, cpu quota={cpu_quota()}")
+
+def post_fork(server, worker):
+    # Clients holding sockets or threads (Firestore, identitytoolkit session, log listener,
+    # activity writer) reset themselves via os.register_at_fork; this starts per-worker state.
+    if preload_app:
+        from main import on_worker_start
+        on_worker_start()
+
+def post_worker_init(worker):
+    # Without preload the worker imported the app itself, which already ran its startup
+    if worker_class == "gevent":
+        # gRPC must run on gevent's loop once the worker has monkey-patched the stdlib
+        import grpc.experimental.gevent as grpc_gevent
+        grpc_gevent.init_gevent()
+
+def worker_exit(server, worker):
+    from main import on_worker_exit
+    on_worker_exit()
@@ -0,0 +1,315 @@
+# loadgen.py
+"""
+Open-loop load generator for the user service.
+
+Setup registers --users-per-app synthetic users for every allowed app_id
+(Config.ALLOWED_APP_IDS unless --app-ids is given) and logs each one in.
+Traffic then starts requests at --rps for --duration seconds whether or not
+earlier ones have finished (open loop), picking the endpoint from --mix:
+    login           POST /user/login
+    profile_get     GET /user/profile/<uid>
+    profile_update  PUT (or --update-method PATCH) /user/profile/<uid>
+
+Latency is measured from each request's scheduled start, so time spent
+queued behind a slow server counts (no coordinated omission). The report
+has per-endpoint percentiles, a latency histogram and an error breakdown.
+
+Registration creates real users, so point it at a staging deployment, or use
+--local to start fake_backend.py (the app on in-memory Firebase fakes) on a
+free localhost port.
+
+Usage:
+    python loadgen.py --local --rps 100 --duration 30
+    python loadgen.py --base-url https://staging.example.run.app --users-per-app 20 --mix login=1,profile_get=8,profile_update=1
+"""
+from benchmark import percentile
+from config import Config
+from collections import Counter
+from dataclasses import dataclass
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+ENDPOINTS = ("login", "profile_get", "profile_update")
+DEFAULT_MIX = "login=1,profile_get=8,profile_update=1"
+# Histogram bucket upper bounds in ms
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, float("inf"))
+PASSWORD = "LoadTest123!"
+
+@dataclass
+class SyntheticUser:
+    app_id: str
+    email: str
+    uid: str
+    token: str
+
+class EndpointStats:
+    """Latencies (seconds) and error counts for one endpoint"""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = Counter()
+
+    def record(self, latency, error=None):
+        if latency is not None:
+            self.latencies.append(latency)
+        if error is not None:
+            self.errors[error] += 1
+
+    def summary(self, elapsed=None):
+        ordered = sorted(self.latencies)
+        failed = sum(self.errors.values())
+        summary = {
+            "requests": len(ordered) + self.errors.get("client_overloaded", 0),
+            "ok": len(ordered) - (failed - self.errors.get("client_overloaded", 0)),
+            "errors": dict(self.errors.most_common()),
+            "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+            "p90_ms": round(percentile(ordered, 0.90) * 1000, 2),
+            "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+            "max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+            "histogram_ms": histogram(ordered)
+        }
+        if elapsed:
+            summary["rps"] = round(len(ordered) / elapsed, 1)
+        return summary
+
+def histogram(sorted_latencies):
+    """[(bucket upper bound in ms, count)] for the non-empty range of buckets"""
+    counts = [0] * len(BUCKETS_MS)
+    bucket = 0
+    for latency in sorted_latencies:
+        ms = latency * 1000
+        while ms > BUCKETS_MS[bucket]:
+            bucket += 1
+        counts[bucket] += 1
+    used = [index for index, count in enumerate(counts) if count]
+    if not used:
+        return []
+    return [(BUCKETS_MS[index], counts[index]) for index in range(used[0], used[-1] + 1)]
+
+def parse_mix(value):
+    mix = {}
+    for entry in value.split(","):
+        name, sep, weight = entry.partition("=")
+        name = name.strip()
+        if not sep or name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Expected endpoint=weight with endpoint in {', '.join(ENDPOINTS)}, got: {entry}")
+        mix[name] = float(weight)
+    if not any(weight > 0 for weight in mix.values()):
+        raise argparse.ArgumentTypeError("At least one endpoint needs a positive weight")
+    return mix
+
+def error_label(response):
+    """Status code plus the service's error message, truncated to keep the breakdown readable"""
+    try:
+        message = response.json().get("error", "")
+    except ValueError:
+        message = response.text
+    return f"{response.status_code} {str(message)[:80]}".strip()
+
+async def call(client, stats, method, path, started=None, **kwargs):
+    """Send one request and record it; returns the JSON body on success, else None"""
+    started = started if started is not None else time.perf_counter()
+    try:
+        response = await client.request(method, path, **kwargs)
+    except httpx.HTTPError as e:
+        stats.record(time.perf_counter() - started, type(e).__name__)
+        return None
+    latency = time.perf_counter() - started
+    if response.status_code >= 400:
+        stats.record(latency, error_label(response))
+        return None
+    stats.record(latency)
+    return response.json()
+
+async def setup_users(client, app_ids, per_app, concurrency, stats):
+    """Register and log in per_app users for every app_id"""
+    run_id = uuid.uuid4().hex[:8]
+    semaphore = asyncio.Semaphore(concurrency)
+    users = []
+
+    async def create(app_id, index):
+        email = f"loadgen-{run_id}-{index}@{app_id}.example.com"
+        async with semaphore:
+            created = await call(client, stats["register"], "POST", "/user/register",
+                                 json={"email": email, "password": PASSWORD, "app_id": app_id})
+            if created is None:
+                return
+            session = await call(client, stats["login"], "POST", "/user/login",
+                                 json={"email": email, "password": PASSWORD, "app_id": app_id})
+            if session is not None:
+                users.append(SyntheticUser(app_id, email, session["user_id"], session["token"]))
+
+    await asyncio.gather(*(create(app_id, index) for app_id in app_ids for index in range(per_app)))
+    return users
+
+async def send(client, endpoint, user, scheduled, stats, update_method, rng):
+    if endpoint == "login":
+        session = await call(client, stats, "POST", "/user/login", scheduled,
+                             json={"email": user.email, "password": PASSWORD, "app_id": user.app_id})
+        if session is not None:
+            user.token = session["token"]
+        return
+
+    headers = {"Authorization": f"Bearer {user.token}", "X-App-ID": user.app_id}
+    if endpoint == "profile_get":
+        await call(client, stats, "GET", f"/user/profile/{user.uid}", scheduled, headers=headers)
+    else:
+        preferences = {"modification_mode": rng.choice(("suggestion", "rewrite")), "theme": rng.choice(("light", "dark"))}
+        await call(client, stats, update_method, f"/user/profile/{user.uid}", scheduled,
+                   headers=headers, json={"preferences": preferences})
+
+async def run_traffic(client, users, args, stats):
+    """Start requests on schedule regardless of completions; returns the elapsed seconds"""
+    rng = random.Random(args.seed)
+    endpoints = [name for name, weight in args.mix.items() if weight > 0]
+    weights = [args.mix[name] for name in endpoints]
+    total = int(args.rps * args.duration)
+    in_flight = set()
+
+    started = time.perf_counter()
+    scheduled = started
+    for index in range(total):
+        if args.arrivals == "poisson":
+            scheduled += rng.expovariate(args.rps)
+        else:
+            scheduled = started + index / args.rps
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        endpoint = rng.choices(endpoints, weights)[0]
+        if len(in_flight) >= args.max_in_flight:
+            # Skipped, not queued: the client is the bottleneck and the schedule must hold
+            stats[endpoint].record(None, "client_overloaded")
+            continue
+        task = asyncio.create_task(send(client, endpoint, rng.choice(users), scheduled, stats[endpoint], args.update_method, rng))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+    if in_flight:
+        await asyncio.gather(*in_flight)
+    return time.perf_counter() - started
+
+def print_stats(title, stats, elapsed=None):
+    print(f"\n== {title} ==")
+    for endpoint, endpoint_stats in stats.items():
+        summary = endpoint_stats.summary(elapsed)
+        if not summary["requests"]:
+            continue
+        rate = f", {summary['rps']} rps" if "rps" in summary else ""
+        print(f"\n{endpoint}: {summary['requests']} requests, {summary['ok']} ok{rate}; "
+              f"p50 {summary['p50_ms']}ms, p90 {summary['p90_ms']}ms, p99 {summary['p99_ms']}ms, max {summary['max_ms']}ms")
+        peak = max((count for _, count in summary["histogram_ms"]), default=0)
+        for bound, count in summary["histogram_ms"]:
+            label = f"<= {bound:g}ms" if bound != float("inf") else f"> {BUCKETS_MS[-2]:g}ms"
+            bar = "#" * (round(40 * count / peak) if peak else 0)
+            print(f"  {label:>11} | {bar:<40} {count}")
+        for error, count in summary["errors"].items():
+            print(f"  error x{count}: {error}")
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_standin(latency_scale):
+    """Run fake_backend.py in a subprocess; returns (process, base_url)"""
+    port = free_port()
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_backend.py")
+    process = subprocess.Popen(
+        [sys.executable, script, "--port", str(port), "--latency-scale", str(latency_scale)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Stand-in server exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Stand-in server did not become healthy within 60s")
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        setup_stats = {"register": EndpointStats(), "login": EndpointStats()}
+        setup_started = time.perf_counter()
+        users = await setup_users(client, args.app_ids, args.users_per_app, args.setup_concurrency, setup_stats)
+        setup_elapsed = time.perf_counter() - setup_started
+        print_stats(f"Setup: {len(users)} users across {len(args.app_ids)} app(s) in {setup_elapsed:.1f}s", setup_stats)
+        if not users:
+            print("\nNo users could be registered and logged in; skipping traffic")
+            return {"setup": {name: s.summary() for name, s in setup_stats.items()}, "traffic": {}}, 1
+
+        traffic_stats = {name: EndpointStats() for name in ENDPOINTS}
+        elapsed = await run_traffic(client, users, args, traffic_stats)
+        completed = sum(len(s.latencies) for s in traffic_stats.values())
+        print_stats(f"Traffic: target {args.rps:g} rps for {args.duration:g}s, achieved {completed / elapsed:.1f} rps", traffic_stats, elapsed)
+
+    report = {
+        "base_url": args.base_url,
+        "target_rps": args.rps,
+        "achieved_rps": round(completed / elapsed, 1),
+        "duration_s": round(elapsed, 2),
+        "setup": {name: s.summary() for name, s in setup_stats.items()},
+        "traffic": {name: s.summary(elapsed) for name, s in traffic_stats.items()}
+    }
+    failed = sum(sum(s.errors.values()) for s in traffic_stats.values())
+    return report, 1 if failed else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Open-loop load generator for the user service")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8080")
+    parser.add_argument("--local", action="store_true", help="Start fake_backend.py on a free port and target it")
+    parser.add_argument("--standin-latency-scale", type=float, default=1.0, help="Latency scale for the --local stand-in")
+    parser.add_argument("--app-ids", help="Comma-separated app_ids (default: Config.ALLOWED_APP_IDS)")
+    parser.add_argument("--users-per-app", type=int, default=10)
+    parser.add_argument("--setup-concurrency", type=int, default=10)
+    parser.add_argument("--rps", type=float, default=50.0, help="Target request starts per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of traffic")
+    parser.add_argument("--arrivals", choices=("uniform", "poisson"), default="uniform")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"Endpoint weights (default {DEFAULT_MIX})")
+    parser.add_argument("--update-method", choices=("PUT", "PATCH"), default="PUT")
+    parser.add_argument("--max-in-flight", type=int, default=500, help="Requests allowed in flight before new ones are skipped")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, help="Seed for endpoint and user selection")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    if args.rps <= 0 or args.duration <= 0:
+        parser.error("--rps and --duration must be positive")
+    args.app_ids = [app_id.strip() for app_id in args.app_ids.split(",") if app_id.strip()] if args.app_ids else Config.get_allowed_app_ids()
+
+    standin = None
+    if args.local:
+        standin, args.base_url = start_standin(args.standin_latency_scale)
+        print(f"Started local stand-in at {args.base_url}")
+    try:
+        report, status = asyncio.run(run(args))
+    finally:
+        if standin is not None:
+            standin.terminate()
+            standin.wait(10)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
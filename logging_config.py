@@ -1,10 +1,221 @@
 # logging_config.py
 import logging
 import logging.handlers
+import atexit
+import json
 import os
+import queue
+import random
 import sys
+import threading
+import time
 from datetime import datetime, timezone
 
+try:
+    import orjson  # Optional: faster JSON encoding for LOG_FORMAT=json
+except ImportError:
+    orjson = None
+
+def _json_default(value):
+    return str(value)
+
+def _dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default).decode("utf-8")
+    return json.dumps(payload, default=_json_default, separators=(",", ":"))
+
+class CloudLoggingJSONFormatter(logging.Formatter):
+    """
+    One JSON object per line in the shape Cloud Logging parses from stdout:
+    severity, message, timestamp and source location as special fields, plus
+    any dict passed as extra={"json_fields": {...}} merged at the top level.
+    """
+    
+    def format(self, record):
+        seconds = int(record.created)
+        payload = dict(getattr(record, "json_fields", None) or {})
+        payload.update({
+            "severity": record.levelname,
+            "message": record.getMessage(),
+            "logger": record.name,
+            "timestamp": {"seconds": seconds, "nanos": int((record.created - seconds) * 1e9)},
+            "logging.googleapis.com/sourceLocation": {
+                "file": record.filename,
+                "line": record.lineno,
+                "function": record.funcName
+            }
+        })
+        if record.exc_info:
+            # Cloud Error Reporting reads the stack trace from the message
+            payload["message"] = f"{payload['message']}\n{self.formatException(record.exc_info)}"
+        return _dumps(payload)
+
+class TokenBucket:
+    """Token bucket allowing `rate` records per second with bursts up to `burst`"""
+    
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def allow(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+class SamplingFilter(logging.Filter):
+    """
+    Probabilistic sampling plus token-bucket rate limiting for hot-path INFO/DEBUG
+    logs, configured per logger name (a rule also covers that logger's children).
+    WARNING and above, and the 'security' logger, always pass.
+    """
+    
+    NEVER_SAMPLED = ("security",)
+    
+    def __init__(self, rules, invalid_entries=()):
+        super().__init__()
+        # rules: {logger_name: (sample_rate, TokenBucket or None)}
+        self.rules = rules
+        # Spec entries from_spec skipped; setup_logging reports them once handlers exist
+        self.invalid_entries = list(invalid_entries)
+        self.suppressed = {}
+        self._resolved = {}
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_spec(cls, spec):
+        """Parse "request_context=0.1,performance=1:20/s,auth_simple=0.05:5/s" """
+        rules = {}
+        invalid_entries = []
+        for entry in spec.split(","):
+            entry = entry.strip()
+            if not entry:
+                continue
+            name, _, setting = entry.partition("=")
+            rate_part, _, limit_part = setting.partition(":")
+            try:
+                sample_rate = float(rate_part) if rate_part else 1.0
+                bucket = TokenBucket(float(limit_part.strip().rstrip("/s"))) if limit_part else None
+            except ValueError:
+                invalid_entries.append(entry)
+                continue
+            rules[name.strip()] = (min(max(sample_rate, 0.0), 1.0), bucket)
+        return cls(rules, invalid_entries)
+    
+    def _rule_for(self, name):
+        rule = self._resolved.get(name, False)
+        if rule is False:
+            rule = None
+            candidate = name
+            while candidate:
+                if candidate in self.rules:
+                    rule = self.rules[candidate]
+                    break
+                candidate = candidate.rpartition(".")[0]
+            self._resolved[name] = rule
+        return rule
+    
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or record.name in self.NEVER_SAMPLED:
+            return True
+        
+        # The filter sits on every root handler; decide once per record so they agree
+        decision = getattr(record, "_sampling_decision", None)
+        if decision is not None:
+            return decision
+        
+        decision = True
+        rule = self._rule_for(record.name)
+        if rule is not None:
+            sample_rate, bucket = rule
+            if (sample_rate < 1.0 and random.random() >= sample_rate) or (bucket is not None and not bucket.allow()):
+                decision = False
+                with self._lock:
+                    self.suppressed[record.name] = self.suppressed.get(record.name, 0) + 1
+        
+        record._sampling_decision = decision
+        return decision
+
+# Active sampling filter when LOG_SAMPLING is set
+_sampling_filter = None
+
+# True when LOG_FORMAT=json: helpers pass dicts as extra instead of rendering them
+_structured = False
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that only enqueues records; formatting and I/O happen on the
+    QueueListener thread. When the queue is full, records are dropped (policy
+    "drop") or the caller waits up to block_timeout seconds (policy "block").
+    """
+    
+    def __init__(self, log_queue, policy="drop", block_timeout=1.0):
+        super().__init__(log_queue)
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+    
+    def prepare(self, record):
+        # Skip the base class's eager format(): the listener's handlers format the record
+        return record
+    
+    def enqueue(self, record):
+        try:
+            if self.policy == "block":
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+# Active queue handler/listener when asynchronous logging is enabled
+_queue_handler = None
+_queue_listener = None
+
+def _stop_queue_listener():
+    global _queue_listener
+    if _queue_listener is not None:
+        _queue_listener.stop()  # Drains records already queued
+        _queue_listener = None
+
+def _restart_queue_listener_after_fork():
+    """The listener thread does not survive fork(); give the child a fresh queue and thread"""
+    if _queue_listener is None:
+        return
+    fresh_queue = queue.Queue(maxsize=_queue_handler.queue.maxsize)
+    _queue_handler.queue = fresh_queue
+    _queue_handler.dropped = 0
+    _queue_handler._dropped_lock = threading.Lock()
+    _queue_listener.queue = fresh_queue
+    _queue_listener._thread = None
+    _queue_listener.start()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_queue_listener_after_fork)
+
+def get_logging_stats():
+    """Queue depth, dropped-record and suppressed-record counters for the logging pipeline"""
+    stats = {"async": _queue_handler is not None}
+    if _queue_handler is not None:
+        stats.update({
+            "policy": _queue_handler.policy,
+            "queue_depth": _queue_handler.queue.qsize(),
+            "queue_capacity": _queue_handler.queue.maxsize,
+            "dropped": _queue_handler.dropped
+        })
+    if _sampling_filter is not None:
+        stats["suppressed"] = dict(_sampling_filter.suppressed)
+    return stats
+
 def setup_logging(app_name="user-service", log_level=None):
     """
     Set up comprehensive logging configuration for the application
@@ -18,10 +229,15 @@ def setup_logging(app_name="user-service", log_level=None):
     numeric_level = getattr(logging, log_level, logging.INFO)
     
     # Create formatter
-    formatter = logging.Formatter(
-        fmt='%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
+    global _structured
+    _structured = os.getenv("LOG_FORMAT", "text").lower() == "json"
+    if _structured:
+        formatter = CloudLoggingJSONFormatter()
+    else:
+        formatter = logging.Formatter(
+            fmt='%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
     
     # Configure root logger
     root_logger = logging.getLogger()
@@ -30,12 +246,15 @@ def setup_logging(app_name="user-service", log_level=None):
     # Clear any existing handlers
     for handler in root_logger.handlers[:]:
         root_logger.removeHandler(handler)
+    _stop_queue_listener()
+    
+    handlers = []
     
     # Console handler (always present)
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(numeric_level)
     console_handler.setFormatter(formatter)
-    root_logger.addHandler(console_handler)
+    handlers.append(console_handler)
     
     # File handler (only in development or when explicitly enabled)
     if not os.getenv('GOOGLE_CLOUD_PROJECT') or os.getenv('ENABLE_FILE_LOGGING', 'false').lower() == 'true':
@@ -47,10 +266,35 @@ def setup_logging(app_name="user-service", log_level=None):
         )
         file_handler.setLevel(numeric_level)
         file_handler.setFormatter(formatter)
-        root_logger.addHandler(file_handler)
+        handlers.append(file_handler)
         
         print(f"Logging to file: {log_file}")
     
+    # Sampling/rate limiting for chatty INFO loggers, applied before records reach any handler
+    global _sampling_filter
+    sampling_spec = os.getenv("LOG_SAMPLING", "")
+    _sampling_filter = SamplingFilter.from_spec(sampling_spec) if sampling_spec else None
+    
+    # Asynchronous mode: request threads only enqueue, a background listener does the I/O
+    global _queue_handler, _queue_listener
+    if os.getenv("LOG_ASYNC", "false").lower() == "true":
+        log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+        _queue_handler = BoundedQueueHandler(
+            log_queue,
+            policy=os.getenv("LOG_QUEUE_FULL_POLICY", "drop").lower(),
+            block_timeout=float(os.getenv("LOG_QUEUE_BLOCK_TIMEOUT", "1.0"))
+        )
+        _queue_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _queue_listener.start()
+        handlers = [_queue_handler]
+    else:
+        _queue_handler = None
+    
+    for handler in handlers:
+        if _sampling_filter is not None:
+            handler.addFilter(_sampling_filter)
+        root_logger.addHandler(handler)
+    
     # Set specific loggers to appropriate levels
     logging.getLogger('werkzeug').setLevel(logging.WARNING)  # Reduce Flask request logs
     logging.getLogger('urllib3').setLevel(logging.WARNING)   # Reduce HTTP library logs
@@ -58,11 +302,16 @@ def setup_logging(app_name="user-service", log_level=None):
     
     # Log startup message
     logger = logging.getLogger(__name__)
-    logger.info(f"Logging configured - Level: {log_level}, App: {app_name}")
+    logger.info(f"Logging configured - Level: {log_level}, App: {app_name}, Async: {_queue_handler is not None}")
     logger.info(f"Environment: {'Cloud' if os.getenv('GOOGLE_CLOUD_PROJECT') else 'Local'}")
+    if _sampling_filter is not None:
+        for entry in _sampling_filter.invalid_entries:
+            logger.warning(f"Ignoring invalid LOG_SAMPLING entry: {entry}")
     
     return logger
 
+atexit.register(_stop_queue_listener)
+
 def log_environment_info():
     """Log important environment information for debugging"""
     logger = logging.getLogger(__name__)
@@ -86,8 +335,10 @@ def log_environment_info():
     logger.info("=== End Environment Configuration ===")
 
 def log_request_context(request, user_id=None, app_id=None):
-    """Helper function to log request context consistently"""
+    """Helper function to log request context consistently (returns None when INFO is disabled)"""
     logger = logging.getLogger('request_context')
+    if not logger.isEnabledFor(logging.INFO):
+        return None
     
     context = {
         'method': request.method,
@@ -95,47 +346,60 @@ def log_request_context(request, user_id=None, app_id=None):
         'remote_addr': request.remote_addr,
         'user_agent': str(request.user_agent)[:100],  # Truncate long user agents
         'user_id': user_id,
-        'app_id': app_id,
-        'timestamp': datetime.now(timezone.utc).isoformat()
+        'app_id': app_id
     }
     
-    logger.info(f"Request context: {context}")
+    if _structured:
+        logger.info("Request context", extra={"json_fields": context}, stacklevel=2)
+    else:
+        context['timestamp'] = datetime.now(timezone.utc).isoformat()
+        logger.info(f"Request context: {context}")
     return context
 
 def log_performance_metrics(operation_name, duration_ms, success=True, additional_data=None):
-    """Log performance metrics in a structured format"""
+    """Log performance metrics in a structured format (returns None when the level is disabled)"""
     logger = logging.getLogger('performance')
+    log_level = logging.INFO if success else logging.WARNING
+    if not logger.isEnabledFor(log_level):
+        return None
     
     metrics = {
         'operation': operation_name,
         'duration_ms': round(duration_ms, 2),
-        'success': success,
-        'timestamp': datetime.now(timezone.utc).isoformat()
+        'success': success
     }
     
     if additional_data:
         metrics.update(additional_data)
     
-    log_level = logging.INFO if success else logging.WARNING
-    logger.log(log_level, f"Performance: {metrics}")
+    if _structured:
+        logger.log(log_level, "Performance", extra={"json_fields": metrics}, stacklevel=2)
+    else:
+        metrics['timestamp'] = datetime.now(timezone.utc).isoformat()
+        logger.log(log_level, f"Performance: {metrics}")
     
     return metrics
 
 def log_security_event(event_type, user_id=None, app_id=None, details=None, severity='INFO'):
-    """Log security-related events"""
+    """Log security-related events (returns None when the level is disabled)"""
     logger = logging.getLogger('security')
+    log_level = getattr(logging, severity.upper(), logging.INFO)
+    if not logger.isEnabledFor(log_level):
+        return None
     
     event = {
         'event_type': event_type,
         'user_id': user_id,
         'app_id': app_id,
-        'severity': severity,
-        'timestamp': datetime.now(timezone.utc).isoformat(),
         'details': details or {}
     }
     
-    log_level = getattr(logging, severity.upper(), logging.INFO)
-    logger.log(log_level, f"Security event: {event}")
+    if _structured:
+        logger.log(log_level, "Security event", extra={"json_fields": event}, stacklevel=2)
+    else:
+        event['severity'] = severity
+        event['timestamp'] = datetime.now(timezone.utc).isoformat()
+        logger.log(log_level, f"Security event: {event}")
     
     return event
 
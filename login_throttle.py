@@ -0,0 +1,208 @@
+# login_throttle.py
+"""
+In-process throttling for POST /user/login, checked before identitytoolkit is called.
+
+Failed sign-ins are counted per email and per client IP over a sliding window
+(LOGIN_THROTTLE_WINDOW_SECONDS). Reaching the limit locks that key for
+LOGIN_THROTTLE_LOCKOUT_SECONDS; every further failure while the window still
+holds the limit doubles the lockout, up to LOGIN_THROTTLE_MAX_LOCKOUT_SECONDS.
+A success clears the email's history, never the IP's. Only credential
+rejections count: USER_DISABLED, TOO_MANY_ATTEMPTS_TRY_LATER and outages say
+nothing about whether the caller is guessing passwords.
+
+Rejections identitytoolkit has just returned are also cached for
+LOGIN_NEGATIVE_CACHE_TTL_SECONDS: EMAIL_NOT_FOUND per email, and
+INVALID_PASSWORD / INVALID_LOGIN_CREDENTIALS per email and password (keyed by
+an HMAC under a per-process key, so passwords are never stored).
+
+State is per worker process, so the effective limits scale with the number of workers.
+"""
+from collections import OrderedDict, deque
+from config import Config
+from metrics import registry as metrics
+import hashlib
+import hmac
+import math
+import secrets
+import threading
+import time
+import logging
+
+# Configure logging for login throttle
+logger = logging.getLogger(__name__)
+
+# identitytoolkit error codes cached per email, and per email + password
+EMAIL_REASONS = frozenset(["EMAIL_NOT_FOUND"])
+PASSWORD_REASONS = frozenset(["INVALID_PASSWORD", "INVALID_LOGIN_CREDENTIALS"])
+# identitytoolkit error codes that count as a failed attempt
+COUNTED_REASONS = EMAIL_REASONS | PASSWORD_REASONS | frozenset(["INVALID_EMAIL"])
+
+metrics.describe("login_throttle_rejections_total", "counter", "Login attempts rejected without calling identitytoolkit")
+metrics.describe("login_throttle_lockouts_total", "counter", "Lockouts started by scope")
+
+class LoginThrottled(Exception):
+    """Too many failed logins for this email or client IP; retry after `retry_after` seconds"""
+
+    def __init__(self, scope, retry_after):
+        super().__init__("Too many failed login attempts, try again later")
+        self.scope = scope
+        self.retry_after = retry_after
+
+    def retry_after_header(self):
+        return str(max(1, math.ceil(self.retry_after)))
+
+class _KeyState:
+    __slots__ = ("failures", "locked_until", "level")
+
+    def __init__(self):
+        self.failures = deque()
+        self.locked_until = 0.0
+        self.level = 0
+
+class LoginThrottle:
+    """Sliding-window failure counters with exponential lockouts, plus a short negative cache"""
+
+    def __init__(self, window=300, max_email_failures=5, max_ip_failures=50, lockout=30,
+                 max_lockout=900, negative_ttl=30, max_keys=100000, enabled=True):
+        self.window = window
+        self.limits = {"email": max_email_failures, "ip": max_ip_failures}
+        self.lockout = lockout
+        self.max_lockout = max_lockout
+        self.negative_ttl = negative_ttl
+        self.max_keys = max_keys
+        self.enabled = enabled
+        self._states = {"email": OrderedDict(), "ip": OrderedDict()}
+        self._negative = OrderedDict()
+        self._lock = threading.Lock()
+        self._hmac_key = secrets.token_bytes(32)
+
+    @staticmethod
+    def _email_key(email):
+        return (email or "").strip().lower()
+
+    def _password_key(self, email, password):
+        digest = hmac.new(self._hmac_key, (password or "").encode("utf-8"), hashlib.sha256).hexdigest()
+        return (email, digest)
+
+    def _remember(self, entries, key, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_keys:
+            entries.popitem(last=False)
+
+    def check(self, email, password, client_ip):
+        """
+        Raise LoginThrottled if the email or IP is locked out.
+        Returns the cached identitytoolkit error code for a recently rejected
+        attempt, or None when the attempt should go to identitytoolkit.
+        """
+        if not self.enabled:
+            return None
+        email = self._email_key(email)
+        now = time.monotonic()
+        with self._lock:
+            for scope, key in (("email", email), ("ip", client_ip)):
+                state = self._states[scope].get(key) if key else None
+                if state is not None and state.locked_until > now:
+                    metrics.inc("login_throttle_rejections_total", (("reason", f"{scope}_locked"),))
+                    raise LoginThrottled(scope, state.locked_until - now)
+
+            for key in (email, self._password_key(email, password)):
+                entry = self._negative.get(key)
+                if entry is None:
+                    continue
+                reason, expires_at = entry
+                if expires_at <= now:
+                    del self._negative[key]
+                    continue
+                metrics.inc("login_throttle_rejections_total", (("reason", "negative_cache"),))
+                return reason
+        return None
+
+    def record_failure(self, email, password, client_ip, reason, cached=False):
+        """Count a rejected sign-in; cache the rejection unless it already came from the cache"""
+        if not self.enabled or reason not in COUNTED_REASONS:
+            return
+        email = self._email_key(email)
+        now = time.monotonic()
+        with self._lock:
+            if not cached and self.negative_ttl > 0:
+                if reason in EMAIL_REASONS:
+                    self._remember(self._negative, email, (reason, now + self.negative_ttl))
+                elif reason in PASSWORD_REASONS:
+                    self._remember(self._negative, self._password_key(email, password), (reason, now + self.negative_ttl))
+
+            for scope, key in (("email", email), ("ip", client_ip)):
+                if not key:
+                    continue
+                states = self._states[scope]
+                state = states.get(key)
+                if state is None:
+                    state = _KeyState()
+                self._remember(states, key, state)
+
+                failures = state.failures
+                while failures and failures[0] <= now - self.window:
+                    failures.popleft()
+                if not failures and state.locked_until <= now:
+                    # A full quiet window forgives earlier lockouts
+                    state.level = 0
+                failures.append(now)
+
+                if len(failures) >= self.limits[scope] and state.locked_until <= now:
+                    state.level += 1
+                    duration = min(self.lockout * 2 ** (state.level - 1), self.max_lockout)
+                    state.locked_until = now + duration
+                    metrics.inc("login_throttle_lockouts_total", (("scope", scope),))
+                    logger.warning(f"Login lockout for {scope} {key} for {duration:.0f}s (level {state.level}, {len(failures)} failures in {self.window:.0f}s)")
+
+    def record_success(self, email, client_ip):
+        """Clear the email's failures; the IP keeps its count so one valid account cannot reset it"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._states["email"].pop(self._email_key(email), None)
+
+    def forget_email(self, email):
+        """Drop a cached EMAIL_NOT_FOUND, e.g. once the email has been registered"""
+        with self._lock:
+            self._negative.pop(self._email_key(email), None)
+
+    def clear(self):
+        with self._lock:
+            for states in self._states.values():
+                states.clear()
+            self._negative.clear()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "tracked_emails": len(self._states["email"]),
+                "tracked_ips": len(self._states["ip"]),
+                "locked_emails": sum(1 for state in self._states["email"].values() if state.locked_until > now),
+                "locked_ips": sum(1 for state in self._states["ip"].values() if state.locked_until > now),
+                "negative_cache_entries": len(self._negative)
+            }
+
+login_throttle = LoginThrottle(
+    window=Config.LOGIN_THROTTLE_WINDOW_SECONDS,
+    max_email_failures=Config.LOGIN_THROTTLE_MAX_EMAIL_FAILURES,
+    max_ip_failures=Config.LOGIN_THROTTLE_MAX_IP_FAILURES,
+    lockout=Config.LOGIN_THROTTLE_LOCKOUT_SECONDS,
+    max_lockout=Config.LOGIN_THROTTLE_MAX_LOCKOUT_SECONDS,
+    negative_ttl=Config.LOGIN_NEGATIVE_CACHE_TTL_SECONDS,
+    max_keys=Config.LOGIN_THROTTLE_MAX_KEYS,
+    enabled=Config.LOGIN_THROTTLE_ENABLED
+)
+
+def _login_throttle_collector():
+    stats = login_throttle.stats()
+    return [
+        ("login_throttle_locked_keys", "gauge", "Emails and client IPs currently locked out",
+            [((("scope", "email"),), stats["locked_emails"]), ((("scope", "ip"),), stats["locked_ips"])]),
+        ("login_negative_cache_entries", "gauge", "Cached identitytoolkit rejections", [((), stats["negative_cache_entries"])]),
+    ]
+
+metrics.register_collector(_login_throttle_collector)
@@ -0,0 +1,29 @@
+# main.py
+"""
+Production entry point.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+app.py's __main__ block (Flask's development server) is for local use only.
+"""
+from app import app
+from activity_writer import activity_writer
+from firebase_init import start_firebase
+from firestore_registry import close_firestore_clients
+import os
+import logging
+
+# Configure logging for the entry module
+logger = logging.getLogger(__name__)
+
+def on_worker_start():
+    """Per-worker startup after a fork from a preloaded master"""
+    # Anything the master initialized was dropped by the fork handlers; apply FIREBASE_INIT_MODE again
+    start_firebase()
+    logger.info(f"Worker {os.getpid()} ready")
+
+def on_worker_exit():
+    """Flush buffered writes and release pooled connections before a worker exits"""
+    activity_writer.shutdown()
+    close_firestore_clients()
+    logger.info(f"Worker {os.getpid()} shut down")
@@ -0,0 +1,168 @@
+# metrics.py
+from bisect import bisect_left
+import itertools
+import threading
+import weakref
+import logging
+
+# Configure logging for metrics module
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds (Prometheus convention), 1ms .. 10s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class MetricsRegistry:
+    """
+    In-process counters, gauges and fixed-bucket histograms exported in the
+    Prometheus text format.
+
+    Recording is lock-free: every thread writes to its own shard (a plain dict)
+    and the shards are only summed when /metrics is scraped. A sample costs a
+    dict lookup, a bisect and two additions. When a thread exits, its shard is
+    folded into a single retired shard, so servers that start a thread per
+    connection do not accumulate shards.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = {}
+        self._retired = {}
+        self._shard_ids = itertools.count()
+        self._shards_lock = threading.Lock()
+        self._meta = {}
+        self._bounds = {}
+        self._collectors = []
+
+    def _shard(self):
+        shard = {}
+        shard_id = next(self._shard_ids)
+        owner = _ShardOwner()
+        with self._shards_lock:
+            self._shards[shard_id] = shard
+        # The thread-local drops the owner when the thread exits, which retires the shard
+        weakref.finalize(owner, self._retire, shard_id)
+        self._local.owner = owner
+        self._local.shard = shard
+        return shard
+
+    def _retire(self, shard_id):
+        with self._shards_lock:
+            shard = self._shards.pop(shard_id, None)
+            if shard:
+                _fold(self._retired, shard)
+
+    def describe(self, name, metric_type, help_text, buckets=None):
+        self._meta[name] = (metric_type, help_text, tuple(buckets or DEFAULT_BUCKETS))
+        self._bounds[name] = self._meta[name][2]
+
+    def inc(self, name, labels=(), amount=1):
+        """Add to a counter or gauge; labels is a tuple of (key, value) pairs"""
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def dec(self, name, labels=(), amount=1):
+        self.inc(name, labels, -amount)
+
+    def observe(self, name, value, labels=()):
+        """Record one histogram sample"""
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._shard()
+        key = (name, labels)
+        slots = shard.get(key)
+        bounds = self._bounds[name]
+        if slots is None:
+            # One slot per bucket, one for +Inf, and a trailing running sum
+            slots = shard[key] = [0] * (len(bounds) + 2)
+        slots[bisect_left(bounds, value)] += 1
+        slots[-1] += value
+
+    def register_collector(self, collector):
+        """collector() returns [(name, type, help, [(labels, value), ...]), ...] at scrape time"""
+        self._collectors.append(collector)
+
+    def _merged(self):
+        merged = {}
+        with self._shards_lock:
+            shards = list(self._shards.values())
+            _fold(merged, self._retired)
+
+        for shard in shards:
+            _fold(merged, shard)
+        return merged
+
+    def shard_count(self):
+        with self._shards_lock:
+            return len(self._shards)
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format"""
+        by_name = {}
+        for (name, labels), value in self._merged().items():
+            by_name.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name in sorted(by_name):
+            metric_type, help_text, buckets = self._meta.get(name, ("untyped", "", DEFAULT_BUCKETS))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in sorted(by_name[name]):
+                if metric_type == "histogram":
+                    cumulative = 0
+                    for bound, count in zip(buckets + (float("inf"),), value[:-1]):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {value[-1]}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for collector in self._collectors:
+            try:
+                for name, metric_type, help_text, samples in collector():
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} {metric_type}")
+                    for labels, value in samples:
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+
+        return "\n".join(lines) + "\n"
+
+class _ShardOwner:
+    """Held only by a thread's local storage; its collection marks the thread as gone"""
+    __slots__ = ("__weakref__",)
+
+def _fold(target, shard):
+    """Add a shard's counters and histogram slots into target"""
+    for key, value in list(shard.items()):
+        if isinstance(value, list):
+            total = target.get(key)
+            if total is None:
+                target[key] = list(value)
+            else:
+                for i, v in enumerate(value):
+                    total[i] += v
+        else:
+            target[key] = target.get(key, 0) + value
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+registry = MetricsRegistry()
+registry.describe("http_request_duration_seconds", "histogram", "HTTP request latency by endpoint")
+registry.describe("http_requests_total", "counter", "HTTP responses by endpoint and status code")
+registry.describe("http_requests_in_flight", "gauge", "HTTP requests currently being served")
+registry.describe("operation_duration_seconds", "histogram", "Duration of log_operation-wrapped handlers")
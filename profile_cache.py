@@ -0,0 +1,149 @@
+# profile_cache.py
+from collections import OrderedDict
+from config import Config
+import copy
+import threading
+import time
+import logging
+
+# Configure logging for profile cache
+logger = logging.getLogger(__name__)
+
+# Marker stored for users known not to exist (negative caching)
+MISSING = object()
+
+class ProfileCache:
+    """In-process read-through cache of user profiles keyed by (app_id, user_id).
+
+    Entries expire after ``ttl`` seconds (``negative_ttl`` for missing users)
+    and the least recently used entry is evicted once ``max_entries`` is hit.
+
+    Readers take ``generation()`` before reading the backend and store the result
+    with ``set_if_current()``, which refuses it if the key was invalidated in
+    between, so a read racing a write cannot cache the pre-write profile.
+    """
+
+    def __init__(self, ttl=60, max_entries=10000, negative_ttl=10):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_sets = 0
+        # Generation of each key's latest invalidation, bounded like the entries;
+        # keys dropped from it are treated as invalidated at _invalidated_floor
+        self._generation = 0
+        self._invalidated = OrderedDict()
+        self._invalidated_floor = 0
+
+    def get(self, app_id, user_id):
+        """Return the cached profile, MISSING for a cached miss, or None if not cached"""
+        key = (app_id, user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            if value is MISSING:
+                self.negative_hits += 1
+                return MISSING
+
+            self.hits += 1
+        # Stored values are private deep copies that are never mutated, so copy outside the lock;
+        # a deep copy keeps callers from reaching into nested preferences shared with other readers
+        return copy.deepcopy(value)
+
+    def generation(self):
+        """Token to take before a backend read and pass to set_if_current()"""
+        with self._lock:
+            return self._generation
+
+    def _store(self, key, profile):
+        ttl = self.negative_ttl if profile is MISSING else self.ttl
+        value = profile if profile is MISSING else copy.deepcopy(profile)
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def set(self, app_id, user_id, profile):
+        """Cache a profile (or MISSING) for the configured TTL"""
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._store((app_id, user_id), profile)
+
+    def set_if_current(self, generation, app_id, user_id, profile):
+        """Cache a profile read after generation() returned `generation`, unless the user was invalidated since"""
+        if self.max_entries <= 0:
+            return False
+
+        key = (app_id, user_id)
+        with self._lock:
+            if self._invalidated.get(key, self._invalidated_floor) > generation:
+                self.stale_sets += 1
+                return False
+            self._store(key, profile)
+            return True
+
+    def invalidate(self, app_id, user_id):
+        """Drop the cached entry for a user after a write"""
+        key = (app_id, user_id)
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+            self._generation += 1
+            self._invalidated[key] = self._generation
+            self._invalidated.move_to_end(key)
+            while len(self._invalidated) > max(self.max_entries, 1):
+                _, self._invalidated_floor = self._invalidated.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._invalidated.clear()
+            self._invalidated_floor = self._generation
+
+    def stats(self):
+        """Counters used to size the cache"""
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "negative_ttl_seconds": self.negative_ttl,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "stale_sets": self.stale_sets,
+                "hit_ratio": round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0
+            }
+
+profile_cache = ProfileCache(
+    ttl=Config.PROFILE_CACHE_TTL_SECONDS,
+    max_entries=Config.PROFILE_CACHE_MAX_ENTRIES,
+    negative_ttl=Config.PROFILE_CACHE_NEGATIVE_TTL_SECONDS
+)
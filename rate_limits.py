@@ -0,0 +1,236 @@
+# rate_limits.py
+"""
+Per-tenant rate limits and concurrency caps, enforced before a request is handled.
+
+Limits are configured per app_id and optionally per endpoint (the Flask endpoint
+name, as in the /metrics labels), comma-separated:
+
+    RATE_LIMITS="readrocket-web/login=5:10,readrocket-web=50:100,*=100:200"
+    CONCURRENCY_LIMITS="aijobpro-web=20,*=50"
+
+A rate limit is "requests_per_second[:burst]" (a token bucket); a concurrency
+limit is the number of requests in flight. The most specific rule wins:
+app_id/endpoint, app_id, */endpoint, then *. Wildcard rules still give every
+tenant its own bucket; only the rule is shared.
+
+Buckets live in this process by default. RATE_LIMIT_BACKEND=redis (with
+RATE_LIMIT_REDIS_URL, needs `pip install redis`) or "package.module:factory"
+shares them between workers and instances. Concurrency caps are always per
+worker process. If the backend fails, requests are let through.
+"""
+from config import Config
+from metrics import registry as metrics
+import importlib
+import math
+import threading
+import time
+import logging
+
+# Configure logging for rate limits
+logger = logging.getLogger(__name__)
+
+WILDCARD = "*"
+
+metrics.describe("tenant_requests_total", "counter", "Requests seen by the tenant limiter by app_id and outcome")
+
+class RateLimited(Exception):
+    """A tenant limit was hit; retry after `retry_after` seconds"""
+
+    def __init__(self, app_id, endpoint, limit, retry_after):
+        super().__init__(f"Rate limit exceeded for app_id: {app_id}")
+        self.app_id = app_id
+        self.endpoint = endpoint
+        self.limit = limit
+        self.retry_after = retry_after
+
+    def retry_after_header(self):
+        return str(max(1, math.ceil(self.retry_after)))
+
+def _parse_rate(value):
+    rate, _, burst = value.partition(":")
+    rate = float(rate)
+    if rate <= 0:
+        raise ValueError("rate must be positive")
+    return rate, float(burst) if burst else max(rate, 1.0)
+
+def _parse_concurrency(value):
+    limit = int(value)
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    return limit
+
+def parse_limits(spec, parse_value):
+    """Parse "app_id[/endpoint]=value,..." into {(app_id, endpoint): parsed value}"""
+    rules = {}
+    for entry in (spec or "").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        target, sep, value = entry.partition("=")
+        app_id, _, endpoint = target.strip().partition("/")
+        try:
+            if not sep:
+                raise ValueError("expected target=value")
+            rules[(app_id.strip() or WILDCARD, endpoint.strip() or WILDCARD)] = parse_value(value.strip())
+        except ValueError as e:
+            logger.error(f"Ignoring malformed limit entry {entry!r}: {e}")
+    return rules
+
+def match_rule(rules, app_id, endpoint):
+    """Most specific rule for the request: (rule key, value), or (None, None)"""
+    for key in ((app_id, endpoint), (app_id, WILDCARD), (WILDCARD, endpoint), (WILDCARD, WILDCARD)):
+        value = rules.get(key)
+        if value is not None:
+            return key, value
+    return None, None
+
+class InMemoryRateLimitBackend:
+    """Token buckets in a dict; one set per worker process"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1.0):
+        """Take `cost` tokens; returns 0 if allowed, else the seconds until they are available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (cost - tokens) / rate
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+# Token bucket evaluated atomically in Redis, on Redis' clock
+_REDIS_TAKE = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+class RedisRateLimitBackend:
+    """Token buckets shared by every worker and instance through Redis"""
+
+    def __init__(self, url, prefix="ratelimit:"):
+        import redis  # Optional dependency, only needed for RATE_LIMIT_BACKEND=redis
+        self._client = redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.05)
+        self._take = self._client.register_script(_REDIS_TAKE)
+        self.prefix = prefix
+
+    def take(self, key, rate, burst, cost=1.0):
+        return float(self._take(keys=[self.prefix + key], args=[rate, burst, cost]))
+
+def load_backend(name):
+    if not name or name == "memory":
+        return InMemoryRateLimitBackend()
+    if name == "redis":
+        return RedisRateLimitBackend(Config.RATE_LIMIT_REDIS_URL)
+    # "package.module:factory" - any callable returning an object with take(key, rate, burst, cost)
+    module_name, _, attr = name.partition(":")
+    factory = getattr(importlib.import_module(module_name), attr or "backend")
+    return factory()
+
+class TenantLimiter:
+    """Checks a request against its tenant's rate and concurrency rules"""
+
+    def __init__(self, rate_rules=None, concurrency_rules=None, backend=None):
+        self.rate_rules = rate_rules or {}
+        self.concurrency_rules = concurrency_rules or {}
+        self.backend = backend or InMemoryRateLimitBackend()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.rate_rules or self.concurrency_rules)
+
+    def acquire(self, app_id, endpoint):
+        """
+        Admit a request or raise RateLimited. Returns a slot key to pass to
+        release() when the request finishes (None if no concurrency rule applies).
+        """
+        labels = (("app_id", app_id),)
+        rule, rate = match_rule(self.rate_rules, app_id, endpoint)
+        if rate is not None:
+            bucket = f"{app_id}/{endpoint if rule[1] != WILDCARD else WILDCARD}"
+            try:
+                wait = self.backend.take(bucket, rate[0], rate[1])
+            except Exception as e:
+                # Fail open: a broken shared store must not take the service down
+                logger.warning(f"Rate limit backend failed, admitting request: {e}")
+                wait = 0.0
+            if wait > 0:
+                metrics.inc("tenant_requests_total", labels + (("outcome", "rate_limited"),))
+                raise RateLimited(app_id, endpoint, "rate", wait)
+
+        slot = None
+        rule, limit = match_rule(self.concurrency_rules, app_id, endpoint)
+        if limit is not None:
+            slot = f"{app_id}/{endpoint if rule[1] != WILDCARD else WILDCARD}"
+            with self._lock:
+                current = self._in_flight.get(slot, 0)
+                if current >= limit:
+                    metrics.inc("tenant_requests_total", labels + (("outcome", "concurrency_limited"),))
+                    raise RateLimited(app_id, endpoint, "concurrency", Config.CONCURRENCY_LIMIT_RETRY_AFTER_SECONDS)
+                self._in_flight[slot] = current + 1
+
+        metrics.inc("tenant_requests_total", labels + (("outcome", "admitted"),))
+        return slot
+
+    def release(self, slot):
+        if slot is None:
+            return
+        with self._lock:
+            remaining = self._in_flight.get(slot, 0) - 1
+            if remaining > 0:
+                self._in_flight[slot] = remaining
+            else:
+                self._in_flight.pop(slot, None)
+
+    def in_flight(self):
+        with self._lock:
+            return dict(self._in_flight)
+
+def _build_limiter():
+    rate_rules = parse_limits(Config.RATE_LIMITS, _parse_rate)
+    concurrency_rules = parse_limits(Config.CONCURRENCY_LIMITS, _parse_concurrency)
+    backend = None
+    if rate_rules:
+        try:
+            backend = load_backend(Config.RATE_LIMIT_BACKEND)
+        except Exception as e:
+            logger.error(f"Failed to load rate limit backend {Config.RATE_LIMIT_BACKEND!r}, using in-process buckets: {e}")
+    if rate_rules or concurrency_rules:
+        logger.info(f"Tenant limits: rate {len(rate_rules)} rule(s), concurrency {len(concurrency_rules)} rule(s), backend {Config.RATE_LIMIT_BACKEND}")
+    return TenantLimiter(rate_rules, concurrency_rules, backend)
+
+tenant_limiter = _build_limiter()
+
+def _tenant_limits_collector():
+    return [
+        ("tenant_requests_in_flight", "gauge", "Requests in flight per concurrency-limited tenant/endpoint",
+            [((("slot", slot),), count) for slot, count in tenant_limiter.in_flight().items()]),
+    ]
+
+metrics.register_collector(_tenant_limits_collector)
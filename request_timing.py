@@ -0,0 +1,95 @@
+# request_timing.py
+"""
+Per-request timing of outbound dependency calls (Firebase Auth, Firestore,
+identitytoolkit), reported as a Server-Timing header and in the performance log.
+
+Usage:
+    with timed("firestore_get"):
+        user_doc = db.collection("users").document(uid).get()
+"""
+from contextvars import ContextVar
+from metrics import registry as metrics
+import time
+import logging
+
+# Configure logging for request timing
+logger = logging.getLogger(__name__)
+
+# {span name: [total seconds, call count]} for the request being served.
+# A ContextVar keeps concurrent requests apart on both threads and asyncio tasks;
+# asyncio.to_thread copies the context, so work it offloads lands in the same dict.
+_current = ContextVar("request_timings", default=None)
+
+# Set by tracing.configure_tracing so timed() calls also open a child span; None keeps timed() span-free
+_span_hook = None
+
+metrics.describe("dependency_duration_seconds", "histogram", "Duration of outbound dependency calls by span name")
+
+def start_request_timing():
+    """Begin collecting spans for a new request; returns a token for end_request_timing"""
+    return _current.set({})
+
+def end_request_timing(token=None):
+    """Stop collecting spans; the current request's timings are discarded"""
+    if token is not None:
+        _current.reset(token)
+    else:
+        _current.set(None)
+
+def set_span_hook(hook):
+    """hook(name) is called on entering timed() and returns an entered span, or None to disable"""
+    global _span_hook
+    _span_hook = hook
+
+def get_request_timings():
+    """Spans recorded so far for the current request as {name: (duration_ms, count)}"""
+    timings = _current.get()
+    if not timings:
+        return {}
+    return {name: (round(total * 1000, 2), count) for name, (total, count) in timings.items()}
+
+def record_span(name, duration):
+    """Add one call of `duration` seconds to the current request's `name` span"""
+    metrics.observe("dependency_duration_seconds", duration, (("span", name),))
+    timings = _current.get()
+    if timings is None:
+        return
+    entry = timings.get(name)
+    if entry is None:
+        timings[name] = [duration, 1]
+    else:
+        entry[0] += duration
+        entry[1] += 1
+
+class timed:
+    """Context manager that times one outbound call into the current request's spans"""
+
+    __slots__ = ("name", "start", "span")
+
+    def __init__(self, name):
+        self.name = name
+        self.span = None
+
+    def __enter__(self):
+        if _span_hook is not None:
+            self.span = _span_hook(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record_span(self.name, time.perf_counter() - self.start)
+        if self.span is not None:
+            self.span.__exit__(exc_type, exc, tb)
+        return False
+
+def server_timing_header(timings=None):
+    """Render spans as a Server-Timing header value, e.g. 'firestore_get;dur=12.3;desc="x2"'"""
+    if timings is None:
+        timings = get_request_timings()
+    parts = []
+    for name, (duration_ms, count) in timings.items():
+        if count > 1:
+            parts.append(f'{name};dur={duration_ms};desc="x{count}"')
+        else:
+            parts.append(f"{name};dur={duration_ms}")
+    return ", ".join(parts)
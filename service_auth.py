@@ -0,0 +1,53 @@
+# service_auth.py
+"""
+Shared-secret authentication for service-to-service and admin routes.
+
+Callers send one of the SERVICE_API_KEYS ("name:key,name2:key2") in the
+X-Service-Key header. Several keys can be active at once, so a key is rotated by
+adding the new one, moving callers over and then removing the old one. With no
+keys configured every protected route is refused.
+"""
+from config import Config
+import hmac
+import logging
+
+# Configure logging for service auth
+logger = logging.getLogger(__name__)
+
+HEADER = "X-Service-Key"
+
+class ServiceAuthError(Exception):
+    """Missing or unknown service key"""
+
+def _load_service_keys(raw):
+    """Parse "name:key,..." into {name: key}"""
+    keys = {}
+    for entry in (raw or "").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, sep, key = entry.partition(":")
+        if not sep or not name.strip() or not key.strip():
+            logger.error(f"Ignoring malformed SERVICE_API_KEYS entry for caller: {name.strip() or '[empty]'}")
+            continue
+        keys[name.strip()] = key.strip()
+    return keys
+
+service_keys = _load_service_keys(Config.SERVICE_API_KEYS)
+
+def authenticate_service(presented):
+    """Return the caller name for a valid service key, raising ServiceAuthError otherwise"""
+    if not service_keys:
+        raise ServiceAuthError("Service authentication is not configured")
+    if not presented:
+        raise ServiceAuthError("Service key required")
+
+    presented = presented.encode("utf-8")
+    caller = None
+    # Compare against every key so the time taken does not reveal which one matched
+    for name, key in service_keys.items():
+        if hmac.compare_digest(presented, key.encode("utf-8")):
+            caller = name
+    if caller is None:
+        raise ServiceAuthError("Invalid service key")
+    return caller
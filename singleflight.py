@@ -0,0 +1,164 @@
+# singleflight.py
+"""
+Request coalescing: concurrent calls for the same key share one execution.
+
+The first caller for a key (the leader) runs the call; callers arriving while
+it is in flight wait for its result, or its exception, instead of repeating
+the backend work. Nothing is kept once the call finishes, so this only
+collapses overlapping calls - caching is profile_cache.py's job.
+
+A flight can be joined for `timeout` seconds after it started. Waiters give up
+with SingleFlightTimeout when that runs out, and a caller arriving after it
+starts a new flight rather than queueing behind a stuck one. Flights are per
+worker process.
+"""
+from metrics import registry as metrics
+import asyncio
+import threading
+import time
+import logging
+
+# Configure logging for single-flight groups
+logger = logging.getLogger(__name__)
+
+metrics.describe("singleflight_calls_total", "counter", "Calls through a single-flight group by outcome (executed, collapsed, timed_out)")
+
+_groups = []
+
+class SingleFlightTimeout(Exception):
+    """Gave up waiting for another caller's in-flight call"""
+
+class _Call:
+    __slots__ = ("done", "result", "error", "started", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.started = time.monotonic()
+        self.waiters = 0
+
+class SingleFlight:
+    """Coalesces concurrent calls per key across threads"""
+
+    def __init__(self, name, timeout=5.0, enabled=True):
+        self.name = name
+        self.timeout = timeout
+        self.enabled = enabled
+        self._calls = {}
+        self._lock = threading.Lock()
+        _groups.append(self)
+
+    def _count(self, outcome):
+        metrics.inc("singleflight_calls_total", (("group", self.name), ("outcome", outcome)))
+
+    def do(self, key, fn):
+        """Return fn(), sharing the execution with concurrent callers for the same key"""
+        if not self.enabled:
+            return fn()
+
+        now = time.monotonic()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and now - call.started < self.timeout:
+                call.waiters += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if leader:
+            self._count("executed")
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+                call.done.set()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        if not call.done.wait(max(0.0, call.started + self.timeout - now)):
+            self._count("timed_out")
+            logger.warning(f"Timed out waiting for in-flight {self.name} call for {key}")
+            raise SingleFlightTimeout(f"Timed out waiting for in-flight {self.name} lookup")
+        self._count("collapsed")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def forget(self, *keys):
+        """Stop new callers joining these keys' flights, e.g. after a write made them stale"""
+        with self._lock:
+            for key in keys:
+                self._calls.pop(key, None)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+class AsyncSingleFlight:
+    """Coalesces concurrent awaits per key on one event loop
+
+    The call runs as its own task, so a caller that is cancelled (e.g. the
+    client disconnected) does not cancel it for everyone else.
+    """
+
+    def __init__(self, name, timeout=5.0, enabled=True):
+        self.name = name
+        self.timeout = timeout
+        self.enabled = enabled
+        self._calls = {}
+        _groups.append(self)
+
+    def _count(self, outcome):
+        metrics.inc("singleflight_calls_total", (("group", self.name), ("outcome", outcome)))
+
+    def _finished(self, key, task):
+        if self._calls.get(key, (None,))[0] is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # Retrieved here so an unawaited failure is not logged as lost
+
+    async def do(self, key, coro_fn):
+        """Return await coro_fn(), sharing the execution with concurrent callers for the same key"""
+        if not self.enabled:
+            return await coro_fn()
+
+        now = time.monotonic()
+        entry = self._calls.get(key)
+        if entry is None or now - entry[1] >= self.timeout:
+            task = asyncio.ensure_future(coro_fn())
+            self._calls[key] = (task, now)
+            task.add_done_callback(lambda done, key=key: self._finished(key, done))
+            self._count("executed")
+            return await asyncio.shield(task)
+
+        task, started = entry
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), max(0.0, started + self.timeout - now))
+        except asyncio.TimeoutError:
+            self._count("timed_out")
+            logger.warning(f"Timed out waiting for in-flight {self.name} call for {key}")
+            raise SingleFlightTimeout(f"Timed out waiting for in-flight {self.name} lookup")
+        self._count("collapsed")
+        return result
+
+    def forget(self, *keys):
+        for key in keys:
+            self._calls.pop(key, None)
+
+    def in_flight(self):
+        return len(self._calls)
+
+def _singleflight_collector():
+    return [
+        ("singleflight_in_flight", "gauge", "Calls currently in flight per single-flight group",
+            [((("group", group.name),), group.in_flight()) for group in _groups]),
+    ]
+
+metrics.register_collector(_singleflight_collector)
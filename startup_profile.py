@@ -0,0 +1,138 @@
+# startup_profile.py
+"""
+Cold-start profile for the service: import time per module and time to first response.
+
+Each run starts a fresh interpreter with -X importtime, imports the application
+module, serves one request through the test client and reports:
+    - import_ms:        wall time to import the module
+    - first_request_ms: time for the first request after import
+    - cold_start_ms:    the sum, compared against --target-ms
+    - the slowest top-level packages by self time, and the slowest single imports
+
+Usage:
+    python startup_profile.py                       # app.py, GET /health, 5 runs
+    python startup_profile.py --module asgi_app --path /health --top 15
+    python startup_profile.py --output cold_start.json --target-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Default budget for import + first /health response on a Cloud Run instance (1 vCPU)
+DEFAULT_TARGET_MS = float(os.getenv("COLD_START_TARGET_MS", "1000"))
+
+_CHILD = """
+import time, json, sys
+start = time.perf_counter()
+module = __import__({module!r})
+import_ms = (time.perf_counter() - start) * 1000
+app = getattr(module, "app")
+start = time.perf_counter()
+if {module!r} == "asgi_app":
+    from starlette.testclient import TestClient
+    with TestClient(app) as client:
+        status = client.get({path!r}).status_code
+else:
+    status = app.test_client().get({path!r}).status_code
+first_request_ms = (time.perf_counter() - start) * 1000
+sys.stdout.write("\\n__PROFILE__" + json.dumps({{"import_ms": import_ms, "first_request_ms": first_request_ms, "status": status}}) + "\\n")
+"""
+
+def parse_importtime(stderr):
+    """Parse -X importtime output into [(module, self_us, cumulative_us, depth)]"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        # Nesting is shown as two extra spaces of indentation per level
+        name = parts[2].rstrip()[1:]
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        entries.append((name.strip(), int(parts[0]), int(parts[1]), depth))
+    return entries
+
+def by_package(entries):
+    """Sum self time per top-level package, in ms"""
+    totals = {}
+    for name, self_us, _, _ in entries:
+        package = name.split(".")[0]
+        totals[package] = totals.get(package, 0) + self_us / 1000
+    return totals
+
+def run_once(module, path, cwd):
+    env = dict(os.environ)
+    env.setdefault("FIREBASE_INIT_MODE", "lazy")
+    env.setdefault("LOG_LEVEL", "WARNING")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD.format(module=module, path=path)],
+        cwd=cwd, env=env, capture_output=True, text=True, timeout=120
+    )
+    marker = [line for line in result.stdout.splitlines() if line.startswith("__PROFILE__")]
+    if result.returncode != 0 or not marker:
+        raise RuntimeError(f"Profile run failed ({result.returncode}):\n{result.stderr[-2000:]}")
+    timings = json.loads(marker[-1][len("__PROFILE__"):])
+    return timings, parse_importtime(result.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure import time per module and cold-start latency")
+    parser.add_argument("--module", default="app", help="Application module exposing `app` (app or asgi_app)")
+    parser.add_argument("--path", default="/health", help="Path requested after import")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--target-ms", type=float, default=DEFAULT_TARGET_MS)
+    parser.add_argument("--output", help="Write the results as JSON to this file for tracking")
+    args = parser.parse_args(argv)
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    packages = {}
+    slowest = {}
+    for _ in range(max(1, args.runs)):
+        timings, entries = run_once(args.module, args.path, cwd)
+        runs.append(timings)
+        for package, ms in by_package(entries).items():
+            packages.setdefault(package, []).append(ms)
+        for name, self_us, _, _ in entries:
+            slowest.setdefault(name, []).append(self_us / 1000)
+
+    import_ms = statistics.median(run["import_ms"] for run in runs)
+    first_request_ms = statistics.median(run["first_request_ms"] for run in runs)
+    cold_start_ms = import_ms + first_request_ms
+    package_ms = sorted(((statistics.median(v), k) for k, v in packages.items()), reverse=True)[:args.top]
+    module_ms = sorted(((statistics.median(v), k) for k, v in slowest.items()), reverse=True)[:args.top]
+
+    report = {
+        "module": args.module,
+        "path": args.path,
+        "runs": len(runs),
+        "import_ms": round(import_ms, 1),
+        "first_request_ms": round(first_request_ms, 1),
+        "cold_start_ms": round(cold_start_ms, 1),
+        "target_ms": args.target_ms,
+        "within_target": cold_start_ms <= args.target_ms,
+        "packages_self_ms": {name: round(ms, 1) for ms, name in package_ms},
+        "slowest_imports_self_ms": {name: round(ms, 1) for ms, name in module_ms}
+    }
+
+    print(f"{args.module}: import {report['import_ms']}ms + first {args.path} {report['first_request_ms']}ms "
+          f"= {report['cold_start_ms']}ms (target {args.target_ms:.0f}ms, median of {len(runs)})")
+    print("\nSelf time by top-level package:")
+    for ms, name in package_ms:
+        print(f"  {ms:8.1f}ms  {name}")
+    print("\nSlowest single imports (self time):")
+    for ms, name in module_ms:
+        print(f"  {ms:8.1f}ms  {name}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    return 0 if report["within_target"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import os
 import requests
 import json
 import random
@@ -97,7 +98,7 @@ def test_profile_endpoints(user_id, token):
 def test_admin_endpoint():
     print("\n4️⃣ Testing admin endpoint...")
     try:
-        response = requests.get(f"{SERVICE_URL}/admin/users/readrocket-web", timeout=30)
+        response = requests.get(f"{SERVICE_URL}/admin/users/readrocket-web", headers={"X-Service-Key": os.getenv("SERVICE_KEY", "")}, timeout=30)
         print(f"Admin Status: {response.status_code}")
         result = response.json()
         print(f"Admin Response: {result}")
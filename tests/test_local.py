@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import os
 import requests
 import json
 import random
@@ -76,7 +77,7 @@ def test_local_registration_with_fields():
 def test_admin_endpoint():
     print("\n3️⃣ Checking all users in readrocket-web app...")
     try:
-        response = requests.get("http://localhost:8080/admin/users/readrocket-web", timeout=10)
+        response = requests.get("http://localhost:8080/admin/users/readrocket-web", headers={"X-Service-Key": os.getenv("SERVICE_KEY", "")}, timeout=10)
         print(f"Status: {response.status_code}")
         result = response.json()
         print(f"Total users: {result.get('count', 0)}")
@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import os
 import requests
 import json
 import random
@@ -172,7 +173,7 @@ def test_edge_cases():
 def test_admin_endpoint():
     print(f"\n5️⃣ Testing Admin Endpoint...")
     try:
-        response = requests.get("http://localhost:8080/admin/users/readrocket-web", timeout=10)
+        response = requests.get("http://localhost:8080/admin/users/readrocket-web", headers={"X-Service-Key": os.getenv("SERVICE_KEY", "")}, timeout=10)
         print(f"Status: {response.status_code}")
         result = response.json()
         print(f"Total users in readrocket-web: {result.get('count', 0)}")
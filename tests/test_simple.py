@@ -3,6 +3,7 @@
 Simple test script for the deployed user service endpoints
 Now that Cloud Run allows unauthenticated access
 """
+import os
 import requests
 import json
 
@@ -153,7 +154,7 @@ def test_admin_endpoint():
     print("\n👑 Testing admin endpoint...")
     
     try:
-        response = requests.get(f"{SERVICE_URL}/admin/users/readrocket-web")
+        response = requests.get(f"{SERVICE_URL}/admin/users/readrocket-web", headers={"X-Service-Key": os.getenv("SERVICE_KEY", "")})
         print(f"Status: {response.status_code}")
         result = response.json()
         print(f"Response: {result}")
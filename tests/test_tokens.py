@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Unit tests for signed session tokens (tokens.py): expiry, key ids, rotation
+and the legacy-token fallback. Runs offline: python -m pytest tests/test_tokens.py
+"""
+import os
+import sys
+import time
+
+import jwt
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tokens
+from config import Config
+from tokens import TokenKeyset, issue_token, authorize_token, verify_token
+
+USER_ID = "uid-123"
+APP_ID = "readrocket-web"
+
+@pytest.fixture(autouse=True)
+def keys(monkeypatch):
+    """A known two-key keyset, with 2025-01 active; the verified-token cache starts empty"""
+    keyset = TokenKeyset({"2025-01": "current-secret", "2024-07": "previous-secret"}, "2025-01")
+    monkeypatch.setattr(tokens, "keyset", keyset)
+    tokens.verified_tokens.clear()
+    yield keyset
+    tokens.verified_tokens.clear()
+
+def sign(claims, kid, secret):
+    return jwt.encode(claims, secret, algorithm=tokens.ALGORITHM, headers={"kid": kid})
+
+def claims_for(user_id=USER_ID, app_id=APP_ID, ttl=3600):
+    now = int(time.time())
+    return {"sub": user_id, "app_id": app_id, "iss": Config.TOKEN_ISSUER, "iat": now, "exp": now + ttl}
+
+def test_issued_token_authorizes_its_user():
+    token, expires_in = issue_token(USER_ID, APP_ID)
+    assert expires_in == Config.TOKEN_TTL_SECONDS
+    assert jwt.get_unverified_header(token)["kid"] == "2025-01"
+    assert authorize_token(token, USER_ID, APP_ID) is True
+
+def test_expired_token_is_rejected():
+    token = sign(claims_for(ttl=-10), "2025-01", "current-secret")
+    with pytest.raises(Exception, match="Token expired"):
+        verify_token(token)
+
+def test_unknown_kid_is_rejected():
+    token = sign(claims_for(), "2023-01", "retired-secret")
+    with pytest.raises(Exception, match="Unknown token key id"):
+        authorize_token(token, USER_ID, APP_ID)
+
+def test_wrong_signature_is_rejected():
+    token = sign(claims_for(), "2025-01", "not-the-secret")
+    with pytest.raises(Exception, match="Invalid token"):
+        verify_token(token)
+
+@pytest.mark.parametrize("user_id, app_id", [("someone-else", APP_ID), (USER_ID, "aijobpro-web")])
+def test_token_for_another_user_or_app_is_rejected(user_id, app_id):
+    token, _ = issue_token(USER_ID, APP_ID)
+    with pytest.raises(Exception, match="does not match"):
+        authorize_token(token, user_id, app_id)
+
+def test_token_signed_under_rotated_key_still_verifies():
+    token = sign(claims_for(), "2024-07", "previous-secret")
+    assert authorize_token(token, USER_ID, APP_ID) is True
+
+def test_rotated_out_key_no_longer_verifies(monkeypatch, keys):
+    token = sign(claims_for(), "2024-07", "previous-secret")
+    monkeypatch.setattr(tokens, "keyset", TokenKeyset({"2025-01": "current-secret"}))
+    with pytest.raises(Exception, match="Unknown token key id"):
+        verify_token(token)
+
+def test_legacy_token_needs_remote_check(monkeypatch):
+    monkeypatch.setattr(Config, "ACCEPT_LEGACY_TOKENS", True)
+    monkeypatch.setattr(Config, "LEGACY_TOKENS_ACCEPT_UNTIL", "2999-01-01")
+    assert authorize_token(f"user_{USER_ID}_{APP_ID}_token", USER_ID, APP_ID) is False
+    with pytest.raises(Exception, match="does not match"):
+        authorize_token(f"user_other_{APP_ID}_token", USER_ID, APP_ID)
+
+def test_legacy_tokens_refused_when_disabled(monkeypatch):
+    monkeypatch.setattr(Config, "ACCEPT_LEGACY_TOKENS", False)
+    with pytest.raises(Exception, match="no longer accepted"):
+        authorize_token(f"user_{USER_ID}_{APP_ID}_token", USER_ID, APP_ID)
+
+@pytest.mark.parametrize("until", ["", "not-a-date", "2000-01-01T00:00:00+00:00"])
+def test_legacy_opt_in_needs_a_future_deadline(monkeypatch, until):
+    monkeypatch.setattr(Config, "ACCEPT_LEGACY_TOKENS", True)
+    monkeypatch.setattr(Config, "LEGACY_TOKENS_ACCEPT_UNTIL", until)
+    with pytest.raises(Exception, match="no longer accepted"):
+        authorize_token(f"user_{USER_ID}_{APP_ID}_token", USER_ID, APP_ID)
+
+def test_ephemeral_key_refused_on_google_cloud(monkeypatch):
+    monkeypatch.setattr(Config, "TOKEN_SIGNING_KEYS", "")
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "readrocket-a9268")
+    with pytest.raises(RuntimeError, match="TOKEN_SIGNING_KEYS"):
+        tokens._load_keyset()
+
+def test_ephemeral_key_allowed_locally(monkeypatch):
+    monkeypatch.setattr(Config, "TOKEN_SIGNING_KEYS", "")
+    monkeypatch.delenv("GOOGLE_CLOUD_PROJECT", raising=False)
+    monkeypatch.delenv("K_SERVICE", raising=False)
+    assert list(tokens._load_keyset()) == ["ephemeral"]
@@ -0,0 +1,192 @@
+# tokens.py
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import lru_cache
+from config import Config
+from metrics import registry as metrics
+import jwt
+import os
+import secrets
+import threading
+import time
+import logging
+
+# Configure logging for token module
+logger = logging.getLogger(__name__)
+
+ALGORITHM = "HS256"
+LEGACY_TOKEN_PREFIX = "user_"
+
+metrics.describe("legacy_tokens_total", "counter", "Legacy user_<uid>_<app_id>_token credentials by outcome")
+
+@lru_cache(maxsize=4)
+def _legacy_deadline(raw):
+    """Parse LEGACY_TOKENS_ACCEPT_UNTIL; None (legacy tokens refused) when missing or malformed"""
+    try:
+        deadline = datetime.fromisoformat(raw.strip())
+    except ValueError:
+        logger.error(f"ACCEPT_LEGACY_TOKENS is set but LEGACY_TOKENS_ACCEPT_UNTIL is not an ISO date: {raw!r}; refusing legacy tokens")
+        return None
+    if deadline.tzinfo is None:
+        deadline = deadline.replace(tzinfo=timezone.utc)
+    return deadline
+
+def legacy_tokens_accepted():
+    """True only while the explicit, time-boxed legacy-token opt-in is active"""
+    if not Config.ACCEPT_LEGACY_TOKENS:
+        return False
+    deadline = _legacy_deadline(Config.LEGACY_TOKENS_ACCEPT_UNTIL)
+    return deadline is not None and datetime.now(timezone.utc) < deadline
+
+def _load_keyset():
+    """Parse TOKEN_SIGNING_KEYS ("kid1:secret1,kid2:secret2") into a dict"""
+    keyset = {}
+    for entry in Config.TOKEN_SIGNING_KEYS.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        kid, sep, secret = entry.partition(":")
+        if not sep or not kid.strip() or not secret.strip():
+            logger.error(f"Ignoring malformed TOKEN_SIGNING_KEYS entry for kid: {kid.strip() or '[empty]'}")
+            continue
+        keyset[kid.strip()] = secret.strip()
+
+    if not keyset:
+        # Tokens from an ephemeral key only verify within this process tree, so on GCP
+        # (several instances, or workers forked without preload) they would fail elsewhere
+        if os.getenv("GOOGLE_CLOUD_PROJECT") or os.getenv("K_SERVICE"):
+            raise RuntimeError("TOKEN_SIGNING_KEYS must be set when running on Google Cloud")
+        logger.warning("TOKEN_SIGNING_KEYS not set - using an ephemeral signing key (development only)")
+        keyset["ephemeral"] = secrets.token_urlsafe(32)
+    return keyset
+
+class TokenKeyset:
+    """Signing keys indexed by kid; new tokens use the active kid, all kids verify"""
+
+    def __init__(self, keys, active_kid=None):
+        self.keys = dict(keys)
+        self.active_kid = active_kid or next(iter(self.keys))
+        if self.active_kid not in self.keys:
+            raise Exception(f"Active token kid not found in keyset: {self.active_kid}")
+
+    def signing_key(self):
+        return self.active_kid, self.keys[self.active_kid]
+
+    def verification_key(self, kid):
+        key = self.keys.get(kid)
+        if key is None:
+            raise Exception(f"Unknown token key id: {kid}")
+        return key
+
+class VerifiedTokenCache:
+    """Bounded LRU of already-verified tokens, each kept until its own expiry"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            claims, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return claims
+
+    def set(self, token, claims):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[token] = (claims, claims["exp"])
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+keyset = TokenKeyset(_load_keyset(), Config.TOKEN_ACTIVE_KID or None)
+verified_tokens = VerifiedTokenCache(Config.TOKEN_CACHE_MAX_ENTRIES)
+
+def issue_token(uid, app_id, ttl=None):
+    """Issue a signed token carrying uid, app_id and expiry"""
+    ttl = int(ttl or Config.TOKEN_TTL_SECONDS)
+    now = int(time.time())
+    kid, key = keyset.signing_key()
+    claims = {
+        "sub": uid,
+        "app_id": app_id,
+        "iss": Config.TOKEN_ISSUER,
+        "iat": now,
+        "exp": now + ttl
+    }
+    token = jwt.encode(claims, key, algorithm=ALGORITHM, headers={"kid": kid})
+    return token, ttl
+
+def is_legacy_token(token):
+    """True for the old user_<uid>_<app_id>_token format"""
+    return token.startswith(LEGACY_TOKEN_PREFIX) and token.endswith("_token")
+
+def verify_token(token):
+    """Verify a token locally and return its claims, raising on any failure"""
+    claims = verified_tokens.get(token)
+    if claims is not None:
+        return claims
+
+    try:
+        kid = jwt.get_unverified_header(token).get("kid")
+        claims = jwt.decode(
+            token,
+            keyset.verification_key(kid),
+            algorithms=[ALGORITHM],
+            issuer=Config.TOKEN_ISSUER,
+            options={"require": ["sub", "exp", "iat"]}
+        )
+    except jwt.ExpiredSignatureError:
+        raise Exception("Token expired")
+    except jwt.InvalidTokenError as e:
+        raise Exception(f"Invalid token: {str(e)}")
+
+    if not claims.get("app_id"):
+        raise Exception("Invalid token: missing app_id")
+
+    verified_tokens.set(token, claims)
+    return claims
+
+def authorize_token(token, user_id, app_id):
+    """Check that a token was issued to user_id for app_id.
+
+    Returns True when the token was verified locally, False when it is a
+    legacy token that the caller must still check against Firebase Auth.
+    """
+    if is_legacy_token(token):
+        if not legacy_tokens_accepted():
+            metrics.inc("legacy_tokens_total", (("outcome", "refused"),))
+            raise Exception("Legacy tokens are no longer accepted")
+        if token != f"{LEGACY_TOKEN_PREFIX}{user_id}_{app_id}_token":
+            metrics.inc("legacy_tokens_total", (("outcome", "mismatch"),))
+            raise Exception("Token does not match user or application")
+        # Anyone who knows a uid can build this token, so every acceptance is visible
+        metrics.inc("legacy_tokens_total", (("outcome", "accepted"),))
+        logger.warning(f"Accepted legacy token for user_id: {user_id}, app_id: {app_id} (allowed until {Config.LEGACY_TOKENS_ACCEPT_UNTIL})")
+        return False
+
+    claims = verify_token(token)
+    if claims["sub"] != user_id or claims["app_id"] != app_id:
+        raise Exception("Token does not match user or application")
+    return True
+
+def peek_user_id(token):
+    """Best-effort user id from a token for request logging (never raises)"""
+    try:
+        if is_legacy_token(token):
+            return token.split("_")[1]
+        return verify_token(token)["sub"]
+    except Exception:
+        return None
@@ -0,0 +1,337 @@
+# tracing.py
+"""
+Optional request tracing with W3C Trace Context propagation.
+
+Each sampled request gets a root span; Firebase Auth, Firestore and
+identitytoolkit calls (everything wrapped in request_timing.timed) and
+log_operation-wrapped handlers become child spans. Finished traces are handed
+to a pluggable exporter. Span dicts follow the OTLP JSON field names
+(traceId, spanId, parentSpanId, startTimeUnixNano, ...) so they can be
+replayed into any OpenTelemetry collector.
+
+With TRACING_ENABLED unset nothing is installed: timed() skips its hook and
+start_request_span/start_span return a shared no-op span.
+"""
+from contextvars import ContextVar
+from config import Config
+import request_timing
+import importlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import logging
+
+# Configure logging for tracing module
+logger = logging.getLogger(__name__)
+
+_TRACEPARENT_RE = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_INVALID_TRACE_ID = "0" * 32
+_INVALID_SPAN_ID = "0" * 16
+_SAMPLED_FLAG = 0x01
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current_span = ContextVar("current_span", default=None)
+
+enabled = False
+_exporter = None
+_sample_ratio = 1.0
+_random = random.Random()
+
+def parse_traceparent(header):
+    """Return (trace_id, parent_span_id, sampled) from a traceparent header, or None if invalid"""
+    if not header:
+        return None
+    match = _TRACEPARENT_RE.match(header.strip().lower())
+    if not match:
+        return None
+    version, trace_id, span_id, flags = match.groups()
+    if version == "ff" or trace_id == _INVALID_TRACE_ID or span_id == _INVALID_SPAN_ID:
+        return None
+    return trace_id, span_id, bool(int(flags, 16) & _SAMPLED_FLAG)
+
+def _new_trace_id():
+    return f"{_random.getrandbits(128):032x}"
+
+def _new_span_id():
+    return f"{_random.getrandbits(64):016x}"
+
+def _should_sample(trace_id):
+    # Decided from the trace id, so every service sampling at the same ratio keeps the same traces
+    if _sample_ratio >= 1.0:
+        return True
+    if _sample_ratio <= 0.0:
+        return False
+    return int(trace_id[16:], 16) < int(_sample_ratio * (1 << 64))
+
+class Span:
+    """One timed operation within a trace"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "kind", "start_ns", "end_ns",
+                 "attributes", "status", "status_message", "_trace", "_token")
+
+    def __init__(self, name, trace_id, parent_span_id=None, kind=SPAN_KIND_INTERNAL, attributes=None, trace=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_span_id()
+        self.parent_span_id = parent_span_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes) if attributes else {}
+        self.status = STATUS_UNSET
+        self.status_message = None
+        # Finished spans of the whole trace, exported together when the root ends
+        self._trace = trace if trace is not None else []
+        self._token = None
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def update_name(self, name):
+        self.name = name
+
+    def set_status(self, status, message=None):
+        self.status = status
+        self.status_message = message
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.record_exception(exc)
+        self.end()
+        return False
+
+    def record_exception(self, exc):
+        self.set_status(STATUS_ERROR, str(exc))
+        self.attributes["exception.type"] = type(exc).__name__
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # Ended from another context (e.g. a teardown hook); just clear it there
+                _current_span.set(None)
+            self._token = None
+        self._trace.append(self)
+        if self.parent_span_id is None or self.kind == SPAN_KIND_SERVER:
+            _export(self._trace)
+
+    def to_dict(self):
+        """OTLP/JSON-shaped representation of the span"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": self.attributes,
+            "status": {"code": self.status}
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+class _NoopSpan:
+    """Returned whenever there is nothing to record; every method is a no-op"""
+
+    __slots__ = ()
+    traceparent = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def update_name(self, name):
+        pass
+
+    def set_status(self, status, message=None):
+        pass
+
+    def record_exception(self, exc):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NOOP_SPAN = _NoopSpan()
+
+def current_span():
+    return _current_span.get()
+
+def current_traceparent():
+    """traceparent header value for outbound calls made from the current span, or None"""
+    if not enabled:
+        return None
+    span = _current_span.get()
+    return span.traceparent if span is not None else None
+
+def start_request_span(name, traceparent=None, attributes=None):
+    """Open the root (server) span for an incoming request, honouring a W3C traceparent.
+
+    The span is made current; close it with span.end() once the response is done.
+    """
+    if not enabled:
+        return NOOP_SPAN
+
+    parent = parse_traceparent(traceparent)
+    if parent is not None:
+        trace_id, parent_span_id, sampled = parent
+    else:
+        trace_id, parent_span_id = _new_trace_id(), None
+        sampled = _should_sample(trace_id)
+
+    if not sampled:
+        return NOOP_SPAN
+
+    span = Span(name, trace_id, parent_span_id, SPAN_KIND_SERVER, attributes)
+    span._token = _current_span.set(span)
+    return span
+
+def start_span(name, kind=SPAN_KIND_INTERNAL, attributes=None):
+    """Child span of the current span; a no-op outside a sampled trace"""
+    if not enabled:
+        return NOOP_SPAN
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(name, parent.trace_id, parent.span_id, kind, attributes, parent._trace)
+
+def _dependency_span(name):
+    # request_timing hook: every timed() outbound call becomes a client span
+    span = start_span(name, SPAN_KIND_CLIENT)
+    return span.__enter__()
+
+def _export(spans):
+    exporter = _exporter
+    if exporter is None:
+        return
+    try:
+        exporter.export([span.to_dict() for span in spans])
+    except Exception as e:
+        logger.warning(f"Trace export failed: {e}")
+
+class SpanExporter:
+    """Base class for exporters; export() receives every finished span of one trace"""
+
+    def export(self, spans):
+        raise NotImplementedError
+
+    def shutdown(self):
+        pass
+
+class InMemorySpanExporter(SpanExporter):
+    """Keeps finished spans in memory, for tests"""
+
+    def __init__(self):
+        self._spans = []
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        with self._lock:
+            self._spans.extend(spans)
+
+    def get_finished_spans(self):
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+class FileSpanExporter(SpanExporter):
+    """Appends one JSON line per trace ({"spans": [...]}) to a local file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans):
+        line = json.dumps({"spans": spans}, default=str, separators=(",", ":")) + "\n"
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line)
+
+class LoggingSpanExporter(SpanExporter):
+    """Writes each trace to the 'tracing' logger at DEBUG level"""
+
+    def export(self, spans):
+        trace_logger = logging.getLogger("tracing")
+        if trace_logger.isEnabledFor(logging.DEBUG):
+            trace_logger.debug(json.dumps({"spans": spans}, default=str))
+
+def _load_exporter(name):
+    if name == "memory":
+        return InMemorySpanExporter()
+    if name == "file":
+        return FileSpanExporter(Config.TRACE_EXPORT_PATH)
+    if name == "log":
+        return LoggingSpanExporter()
+    # "package.module:factory" - any callable returning an object with export(spans)
+    module_name, _, attr = name.partition(":")
+    factory = getattr(importlib.import_module(module_name), attr or "exporter")
+    return factory()
+
+def configure_tracing(enable=None, sample_ratio=None, exporter=None):
+    """Install or remove tracing. Defaults come from TRACING_ENABLED, TRACE_SAMPLE_RATIO and TRACE_EXPORTER.
+
+    `exporter` may be an exporter instance or one of "memory", "file", "log" or "module:factory".
+    Returns the active exporter (None when tracing is disabled).
+    """
+    global enabled, _exporter, _sample_ratio
+
+    enable = Config.TRACING_ENABLED if enable is None else enable
+    if not enable:
+        if _exporter is not None:
+            _exporter.shutdown()
+        enabled = False
+        _exporter = None
+        request_timing.set_span_hook(None)
+        return None
+
+    _sample_ratio = min(max(Config.TRACE_SAMPLE_RATIO if sample_ratio is None else sample_ratio, 0.0), 1.0)
+    exporter = Config.TRACE_EXPORTER if exporter is None else exporter
+    _exporter = _load_exporter(exporter) if isinstance(exporter, str) else exporter
+    enabled = True
+    request_timing.set_span_hook(_dependency_span)
+
+    logger.info(f"Tracing enabled (sample ratio {_sample_ratio}, exporter {type(_exporter).__name__})")
+    return _exporter
+
+def _reseed_after_fork():
+    # Forked workers must not generate the same trace/span ids as their siblings
+    _random.seed()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reseed_after_fork)